@@ -31,6 +31,10 @@ def start_channel(channel_name: str):
                         "wechatcom_service", "xbot", "web", const.FEISHU, const.DINGTALK]:
         PluginManager().load_plugins()
 
+    if conf().get("tts_cache_warmup"):
+        from bridge.bridge import Bridge
+        threading.Thread(target=Bridge().warm_up_text_to_voice, args=(conf().get("tts_cache_warmup"),), daemon=True).start()
+
     if conf().get("use_linkai"):
         try:
             from common import linkai_client
@@ -1,12 +1,13 @@
 # encoding:utf-8
 
-import requests
+from common import http_client
 import json
 from common import const
 from bot.bot import Bot
 from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common.credential_cache import credential_key, get_credential_cache
 from common.log import logger
 from config import conf
 from bot.baidu.baidu_wenxin_session import BaiduWenxinSession
@@ -78,7 +79,7 @@ class BaiduWenxinBot(Bot):
         try:
             logger.info("[BAIDU] model={}".format(session.model))
             access_token = self.get_access_token()
-            if access_token == 'None':
+            if not access_token:
                 logger.warn("[BAIDU] access token 获取失败")
                 return {
                     "total_tokens": 0,
@@ -90,9 +91,11 @@ class BaiduWenxinBot(Bot):
                 'Content-Type': 'application/json'
             }
             payload = {'messages': session.messages, 'system': self.prompt} if self.prompt_enabled else {'messages': session.messages}
-            response = requests.request("POST", url, headers=headers, data=json.dumps(payload))
+            response = http_client.request("POST", url, headers=headers, data=json.dumps(payload))
             response_text = json.loads(response.text)
             logger.info(f"[BAIDU] response text={response_text}")
+            if response_text.get("error_code") in (110, 111):  # access token无效或已过期，下次重新获取
+                get_credential_cache().invalidate(self._credential_key(), access_token)
             res_content = response_text["result"]
             total_tokens = response_text["usage"]["total_tokens"]
             completion_tokens = response_text["usage"]["completion_tokens"]
@@ -112,9 +115,22 @@ class BaiduWenxinBot(Bot):
 
     def get_access_token(self):
         """
-        使用 AK，SK 生成鉴权签名（Access Token）
+        使用 AK，SK 生成鉴权签名（Access Token），有效期内从凭证缓存中读取
         :return: access_token，或是None(如果错误)
         """
+        try:
+            return get_credential_cache().get(self._credential_key(), self._fetch_access_token)
+        except Exception as e:
+            logger.warn("[BAIDU] fetch access token failed: {}".format(e))
+            return None
+
+    def _credential_key(self):
+        return credential_key("baidu_wenxin", BAIDU_API_KEY, BAIDU_SECRET_KEY)
+
+    def _fetch_access_token(self):
         url = "https://aip.baidubce.com/oauth/2.0/token"
         params = {"grant_type": "client_credentials", "client_id": BAIDU_API_KEY, "client_secret": BAIDU_SECRET_KEY}
-        return str(requests.post(url, params=params).json().get("access_token"))
+        res = http_client.post(url, params=params, timeout=30).json()
+        if not res.get("access_token"):
+            raise Exception(res.get("error_description") or res)
+        return res["access_token"], res.get("expires_in", 2592000)
@@ -2,7 +2,7 @@
 import io
 import os
 from os.path import isfile
-import requests
+from common import http_client
 from urllib.parse import urlparse, unquote
 from bot.bot import Bot
 from bot.bytedance.coze_client import CozeClient
@@ -188,7 +188,7 @@ class ByteDanceCozeBot(Bot):
 
     def _download_image(self, url):
         try:
-            pic_res = requests.get(url, stream=True)
+            pic_res = http_client.get(url, stream=True)
             pic_res.raise_for_status()
             image_storage = io.BytesIO()
             size = 0
@@ -204,7 +204,7 @@ class ByteDanceCozeBot(Bot):
 
     def _download_file(self, url):
         try:
-            response = requests.get(url)
+            response = http_client.get(url)
             response.raise_for_status()
             parsed_url = urlparse(url)
             logger.debug(f"Downloading file from {url}")
@@ -6,6 +6,7 @@ import time
 import openai
 import openai.error
 import requests
+from common import http_client
 from common import const
 from bot.bot import Bot
 from bot.chatgpt.chat_gpt_session import ChatGPTSession
@@ -15,7 +16,7 @@ from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
-from common.token_bucket import TokenBucket
+from common.token_bucket import TokenBucket, TokenBuckets
 from common import memory, utils, const
 from config import conf, load_config
 from bot.baidu.baidu_wenxin_session import BaiduWenxinSession
@@ -33,6 +34,10 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
             openai.proxy = proxy
         if conf().get("rate_limit_chatgpt"):
             self.tb4chatgpt = TokenBucket(conf().get("rate_limit_chatgpt", 20))
+        # 每个会话单独限流，超过时直接回复，不占用全局的令牌
+        self.session_limiter = None
+        if conf().get("rate_limit_chatgpt_per_session"):
+            self.session_limiter = TokenBuckets(conf().get("rate_limit_chatgpt_per_session"))
         conf_model = conf().get("model") or "gpt-3.5-turbo"
         self.sessions = SessionManager(ChatGPTSession, model=conf().get("model") or "gpt-3.5-turbo")
         # o1相关模型不支持system prompt，暂时用文心模型的session
@@ -125,6 +130,9 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
         :param retry_count: retry count
         :return: {}
         """
+        if retry_count == 0 and self.session_limiter and not self.session_limiter.try_acquire(session_id):
+            logger.warn("[CHATGPT] session {} rate limit exceeded".format(session_id))
+            return {"completion_tokens": 0, "content": "提问太快啦，请休息一下再问我吧"}
         try:
             if conf().get("rate_limit_chatgpt") and not self.tb4chatgpt.get_token():
                 raise openai.error.RateLimitError("RateLimitError: rate limit exceeded")
@@ -239,13 +247,13 @@ class AzureChatGPTBot(ChatGPTBot):
             headers = {"api-key": api_key, "Content-Type": "application/json"}
             try:
                 body = {"prompt": query, "size": conf().get("image_create_size", "256x256"),"n": 1}
-                submission = requests.post(url, headers=headers, json=body)
+                submission = http_client.post(url, headers=headers, json=body)
                 operation_location = submission.headers['operation-location']
                 status = ""
                 while (status != "succeeded"):
                     if retry_count > 3:
                         return False, "图片生成失败"
-                    response = requests.get(operation_location, headers=headers)
+                    response = http_client.get(operation_location, headers=headers)
                     status = response.json()['status']
                     retry_count += 1
                 image_url = response.json()['result']['data'][0]['url']
@@ -264,7 +272,7 @@ class AzureChatGPTBot(ChatGPTBot):
             headers = {"api-key": api_key, "Content-Type": "application/json"}
             try:
                 body = {"prompt": query, "size": conf().get("image_create_size", "1024x1024"), "quality": conf().get("dalle3_image_quality", "standard")}
-                response = requests.post(url, headers=headers, json=body)
+                response = http_client.post(url, headers=headers, json=body)
                 response.raise_for_status()  # 检查请求是否成功
                 data = response.json()
 
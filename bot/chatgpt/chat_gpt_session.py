@@ -1,3 +1,5 @@
+import functools
+
 from bot.session_manager import Session
 from common.log import logger
 from common import const
@@ -16,26 +18,61 @@ class ChatGPTSession(Session):
     def __init__(self, session_id, system_prompt=None, model="gpt-3.5-turbo"):
         super().__init__(session_id, system_prompt)
         self.model = model
+        self._token_cache = {}  # id(message) -> (message, tokens)，每条消息的token数只计算一次
         self.reset()
 
+    def _message_tokens(self, message):
+        item = self._token_cache.get(id(message))
+        if item is None or item[0] is not message:
+            item = (message, num_tokens_from_message(message, self.model))
+            self._token_cache[id(message)] = item
+        return item[1]
+
+    def _prune_token_cache(self):
+        if len(self._token_cache) > 2 * len(self.messages):
+            self._token_cache = {id(m): self._token_cache[id(m)] for m in self.messages if id(m) in self._token_cache}
+
     def discard_exceeding(self, max_tokens, cur_tokens=None):
         precise = True
         try:
-            cur_tokens = self.calc_tokens()
+            counts = [self._message_tokens(m) for m in self.messages]
+            cur_tokens = sum(counts) + num_tokens_reply_primed(self.model)
         except Exception as e:
             precise = False
             if cur_tokens is None:
                 raise e
             logger.debug("Exception when counting tokens precisely for query: {}".format(e))
+        if not precise:
+            return self._discard_exceeding_imprecise(max_tokens, cur_tokens)
+        # 一次遍历算出需要丢弃的消息数，每丢弃一条只需减去它的token数
+        drop = 0
+        while cur_tokens > max_tokens:
+            remaining = len(self.messages) - drop
+            if remaining > 2:
+                cur_tokens -= counts[1 + drop]
+                drop += 1
+            elif remaining == 2 and self.messages[1 + drop]["role"] == "assistant":
+                cur_tokens -= counts[1 + drop]
+                drop += 1
+                break
+            elif remaining == 2 and self.messages[1 + drop]["role"] == "user":
+                logger.warn("user message exceed max_tokens. total_tokens={}".format(cur_tokens))
+                break
+            else:
+                logger.debug("max_tokens={}, total_tokens={}, len(messages)={}".format(max_tokens, cur_tokens, remaining))
+                break
+        if drop:
+            del self.messages[1:1 + drop]
+        self._prune_token_cache()
+        return cur_tokens
+
+    def _discard_exceeding_imprecise(self, max_tokens, cur_tokens):
         while cur_tokens > max_tokens:
             if len(self.messages) > 2:
                 self.messages.pop(1)
             elif len(self.messages) == 2 and self.messages[1]["role"] == "assistant":
                 self.messages.pop(1)
-                if precise:
-                    cur_tokens = self.calc_tokens()
-                else:
-                    cur_tokens = cur_tokens - max_tokens
+                cur_tokens = cur_tokens - max_tokens
                 break
             elif len(self.messages) == 2 and self.messages[1]["role"] == "user":
                 logger.warn("user message exceed max_tokens. total_tokens={}".format(cur_tokens))
@@ -43,59 +80,77 @@ class ChatGPTSession(Session):
             else:
                 logger.debug("max_tokens={}, total_tokens={}, len(messages)={}".format(max_tokens, cur_tokens, len(self.messages)))
                 break
-            if precise:
-                cur_tokens = self.calc_tokens()
-            else:
-                cur_tokens = cur_tokens - max_tokens
+            cur_tokens = cur_tokens - max_tokens
         return cur_tokens
 
     def calc_tokens(self):
-        return num_tokens_from_messages(self.messages, self.model)
+        tokens = sum(self._message_tokens(m) for m in self.messages) + num_tokens_reply_primed(self.model)
+        self._prune_token_cache()
+        return tokens
 
 
-# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-def num_tokens_from_messages(messages, model):
-    """Returns the number of tokens used by a list of messages."""
+_GPT4_TOKEN_MODELS = {
+    "gpt-4", "gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
+    "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", "gpt-4-turbo-preview",
+    "gpt-4-1106-preview", const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO_01_25,
+    const.GPT_4o, const.GPT_4O_0806, const.GPT_4o_MINI, const.LINKAI_4o, const.LINKAI_4_TURBO,
+}
 
+
+def _counting_model(model):
+    """计算token时实际参照的模型，None表示按字符数计算"""
     if model in ["wenxin", "xunfei"] or model.startswith(const.GEMINI):
-        return num_tokens_by_character(messages)
+        return None
+    if model in _GPT4_TOKEN_MODELS:
+        return "gpt-4"
+    # gpt-3.5-turbo、claude-3、moonshot 以及其他未知模型均按 gpt-3.5-turbo 计算
+    return "gpt-3.5-turbo"
+
 
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """每个模型的tiktoken编码只加载一次"""
     import tiktoken
 
-    if model in ["gpt-3.5-turbo-0301", "gpt-35-turbo", "gpt-3.5-turbo-1106", "moonshot", const.LINKAI_35]:
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    elif model in ["gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
-                   "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", "gpt-4-turbo-preview",
-                   "gpt-4-1106-preview", const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO_01_25,
-                   const.GPT_4o, const.GPT_4O_0806, const.GPT_4o_MINI, const.LINKAI_4o, const.LINKAI_4_TURBO]:
-        return num_tokens_from_messages(messages, model="gpt-4")
-    elif model.startswith("claude-3"):
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
     try:
-        encoding = tiktoken.encoding_for_model(model)
+        return tiktoken.encoding_for_model(model)
     except KeyError:
         logger.debug("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model == "gpt-3.5-turbo":
+        return tiktoken.get_encoding("cl100k_base")
+
+
+# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+def num_tokens_from_message(message, model):
+    """Returns the number of tokens used by a single message, excluding the reply priming."""
+    counting_model = _counting_model(model)
+    if counting_model is None:
+        return len(message["content"])
+    if counting_model == "gpt-3.5-turbo":
         tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
         tokens_per_name = -1  # if there's a name, the role is omitted
-    elif model == "gpt-4":
+    else:
         tokens_per_message = 3
         tokens_per_name = 1
-    else:
-        logger.debug(f"num_tokens_from_messages() is not implemented for model {model}. Returning num tokens assuming gpt-3.5-turbo.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+    encoding = get_encoding(counting_model)
+    num_tokens = tokens_per_message
+    for key, value in message.items():
+        num_tokens += len(encoding.encode(value))
+        if key == "name":
+            num_tokens += tokens_per_name
     return num_tokens
 
 
+def num_tokens_reply_primed(model):
+    if _counting_model(model) is None:
+        return 0
+    return 3  # every reply is primed with <|start|>assistant<|message|>
+
+
+def num_tokens_from_messages(messages, model):
+    """Returns the number of tokens used by a list of messages."""
+    return sum(num_tokens_from_message(message, model) for message in messages) + num_tokens_reply_primed(model)
+
+
 def num_tokens_by_character(messages):
     """Returns the number of tokens used by a list of messages."""
     tokens = 0
@@ -4,9 +4,11 @@ import os
 import mimetypes
 import threading
 import json
+import re
 
 
 import requests
+from common import http_client
 from urllib.parse import urlparse, unquote
 
 from bot.bot import Bot
@@ -26,6 +28,10 @@ class DifyBot(Bot):
     def __init__(self):
         super().__init__()
         self.sessions = DifySessionManager(DifySession, model=conf().get("model", const.DIFY))
+        # Dify返回的文件和图片与API同一主机，下载遇到网关错误时重试(POST请求不重试)
+        api_base = urlparse(conf().get("dify_api_base", "https://api.dify.ai/v1"))
+        http_client.set_endpoint_policy(f"{api_base.scheme}://{api_base.netloc}/", retries=2, backoff=0.5,
+                                        retry_on_status=http_client.GATEWAY_ERRORS)
 
     def reply(self, query, context: Context=None):
         # acquire reply content
@@ -217,7 +223,7 @@ class DifyBot(Bot):
 
     def _download_file(self, url):
         try:
-            response = requests.get(url)
+            response = http_client.get(url)
             response.raise_for_status()
             parsed_url = urlparse(url)
             logger.debug(f"Downloading file from {url}")
@@ -235,7 +241,7 @@ class DifyBot(Bot):
 
     def _download_image(self, url):
         try:
-            pic_res = requests.get(url, stream=True)
+            pic_res = http_client.get(url, stream=True)
             pic_res.raise_for_status()
             image_storage = io.BytesIO()
             size = 0
@@ -275,49 +281,73 @@ class DifyBot(Bot):
         # data: {"event": "agent_thought", "id": "8dcf3648-fbad-407a-85dd-73a6f43aeb9f", "task_id": "9cf1ddd7-f94b-459b-b942-b77b26c59e9b", "message_id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "position": 1, "thought": "", "observation": "", "tool": "dalle3", "tool_input": "{\"dalle3\": {\"prompt\": \"cute Japanese anime girl with white hair, blue eyes, bunny girl suit\"}}", "created_at": 1705639511, "message_files": [], "conversation_id": "c216c595-2d89-438c-b33c-aae5ddddd142"}
         # data: {"event": "agent_message", "id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "task_id": "9cf1ddd7-f94b-459b-b942-b77b26c59e9b", "message_id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "answer": "I have created an image of a cute Japanese", "created_at": 1705639511, "conversation_id": "c216c595-2d89-438c-b33c-aae5ddddd142"}
         # data: {"event": "message_end", "task_id": "9cf1ddd7-f94b-459b-b942-b77b26c59e9b", "id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "message_id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "conversation_id": "c216c595-2d89-438c-b33c-aae5ddddd142", "metadata": {"usage": {"prompt_tokens": 305, "prompt_unit_price": "0.001", "prompt_price_unit": "0.001", "prompt_price": "0.0003050", "completion_tokens": 97, "completion_unit_price": "0.002", "completion_price_unit": "0.001", "completion_price": "0.0001940", "total_tokens": 184, "total_price": "0.0002290", "currency": "USD", "latency": 1.771092874929309}}}
-        msgs, conversation_id = self._handle_sse_response(response)
+        # 边接收边发送，除最后一条外的消息在收到下一条时就发出，最后一条作为返回值
+        # 收到第一个事件时就设置dify conversation_id，依靠dify管理上下文，中途出错或同一用户的下一条消息也能沿用
+        state = {"session": session}
+        split = self._get_dify_conf(context, "dify_stream_split", "")
+        reply = self._send_stream_messages(self._iter_sse_messages(response, state, split), context)
+        if reply is None:
+            return None, "No messages received from agent."
+        if not state.get("conversation_id"):
+            raise Exception("conversation_id not found")
+        return reply, None
+
+    def _send_stream_messages(self, messages, context: Context):
+        """
+        逐条发送流式合并后的消息，最后一条转换为Reply返回，没有消息时返回None
+        """
         channel = context.get("channel")
         # TODO: 适配除微信以外的其他channel
         is_group = context.get("isgroup", False)
-        for msg in msgs[:-1]:
-            if msg['type'] == 'agent_message':
-                if is_group:
-                    at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
-                    msg['content'] = at_prefix + msg['content']
-                reply = Reply(ReplyType.TEXT, msg['content'])
-                channel.send(reply, context)
-            elif msg['type'] == 'message_file':
-                url = self._fill_file_base_url(msg['content']['url'])
-                reply = Reply(ReplyType.IMAGE_URL, url)
-                thread = threading.Thread(target=channel.send, args=(reply, context))
-                thread.start()
-        # 检查msgs是否为空
-        if not msgs:
-            return None, "No messages received from agent."
-        final_msg = msgs[-1]
-        reply = None
-        if final_msg['type'] == 'agent_message':
-            reply = Reply(ReplyType.TEXT, final_msg['content'])
-        elif final_msg['type'] == 'message_file':
-            url = self._fill_file_base_url(final_msg['content']['url'])
+        pending = None
+        for msg in messages:
+            if pending is not None:
+                self._send_stream_message(pending, channel, context, is_group)
+            pending = msg
+        if pending is None:
+            return None
+        if pending['type'] == 'agent_message':
+            return Reply(ReplyType.TEXT, pending['content'])
+        elif pending['type'] == 'message_file':
+            url = self._fill_file_base_url(pending['content']['url'])
+            return Reply(ReplyType.IMAGE_URL, url)
+        return None
+
+    def _send_stream_message(self, msg, channel, context: Context, is_group):
+        if not channel:
+            return
+        if msg['type'] == 'agent_message':
+            content = msg['content']
+            if is_group:
+                at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
+                content = at_prefix + content
+            reply = Reply(ReplyType.TEXT, content)
+            channel.send(reply, context)
+        elif msg['type'] == 'message_file':
+            url = self._fill_file_base_url(msg['content']['url'])
             reply = Reply(ReplyType.IMAGE_URL, url)
-        # 设置dify conversation_id, 依靠dify管理上下文
-        if session.get_conversation_id() == '':
-            session.set_conversation_id(conversation_id)
-        return reply, None
+            thread = threading.Thread(target=channel.send, args=(reply, context))
+            thread.start()
 
     def _handle_workflow(self, query: str, session: DifySession, context: Context):
-        payload = self._get_workflow_payload(query, session)
+        # 配置了dify_stream_split时使用流式模式，按句子/段落边发送边接收
+        split = self._get_dify_conf(context, "dify_stream_split", "")
+        response_mode = "streaming" if split else "blocking"
+        payload = self._get_workflow_payload(query, session, response_mode)
         api_key = self._get_dify_conf(context, "dify_api_key", '')
         api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
         dify_client = DifyClient(api_key, api_base)
-        response = dify_client._send_request("POST", "/workflows/run", json=payload)
+        response = dify_client._send_request("POST", "/workflows/run", json=payload, stream=bool(split))
         if response.status_code != 200:
             error_info = f"[DIFY] payload={payload} response text={response.text} status_code={response.status_code}"
             logger.warning(error_info)
             friendly_error_msg = self._handle_error_response(response.text, response.status_code)
             return None, friendly_error_msg
 
+        if split:
+            reply = self._send_stream_messages(self._iter_sse_messages(response, {}, split), context)
+            return reply, None
+
         #  {
         #      "log_id": "djflajgkldjgd",
         #      "task_id": "9da23599-e713-473b-982c-4328d4f5c78a",
@@ -399,12 +429,12 @@ class DifyBot(Bot):
         api_base = conf().get("dify_api_base", "https://api.dify.ai/v1")
         return api_base.replace("/v1", "")
 
-    def _get_workflow_payload(self, query, session: DifySession):
+    def _get_workflow_payload(self, query, session: DifySession, response_mode="blocking"):
         return {
             'inputs': {
                 "query": query
             },
-            "response_mode": "blocking",
+            "response_mode": response_mode,
             "user": session.get_user()
         }
 
@@ -429,67 +459,91 @@ class DifyBot(Bot):
             logger.warning("Received an empty SSE event.")
             return None
 
-    # TODO: 异步返回events
-    def _handle_sse_response(self, response: requests.Response):
-        events = []
+    def _iter_sse_events(self, response: requests.Response):
+        """逐个返回收到的SSE事件，不等待整个响应结束"""
         for line in response.iter_lines():
             if line:
                 decoded_line = line.decode('utf-8')
                 event = self._parse_sse_event(decoded_line)
                 if event:
-                    events.append(event)
+                    yield event
 
-        merged_message = []
+    def _iter_sse_messages(self, response: requests.Response, state: dict, split=None):
+        """
+        将SSE事件合并为消息并逐条返回: {'type': 'agent_message'|'message_file', 'content': ...}
+        连续的文本片段合并为一条消息，遇到agent_thought、message_file或结束事件时返回。
+        :param state: 用于带回conversation_id，其中有session时收到第一个带conversation_id的事件就设置到session
+        :param split: sentence/paragraph，文本在句子/段落结束时就返回，不等待后续片段
+        """
         accumulated_agent_message = ''
-        conversation_id = None
-        for event in events:
+        for event in self._iter_sse_events(response):
             event_name = event['event']
-            if event_name == 'agent_message' or event_name == 'message':
-                accumulated_agent_message += event['answer']
-                logger.debug("[DIFY] accumulated_agent_message: {}".format(accumulated_agent_message))
-                # 保存conversation_id
-                if not conversation_id:
-                    conversation_id = event['conversation_id']
+            if not state.get('conversation_id') and event.get('conversation_id'):
+                state['conversation_id'] = event['conversation_id']
+                session = state.get('session')
+                if session is not None and session.get_conversation_id() == '':
+                    session.set_conversation_id(event['conversation_id'])
+            if event_name in ('agent_message', 'message', 'text_chunk'):
+                if event_name == 'text_chunk':  # workflow的文本片段
+                    accumulated_agent_message += event['data']['text']
+                else:
+                    accumulated_agent_message += event['answer']
+                if split:
+                    completed, accumulated_agent_message = self._split_stream_text(accumulated_agent_message, split)
+                    if completed:
+                        state['has_text'] = True
+                        yield {'type': 'agent_message', 'content': completed}
             elif event_name == 'agent_thought':
-                self._append_agent_message(accumulated_agent_message, merged_message)
+                if accumulated_agent_message:
+                    yield {'type': 'agent_message', 'content': accumulated_agent_message}
                 accumulated_agent_message = ''
                 logger.debug("[DIFY] agent_thought: {}".format(event))
             elif event_name == 'message_file':
-                self._append_agent_message(accumulated_agent_message, merged_message)
+                if accumulated_agent_message:
+                    yield {'type': 'agent_message', 'content': accumulated_agent_message}
                 accumulated_agent_message = ''
-                self._append_message_file(event, merged_message)
-            elif event_name == 'message_replace':
-                # TODO: handle message_replace
-                pass
+                if event.get('type') != 'image':
+                    logger.warning("[DIFY] unsupported message file type: {}".format(event))
+                yield {'type': 'message_file', 'content': event}
             elif event_name == 'error':
                 logger.error("[DIFY] error: {}".format(event))
                 raise Exception(event)
             elif event_name == 'message_end':
-                self._append_agent_message(accumulated_agent_message, merged_message)
                 logger.debug("[DIFY] message_end usage: {}".format(event['metadata']['usage']))
                 break
+            elif event_name == 'workflow_finished':
+                # 没有收到text_chunk时使用最终输出
+                if not accumulated_agent_message and not state.get('has_text'):
+                    accumulated_agent_message = (event.get('data', {}).get('outputs') or {}).get('text', '')
+                break
+            elif event_name in ('message_replace', 'ping', 'workflow_started', 'node_started', 'node_finished', 'tts_message', 'tts_message_end'):
+                # TODO: handle message_replace
+                pass
             else:
                 logger.warning("[DIFY] unknown event: {}".format(event))
+        if accumulated_agent_message:
+            yield {'type': 'agent_message', 'content': accumulated_agent_message}
 
-        if not conversation_id:
-            raise Exception("conversation_id not found")
-
-        return merged_message, conversation_id
+    _STREAM_SPLIT_PATTERNS = {
+        "paragraph": re.compile(r"\n\s*\n"),
+        "sentence": re.compile(r"[。！？!?；;\n]+|\.(?=\s)"),
+    }
 
-    def _append_agent_message(self, accumulated_agent_message,  merged_message):
-        if accumulated_agent_message:
-            merged_message.append({
-                'type': 'agent_message',
-                'content': accumulated_agent_message,
-            })
-
-    def _append_message_file(self, event: dict, merged_message: list):
-        if event.get('type') != 'image':
-            logger.warning("[DIFY] unsupported message file type: {}".format(event))
-        merged_message.append({
-            'type': 'message_file',
-            'content': event,
-        })
+    def _split_stream_text(self, text, split):
+        """
+        在最后一个句子/段落边界处切分文本
+        :return: (已完整的部分, 剩余部分)
+        """
+        pattern = self._STREAM_SPLIT_PATTERNS.get(split)
+        if not pattern:
+            return '', text
+        last_end = 0
+        for match in pattern.finditer(text):
+            last_end = match.end()
+        completed = text[:last_end].strip()
+        if not completed:
+            return '', text
+        return completed, text[last_end:].lstrip()
 
     def _handle_error_response(self, response_text, status_code):
         """处理错误响应并提供用户指导"""
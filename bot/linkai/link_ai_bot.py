@@ -3,7 +3,7 @@
 
 import re
 import time
-import requests
+from common import http_client
 import config
 from bot.bot import Bot
 from bot.chatgpt.chat_gpt_session import ChatGPTSession
@@ -26,6 +26,9 @@ class LinkAIBot(Bot):
         super().__init__()
         self.sessions = LinkAISessionManager(LinkAISession, model=conf().get("model") or "gpt-3.5-turbo")
         self.args = {}
+        # 查询应用信息等GET请求遇到网关错误时重试，对话等POST请求不重试
+        http_client.set_endpoint_policy(conf().get("linkai_api_base", "https://api.link-ai.tech"), retries=2, backoff=0.5,
+                                        retry_on_status=http_client.GATEWAY_ERRORS)
 
     def reply(self, query, context: Context = None) -> Reply:
         if context.type == ContextType.TEXT:
@@ -123,7 +126,7 @@ class LinkAIBot(Bot):
 
             # do http request
             base_url = conf().get("linkai_api_base", "https://api.link-ai.tech")
-            res = requests.post(url=base_url + "/v1/chat/completions", json=body, headers=headers,
+            res = http_client.post(url=base_url + "/v1/chat/completions", json=body, headers=headers,
                                 timeout=conf().get("request_timeout", 180))
             if res.status_code == 200:
                 # execute success
@@ -262,7 +265,7 @@ class LinkAIBot(Bot):
 
             # do http request
             base_url = conf().get("linkai_api_base", "https://api.link-ai.tech")
-            res = requests.post(url=base_url + "/v1/chat/completions", json=body, headers=headers,
+            res = http_client.post(url=base_url + "/v1/chat/completions", json=body, headers=headers,
                                 timeout=conf().get("request_timeout", 180))
             if res.status_code == 200:
                 # execute success
@@ -306,7 +309,7 @@ class LinkAIBot(Bot):
         # do http request
         base_url = conf().get("linkai_api_base", "https://api.link-ai.tech")
         params = {"app_code": app_code}
-        res = requests.get(url=base_url + "/v1/app/info", params=params, headers=headers, timeout=(5, 10))
+        res = http_client.get(url=base_url + "/v1/app/info", params=params, headers=headers, timeout=(5, 10))
         if res.status_code == 200:
             return res.json()
         else:
@@ -327,7 +330,7 @@ class LinkAIBot(Bot):
                 "img_proxy": conf().get("image_proxy")
             }
             url = conf().get("linkai_api_base", "https://api.link-ai.tech") + "/v1/images/generations"
-            res = requests.post(url, headers=headers, json=data, timeout=(5, 90))
+            res = http_client.post(url, headers=headers, json=data, timeout=(5, 90))
             t2 = time.time()
             image_url = res.json()["data"][0]["url"]
             logger.info("[OPEN_AI] image_url={}".format(image_url))
@@ -430,7 +433,7 @@ def _download_file(url: str):
             os.makedirs(file_path)
         file_name = url.split("/")[-1]  # 获取文件名
         file_path = os.path.join(file_path, file_name)
-        response = requests.get(url)
+        response = http_client.get(url)
         with open(file_path, "wb") as f:
             f.write(response.content)
         return file_path
@@ -455,6 +458,7 @@ class LinkAISessionManager(SessionManager):
             logger.debug(f"[LinkAI] chat history, before tokens={total_tokens}, now tokens={tokens_cnt}")
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for session: {}".format(str(e)))
+        self._persist(session)
         return session
 
 
@@ -1,3 +1,4 @@
+from bot.session_store import create_session_store
 from common.expired_dict import ExpiredDict
 from common.log import logger
 from config import conf
@@ -38,29 +39,104 @@ class Session(object):
 
 class SessionManager(object):
     def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
+        expires_in = conf().get("expires_in_seconds")
+        max_count = conf().get("session_max_count")
+        if expires_in or max_count:
+            # 超过session_max_count时淘汰最久未使用的会话，使用持久化存储时再次访问会从存储中恢复
+            sessions = ExpiredDict(expires_in or float("inf"), max_size=max_count or None)
         else:
             sessions = dict()
         self.sessions = sessions
         self.sessioncls = sessioncls
         self.session_args = session_args
+        self.store = create_session_store(sessioncls.__name__)
 
     def build_session(self, session_id, system_prompt=None):
         """
-        如果session_id不在sessions中，创建一个新的session并添加到sessions中
+        如果session_id不在sessions中，先尝试从存储中加载，没有则创建一个新的session并添加到sessions中
         如果system_prompt不会空，会更新session的system_prompt并重置session
         """
         if session_id is None:
             return self.sessioncls(session_id, system_prompt, **self.session_args)
 
         if session_id not in self.sessions:
-            self.sessions[session_id] = self.sessioncls(session_id, system_prompt, **self.session_args)
+            session, loaded = self._load_session(session_id, system_prompt)
+            self.sessions[session_id] = session
+            if loaded and system_prompt is not None:  # 存储中的旧会话，按新的system_prompt重置
+                session.set_system_prompt(system_prompt)
+                self._persist(session)
         elif system_prompt is not None:  # 如果有新的system_prompt，更新并重置session
             self.sessions[session_id].set_system_prompt(system_prompt)
+            self._persist(self.sessions[session_id])
+        elif self.store.shared:
+            self._refresh_session(self.sessions[session_id])
         session = self.sessions[session_id]
         return session
 
+    def _load_session(self, session_id, system_prompt=None):
+        """
+        :return: (session, 是否从存储中加载)
+        """
+        session = self.sessioncls(session_id, system_prompt, **self.session_args)
+        if not self.store.persistent:
+            return session, False
+        try:
+            stored = self.store.load(session_id)
+        except Exception as e:
+            logger.warning("[SessionManager] load session {} error: {}".format(session_id, e))
+            stored = None
+        if stored is None:
+            return session, False
+        self._restore(session, *stored)
+        return session, True
+
+    def _restore(self, session, messages, version):
+        session.messages = messages
+        if messages and messages[0].get("role") == "system":
+            session.system_prompt = messages[0].get("content")
+        session._persisted_messages = list(messages)
+        session._persisted_version = version
+
+    def _refresh_session(self, session):
+        """其他进程修改过会话时重新加载"""
+        try:
+            version = self.store.version(session.session_id)
+            if version is not None and version != getattr(session, "_persisted_version", None):
+                stored = self.store.load(session.session_id)
+                if stored is not None:
+                    self._restore(session, *stored)
+        except Exception as e:
+            logger.warning("[SessionManager] refresh session {} error: {}".format(session.session_id, e))
+
+    def _persist(self, session):
+        """
+        将会话的变化写入存储。新增的消息只追加写入，被丢弃的消息按位置删除，其他变化整体替换
+        """
+        if not self.store.persistent or session.session_id is None:
+            return
+        self.store.maybe_purge()
+        old = getattr(session, "_persisted_messages", None)
+        new = session.messages
+        try:
+            if old is None:
+                version = self.store.replace(session.session_id, new)
+            else:
+                new_ids = set(id(m) for m in new)
+                removed = [i for i, m in enumerate(old) if id(m) not in new_ids]
+                kept = [m for m in old if id(m) in new_ids]
+                if kept and all(a is b for a, b in zip(kept, new)):
+                    version = getattr(session, "_persisted_version", None)
+                    if removed:
+                        version = self.store.remove(session.session_id, removed)
+                    if len(new) > len(kept):
+                        version = self.store.append(session.session_id, new[len(kept):])
+                else:
+                    version = self.store.replace(session.session_id, new)
+            session._persisted_messages = list(new)
+            session._persisted_version = version
+        except Exception as e:
+            logger.warning("[SessionManager] persist session {} error: {}".format(session.session_id, e))
+
     def session_query(self, query, session_id):
         session = self.build_session(session_id)
         session.add_query(query)
@@ -70,6 +146,7 @@ class SessionManager(object):
             logger.debug("prompt tokens used={}".format(total_tokens))
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for prompt: {}".format(str(e)))
+        self._persist(session)
         return session
 
     def session_reply(self, reply, session_id, total_tokens=None):
@@ -81,11 +158,20 @@ class SessionManager(object):
             logger.debug("raw total_tokens={}, savesession tokens={}".format(total_tokens, tokens_cnt))
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for session: {}".format(str(e)))
+        self._persist(session)
         return session
 
     def clear_session(self, session_id):
         if session_id in self.sessions:
             del self.sessions[session_id]
+        try:
+            self.store.delete(session_id)
+        except Exception as e:
+            logger.warning("[SessionManager] delete session {} error: {}".format(session_id, e))
 
     def clear_all_session(self):
         self.sessions.clear()
+        try:
+            self.store.clear()
+        except Exception as e:
+            logger.warning("[SessionManager] clear sessions error: {}".format(e))
@@ -0,0 +1,383 @@
+"""
+会话持久化存储，供SessionManager使用
+
+memory: 会话只保存在进程内存中(默认，重启后丢失)
+sqlite: 保存在sqlite数据库中，多个进程可共享同一个数据库文件
+file:   每个会话一个追加写入的日志文件，适合单进程快速热重启
+
+持久化存储记录每个会话最后一次写入的时间，超过expires_in_seconds未使用的会话加载时视为不存在并删除，
+写入时每隔一段时间顺带清理一次所有过期会话。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from common.log import logger
+from config import conf, get_appdata_dir
+
+# 消息序列化为紧凑的json数组 [角色缩写, 内容(, 其他字段)]，而不是逐条保存完整的dict
+_ROLE_CODES = {"system": "s", "user": "u", "assistant": "a"}
+_CODE_ROLES = {v: k for k, v in _ROLE_CODES.items()}
+
+
+def encode_message(message: dict) -> str:
+    role = message.get("role")
+    item = [_ROLE_CODES.get(role, role), message.get("content")]
+    extra = {k: v for k, v in message.items() if k not in ("role", "content")}
+    if extra:
+        item.append(extra)
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_message(data: str) -> dict:
+    item = json.loads(data)
+    message = {"role": _CODE_ROLES.get(item[0], item[0]), "content": item[1]}
+    if len(item) > 2:
+        message.update(item[2])
+    return message
+
+
+class SessionStore(object):
+    # 是否会被多个进程同时读写，为True时SessionManager每次使用会话前都会检查版本号
+    shared = False
+    # 是否需要持久化，为False时SessionManager不会调用写入方法
+    persistent = True
+    # 两次清理过期会话的最小间隔(秒)
+    PURGE_INTERVAL = 600
+
+    def __init__(self, expires_in=None, clock=time.time):
+        self.expires_in = expires_in  # 会话过期时间(秒)，None或0为不过期
+        self.clock = clock
+        self._last_purge = clock()
+
+    def _expired(self, updated_at):
+        return bool(self.expires_in) and self.clock() - updated_at > self.expires_in
+
+    def maybe_purge(self):
+        """距离上次清理超过PURGE_INTERVAL(不超过过期时间)时清理过期会话"""
+        if not self.expires_in:
+            return
+        now = self.clock()
+        if now - self._last_purge < min(self.PURGE_INTERVAL, self.expires_in):
+            return
+        self._last_purge = now
+        try:
+            count = self.purge()
+            if count:
+                logger.debug("[SessionStore] purged {} expired sessions".format(count))
+        except Exception as e:
+            logger.warning("[SessionStore] purge expired sessions error: {}".format(e))
+
+    def purge(self):
+        """删除所有过期的会话，返回删除的数量"""
+        return 0
+
+    def load(self, session_id):
+        """
+        :return: (messages, version)，会话不存在时返回None
+        """
+        raise NotImplementedError
+
+    def version(self, session_id):
+        """会话当前的版本号，每次写入都会变化"""
+        return None
+
+    def append(self, session_id, messages):
+        """在会话末尾追加消息，返回新的版本号"""
+        raise NotImplementedError
+
+    def remove(self, session_id, indexes):
+        """删除会话中指定位置的消息，返回新的版本号"""
+        raise NotImplementedError
+
+    def replace(self, session_id, messages):
+        """用messages整体替换会话内容，返回新的版本号"""
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """会话只保存在SessionManager的内存字典中，不做持久化"""
+
+    persistent = False
+
+    def load(self, session_id):
+        return None
+
+    def append(self, session_id, messages):
+        return None
+
+    def remove(self, session_id, indexes):
+        return None
+
+    def replace(self, session_id, messages):
+        return None
+
+    def delete(self, session_id):
+        pass
+
+    def clear(self):
+        pass
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    会话保存在sqlite中，每条消息一行，追加消息只需插入新行。
+    使用WAL模式，每个线程复用一个连接，多个进程可共享同一个数据库文件。
+    """
+
+    shared = True
+
+    def __init__(self, db_path, expires_in=None, clock=time.time):
+        super().__init__(expires_in, clock)
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_session_messages ON session_messages (session_id, id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_versions (
+                    session_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _bump_version(self, conn, session_id):
+        conn.execute(
+            "INSERT INTO session_versions (session_id, version, updated_at) VALUES (?, 1, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+            (session_id, self.clock()),
+        )
+        return conn.execute("SELECT version FROM session_versions WHERE session_id=?", (session_id,)).fetchone()[0]
+
+    def load(self, session_id):
+        conn = self._conn()
+        row = conn.execute("SELECT version, updated_at FROM session_versions WHERE session_id=?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[1]):
+            self.delete(session_id)
+            return None
+        rows = conn.execute("SELECT data FROM session_messages WHERE session_id=? ORDER BY id", (session_id,)).fetchall()
+        return [decode_message(r[0]) for r in rows], row[0]
+
+    def version(self, session_id):
+        row = self._conn().execute("SELECT version FROM session_versions WHERE session_id=?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def append(self, session_id, messages):
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO session_messages (session_id, data) VALUES (?, ?)",
+                [(session_id, encode_message(m)) for m in messages],
+            )
+            return self._bump_version(conn, session_id)
+
+    def remove(self, session_id, indexes):
+        conn = self._conn()
+        with conn:
+            ids = [r[0] for r in conn.execute("SELECT id FROM session_messages WHERE session_id=? ORDER BY id", (session_id,))]
+            conn.executemany("DELETE FROM session_messages WHERE id=?", [(ids[i],) for i in indexes if i < len(ids)])
+            return self._bump_version(conn, session_id)
+
+    def replace(self, session_id, messages):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM session_messages WHERE session_id=?", (session_id,))
+            conn.executemany(
+                "INSERT INTO session_messages (session_id, data) VALUES (?, ?)",
+                [(session_id, encode_message(m)) for m in messages],
+            )
+            return self._bump_version(conn, session_id)
+
+    def delete(self, session_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM session_messages WHERE session_id=?", (session_id,))
+            conn.execute("DELETE FROM session_versions WHERE session_id=?", (session_id,))
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM session_messages")
+            conn.execute("DELETE FROM session_versions")
+
+    def purge(self):
+        if not self.expires_in:
+            return 0
+        deadline = self.clock() - self.expires_in
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "DELETE FROM session_messages WHERE session_id IN "
+                "(SELECT session_id FROM session_versions WHERE updated_at < ?)",
+                (deadline,),
+            )
+            return conn.execute("DELETE FROM session_versions WHERE updated_at < ?", (deadline,)).rowcount
+
+
+class FileSessionStore(SessionStore):
+    """
+    每个会话一个日志文件，每次写入只在文件末尾追加一行操作记录:
+        + <消息>          追加消息
+        - <位置列表>      删除消息
+        = <消息列表>      整体替换(快照)
+    加载时重放日志。日志行数超过compact_threshold时用快照重写文件。
+    文件的修改时间即会话最后一次写入的时间。
+    """
+
+    def __init__(self, dir_path, compact_threshold=200, expires_in=None, clock=time.time):
+        super().__init__(expires_in, clock)
+        self.dir_path = dir_path
+        self.compact_threshold = compact_threshold
+        self._line_counts = {}
+        self._lock = threading.Lock()
+        os.makedirs(dir_path, exist_ok=True)
+
+    def _path(self, session_id):
+        name = hashlib.md5(str(session_id).encode("utf-8")).hexdigest()
+        return os.path.join(self.dir_path, name + ".journal")
+
+    def _replay(self, path):
+        messages = []
+        lines = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):  # 写入中断导致的不完整记录
+                    break
+                op, data = line[0], line[2:-1]
+                if op == "+":
+                    messages.append(decode_message(data))
+                elif op == "-":
+                    removed = set(json.loads(data))
+                    messages = [m for i, m in enumerate(messages) if i not in removed]
+                elif op == "=":
+                    messages = [decode_message(d) for d in json.loads(data)]
+                lines += 1
+        return messages, lines
+
+    def _write(self, session_id, lines):
+        path = self._path(session_id)
+        with self._lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(line + "\n" for line in lines))
+            count = self._line_counts.get(session_id, 0) + len(lines)
+            self._line_counts[session_id] = count
+            if count > self.compact_threshold:
+                self._compact(session_id, path)
+            now = self.clock()
+            os.utime(path, (now, now))
+
+    def _compact(self, session_id, path):
+        messages, _ = self._replay(path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("= " + json.dumps([encode_message(m) for m in messages], ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+        self._line_counts[session_id] = 1
+
+    def load(self, session_id):
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return None
+        if self._expired(os.path.getmtime(path)):
+            self.delete(session_id)
+            return None
+        with self._lock:
+            messages, lines = self._replay(path)
+            self._line_counts[session_id] = lines
+        return messages, None
+
+    def append(self, session_id, messages):
+        self._write(session_id, ["+ " + encode_message(m) for m in messages])
+
+    def remove(self, session_id, indexes):
+        self._write(session_id, ["- " + json.dumps(list(indexes))])
+
+    def replace(self, session_id, messages):
+        self._write(session_id, ["= " + json.dumps([encode_message(m) for m in messages], ensure_ascii=False)])
+
+    def delete(self, session_id):
+        with self._lock:
+            self._line_counts.pop(session_id, None)
+            try:
+                os.remove(self._path(session_id))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._line_counts.clear()
+            for name in os.listdir(self.dir_path):
+                if name.endswith(".journal"):
+                    os.remove(os.path.join(self.dir_path, name))
+
+    def purge(self):
+        if not self.expires_in:
+            return 0
+        count = 0
+        with self._lock:
+            for name in os.listdir(self.dir_path):
+                path = os.path.join(self.dir_path, name)
+                try:
+                    if name.endswith(".journal") and self._expired(os.path.getmtime(path)):
+                        os.remove(path)
+                        count += 1
+                except FileNotFoundError:
+                    pass
+        return count
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def create_session_store(name=None):
+    """根据配置session_store创建会话存储，同一种存储在进程内共享"""
+    store_type = conf().get("session_store", "memory") or "memory"
+    if store_type == "memory":
+        path = None
+    else:
+        path = conf().get("session_store_path") or os.path.join(get_appdata_dir(), "sessions")
+        if name:
+            path = os.path.join(path, name)
+    key = (store_type, path)
+    expires_in = conf().get("expires_in_seconds")
+    with _stores_lock:
+        if key not in _stores:
+            if store_type == "sqlite":
+                os.makedirs(path, exist_ok=True)
+                _stores[key] = SqliteSessionStore(os.path.join(path, "sessions.db"), expires_in=expires_in)
+            elif store_type == "file":
+                _stores[key] = FileSessionStore(path, expires_in=expires_in)
+            else:
+                if store_type != "memory":
+                    logger.warning("[SessionStore] unknown session_store: {}, use memory".format(store_type))
+                _stores[key] = MemorySessionStore()
+        return _stores[key]
@@ -0,0 +1,176 @@
+# encoding:utf-8
+"""
+讯飞星火websocket客户端
+
+星火每次提问使用一个websocket连接，服务端返回最后一帧(status=2)后关闭。
+所有请求都作为协程运行在共享的后台事件循环中(common.async_loop)，共用一个aiohttp会话，
+不再为每次提问启动线程，结果通过future返回，连接和请求状态随协程结束一起释放。
+
+    client = SparkClient(app_id, api_key, api_secret, spark_url, domain)
+    content, usage = client.chat(messages)           # 同步，在bot线程中调用
+    for item in client.stream(messages): ...          # 同步逐段返回
+    async for item in client.astream(messages): ...   # 在事件循环中使用
+"""
+import base64
+import hashlib
+import hmac
+import json
+import queue
+from datetime import datetime
+from time import mktime
+from urllib.parse import urlencode, urlparse
+from wsgiref.handlers import format_date_time
+
+import aiohttp
+
+from common.async_loop import run_coroutine, submit
+from common.log import logger
+
+# 状态: 0 第一帧，1 中间帧，2 最后一帧
+STATUS_LAST = 2
+
+
+class SparkError(Exception):
+    def __init__(self, code, message):
+        super().__init__("spark error {}: {}".format(code, message))
+        self.code = code
+
+
+class ReplyItem:
+    def __init__(self, reply, usage=None, is_end=False):
+        self.is_end = is_end
+        self.reply = reply
+        self.usage = usage
+
+
+def gen_params(appid, domain, question, temperature=0.5):
+    """
+    通过appid和用户的提问来生成请参数
+    """
+    data = {
+        "header": {
+            "app_id": appid,
+            "uid": "1234"
+        },
+        "parameter": {
+            "chat": {
+                "domain": domain,
+                "temperature": temperature,
+                "random_threshold": 0.5,
+                "max_tokens": 2048,
+                "auditing": "default"
+            }
+        },
+        "payload": {
+            "message": {
+                "text": question
+            }
+        }
+    }
+    return data
+
+
+class SparkClient(object):
+    def __init__(self, app_id, api_key, api_secret, spark_url, domain, timeout=60):
+        self.app_id = app_id
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.spark_url = spark_url
+        self.domain = domain
+        self.timeout = timeout  # 等待每一帧的超时时间，同步调用时也是整个请求的超时时间
+        self.host = urlparse(spark_url).netloc
+        self.path = urlparse(spark_url).path
+        self._http = None  # 只在后台事件循环中创建和使用
+
+    # 生成url
+    def create_url(self):
+        # 生成RFC1123格式的时间戳
+        date = format_date_time(mktime(datetime.now().timetuple()))
+
+        # 拼接字符串
+        signature_origin = "host: " + self.host + "\n"
+        signature_origin += "date: " + date + "\n"
+        signature_origin += "GET " + self.path + " HTTP/1.1"
+
+        # 进行hmac-sha256进行加密
+        signature_sha = hmac.new(self.api_secret.encode('utf-8'),
+                                 signature_origin.encode('utf-8'),
+                                 digestmod=hashlib.sha256).digest()
+        signature_sha_base64 = base64.b64encode(signature_sha).decode(encoding='utf-8')
+
+        authorization_origin = f'api_key="{self.api_key}", algorithm="hmac-sha256", headers="host date request-line", ' \
+                               f'signature="{signature_sha_base64}"'
+        authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode(encoding='utf-8')
+
+        # 将请求的鉴权参数组合为字典，拼接鉴权参数，生成url
+        v = {"authorization": authorization, "date": date, "host": self.host}
+        return self.spark_url + '?' + urlencode(v)
+
+    def _session(self):
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession()
+        return self._http
+
+    async def astream(self, messages, temperature=0.5):
+        """逐帧返回ReplyItem，最后一个的is_end为True并带有usage；出错时抛出SparkError"""
+        params = gen_params(self.app_id, self.domain, messages, temperature)
+        async with self._session().ws_connect(self.create_url()) as ws:
+            await ws.send_str(json.dumps(params))
+            while True:
+                msg = await ws.receive(timeout=self.timeout)
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    raise SparkError(-1, "connection closed before the last frame, {}".format(msg.type))
+                data = json.loads(msg.data)
+                code = data["header"]["code"]
+                if code != 0:
+                    raise SparkError(code, data["header"].get("message"))
+                choices = data["payload"]["choices"]
+                content = "".join(text["content"] for text in choices["text"])
+                if choices["status"] == STATUS_LAST:
+                    usage = data["payload"].get("usage", {}).get("text", {})
+                    yield ReplyItem(content, usage, is_end=True)
+                    return
+                yield ReplyItem(content)
+
+    async def achat(self, messages, temperature=0.5):
+        """返回(完整回复, usage)"""
+        parts = []
+        usage = {}
+        async for item in self.astream(messages, temperature):
+            parts.append(item.reply)
+            if item.is_end:
+                usage = item.usage
+        return "".join(parts), usage
+
+    def chat(self, messages, temperature=0.5, timeout=None):
+        """在后台事件循环中执行achat，超时时取消请求并抛出TimeoutError"""
+        return submit(self.achat(messages, temperature), timeout or self.timeout)
+
+    def stream(self, messages, temperature=0.5, timeout=None):
+        """同步版本的astream，调用方提前停止迭代或超时时取消请求"""
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in self.astream(messages, temperature):
+                    items.put(item)
+            except Exception as e:
+                items.put(e)
+            else:
+                items.put(None)
+
+        future = run_coroutine(pump())
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=timeout or self.timeout)
+                except queue.Empty:
+                    logger.warning("[XunFei] no response in {}s".format(timeout or self.timeout))
+                    raise TimeoutError()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
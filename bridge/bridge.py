@@ -7,6 +7,7 @@ from common.singleton import singleton
 from config import conf
 from translate.factory import create_translator
 from voice.factory import create_voice
+from voice.tts_cache import get_tts_cache, warm_up
 
 
 @singleton
@@ -96,7 +97,16 @@ class Bridge(object):
         return self.get_bot("voice_to_text").voiceToText(voiceFile)
 
     def fetch_text_to_voice(self, text) -> Reply:
-        return self.get_bot("text_to_voice").textToVoice(text)
+        voice_bot = self.get_bot("text_to_voice")
+        cache = get_tts_cache()
+        if cache is None:
+            return voice_bot.textToVoice(text)
+        return cache.text_to_voice(self.btype["text_to_voice"], voice_bot, text)
+
+    def warm_up_text_to_voice(self, phrases):
+        """预先合成常用的语音回复放入缓存"""
+        if get_tts_cache() is not None:
+            warm_up(self.fetch_text_to_voice, phrases)
 
     def fetch_translate(self, text, from_lang="", to_lang="en") -> Reply:
         return self.get_bot("translate").translate(text, from_lang, to_lang)
@@ -3,89 +3,153 @@ import re
 import threading
 import time
 from asyncio import CancelledError
-from concurrent.futures import Future, ThreadPoolExecutor
-import requests
-import json
+from concurrent.futures import Future
+from common import http_client
 import uuid
+from collections import OrderedDict
 
 from bridge.context import *
 from bridge.reply import *
 from channel.channel import Channel
+from common.bot_identity import get_bot_wxid
 from common.dequeue import Dequeue
+from common.handler_pool import HandlerPool
 from common import memory
 from plugins import *
-from database.group_members_db import get_group_member_from_db, save_group_members_to_db
+from database.group_members_db import get_group_members_from_db, save_group_members_to_db, init_db
+from database.group_members_cache import GroupMemberCache, MISS
 
 try:
     from voice.audio_convert import any_to_wav
 except Exception as e:
     pass
 
-handler_pool = ThreadPoolExecutor(max_workers=8)  # 处理消息的线程池
+# 处理消息的线程池，按消息类型分为多个通道，避免慢请求(如语音转码、长时间的LLM调用)占满所有线程
+# command: 管理员/插件命令, text: 文本LLM调用, voice: 语音识别/合成, media: 图片等媒体下载
+HANDLER_POOL_DEFAULT_SIZE = {"command": 2, "text": 8, "voice": 2, "media": 2}
+handler_pools = {}
+_handler_pools_lock = threading.Lock()
+
+
+def init_handler_pools():
+    """根据配置创建各通道线程池，需在配置加载后调用，重复调用不会重复创建"""
+    with _handler_pools_lock:
+        pool_size = conf().get("handler_pool_size") or {}
+        for lane, default_size in HANDLER_POOL_DEFAULT_SIZE.items():
+            if lane not in handler_pools:
+                handler_pools[lane] = HandlerPool(lane, max_workers=int(pool_size.get(lane, default_size)))
+    return handler_pools
+
+
+def get_handler_pool_stats():
+    """返回各通道线程池的排队数和活跃线程数"""
+    return {lane: pool.stats() for lane, pool in handler_pools.items()}
+
+
+_group_member_cache = None
+_group_member_cache_lock = threading.Lock()
+
+
+def get_group_member_cache() -> GroupMemberCache:
+    """群成员名称缓存，首次使用时根据配置创建"""
+    global _group_member_cache
+    if _group_member_cache is None:
+        with _group_member_cache_lock:
+            if _group_member_cache is None:
+                _group_member_cache = GroupMemberCache(
+                    loader=fetch_group_member_names,
+                    max_size=conf().get("group_member_cache_size", 10000),
+                    ttl=conf().get("group_member_cache_ttl", 3600),
+                    negative_ttl=conf().get("group_member_cache_negative_ttl", 300),
+                    refresh_ahead=conf().get("group_member_cache_refresh_ahead", False),
+                )
+    return _group_member_cache
+
+
+def fetch_group_member_names(group_id, bot_wxid=None, api_base_url=None):
+    """
+    请求接口获取整个群的成员列表，写入sqlite
+    :return: {wxid: @名称}，请求失败返回None
+    """
+    # 自动获取api_base_url和bot_wxid
+    if api_base_url is None:
+        api_base_url = conf().get("xbot_base_url") or conf().get("gewechat_base_url")
+    if bot_wxid is None:
+        # 根目录下resource/robot_stat.json中的wxid(进程内缓存)
+        try:
+            bot_wxid = get_bot_wxid()
+        except Exception as e:
+            logger.error(f"[get_group_member_display_name] 读取robot_stat.json失败: {e}")
+    if not api_base_url or not bot_wxid:
+        logger.error(f"[get_group_member_display_name] 缺少api_base_url或bot_wxid, api_base_url={api_base_url}, bot_wxid={bot_wxid}")
+        return None
+    url = api_base_url.rstrip("/") + "/Group/GetChatRoomMemberDetail"
+    payload = {"QID": group_id, "Wxid": bot_wxid}
+    logger.debug(f"[get_group_member_display_name] 请求接口: url={url}, payload={payload}")
+    resp = http_client.post(url, json=payload, timeout=5)
+    data = resp.json()
+    members = data.get("Data", {}).get("NewChatroomData", {}).get("ChatRoomMember", [])
+    if not members:
+        logger.warning(f"[get_group_member_display_name] 接口返回成员为空: status={resp.status_code}, text={resp.text[:200]}")
+        return None
+    logger.debug(f"[get_group_member_display_name] 接口返回成员数: {len(members)}，写入本地缓存")
+    save_group_members_to_db(group_id, members)
+    names = {}
+    for member in members:
+        member_wxid = member.get("UserName") or member.get("wxid")
+        if member_wxid:
+            names[member_wxid] = member.get("DisplayName") or member.get("NickName")
+    return names
+
 
 def get_group_member_display_name(group_id, wxid, bot_wxid=None, api_base_url=None):
+    """获取群成员的@名称，优先DisplayName，无则NickName，查不到返回None"""
+    return get_group_member_display_names(group_id, [wxid], bot_wxid, api_base_url).get(wxid)
+
+
+def get_group_member_display_names(group_id, wxids, bot_wxid=None, api_base_url=None):
     """
-    获取群成员的@名称，优先DisplayName，无则NickName。
-    1. 先查本地sqlite缓存。
-    2. 查不到则请求接口并缓存。
+    批量获取同一个群内多个成员的@名称。
+    1. 先查进程内缓存(含未命中结果缓存)。
+    2. 缓存未命中的成员用一条查询从本地sqlite缓存中取出。
+    3. 仍查不到则请求接口加载整个群并缓存，同一个群的并发请求只会请求一次接口。
+    :return: {wxid: @名称}，查不到的成员为None
     """
-    import logging
-    # 统一提前import，保证作用域
-    try:
-        from xbot.database.group_members_db import get_group_member_from_db, save_group_members_to_db
-    except ImportError:
-        from database.group_members_db import get_group_member_from_db, save_group_members_to_db
-    # 1. 本地缓存
-    try:
-        member = get_group_member_from_db(group_id, wxid)
-        if member:
-            logger.info(f"[get_group_member_display_name] 本地缓存命中: group_id={group_id}, wxid={wxid}, display_name={member.get('display_name')}, nickname={member.get('nickname')}")
-            return member.get("display_name") or member.get("nickname")
+    cache = get_group_member_cache()
+    names = {}
+    missing = []
+    for wxid in dict.fromkeys(wxids):
+        name = cache.get(group_id, wxid)
+        if name is MISS:
+            missing.append(wxid)
         else:
-            logger.info(f"[get_group_member_display_name] 本地缓存未命中: group_id={group_id}, wxid={wxid}")
-    except Exception as e:
-        logger.warning(f"[get_group_member_display_name] 本地缓存查询异常: {e}")
-    # 2. 请求接口
+            names[wxid] = name
+    if not missing:
+        return names
+    # 本地sqlite缓存
     try:
-        # 自动获取api_base_url和bot_wxid
-        if api_base_url is None:
-            from config import conf
-            api_base_url = conf().get("xbot_base_url") or conf().get("gewechat_base_url")
-        if bot_wxid is None:
-            # 直接用相对路径查找根目录下resource/robot_stat.json（修正为上一级目录）
-            try:
-                resource_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../resource/robot_stat.json'))
-                logger.info(f"[get_group_member_display_name] 直接用相对路径读取robot_stat.json: {resource_path}")
-                with open(resource_path, "r", encoding="utf-8") as f:
-                    stat = json.load(f)
-                    bot_wxid = stat.get("wxid")
-                    logger.info(f"[get_group_member_display_name] 从robot_stat.json获取bot_wxid: {bot_wxid}")
-            except Exception as e:
-                logger.error(f"[get_group_member_display_name] 读取robot_stat.json失败: {e}")
-        if not api_base_url or not bot_wxid:
-            logger.error(f"[get_group_member_display_name] 缺少api_base_url或bot_wxid, api_base_url={api_base_url}, bot_wxid={bot_wxid}")
-            return None
-        url = api_base_url.rstrip("/") + "/Group/GetChatRoomMemberDetail"
-        payload = {"QID": group_id, "Wxid": bot_wxid}
-        logger.info(f"[get_group_member_display_name] 请求接口: url={url}, payload={payload}")
-        resp = requests.post(url, json=payload, timeout=5)
-        logger.info(f"[get_group_member_display_name] 接口响应: status={resp.status_code}, text={resp.text[:200]}")
-        data = resp.json()
-        members = data.get("Data", {}).get("NewChatroomData", {}).get("ChatRoomMember", [])
-        if members:
-            logger.info(f"[get_group_member_display_name] 接口返回成员数: {len(members)}，写入本地缓存")
-            save_group_members_to_db(group_id, members)
-            for member in members:
-                member_wxid = member.get("UserName") or member.get("wxid")
-                if member_wxid == wxid:
-                    logger.info(f"[get_group_member_display_name] 命中接口成员: display_name={member.get('DisplayName')}, nickname={member.get('NickName')}")
-                    return member.get("DisplayName") or member.get("NickName")
-            logger.warning(f"[get_group_member_display_name] 接口返回但未找到wxid: {wxid}")
-        else:
-            logger.warning(f"[get_group_member_display_name] 接口返回成员为空: {data}")
+        members = get_group_members_from_db(group_id, missing)
+        for wxid, member in members.items():
+            names[wxid] = member.get("display_name") or member.get("nickname")
+            cache.put(group_id, wxid, names[wxid])
+        missing = [wxid for wxid in missing if wxid not in members]
     except Exception as e:
-        logger.exception(f"[get_group_member_display_name] 接口请求异常: {e}")
-    return None
+        logger.warning(f"[get_group_member_display_name] 本地缓存查询异常: {e}")
+    if not missing:
+        return names
+    # 请求接口
+    if bot_wxid is None and api_base_url is None:
+        cache.load_group(group_id, wxid=missing[0])
+    else:
+        cache.load_group(group_id, loader=lambda gid: fetch_group_member_names(gid, bot_wxid, api_base_url), wxid=missing[0])
+    for wxid in missing:
+        name = cache.get(group_id, wxid)
+        if name is MISS:
+            logger.warning(f"[get_group_member_display_name] 未找到群成员: group_id={group_id}, wxid={wxid}")
+            cache.put(group_id, wxid, None)
+            name = None
+        names[wxid] = name
+    return names
 
 def download_image_to_tmp(url):
     tmp_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../resource/tmp"))
@@ -96,7 +160,7 @@ def download_image_to_tmp(url):
     filename = f"{uuid.uuid4().hex}{ext}"
     save_path = os.path.join(tmp_dir, filename)
     try:
-        resp = requests.get(url, timeout=10)
+        resp = http_client.get(url, timeout=10)
         resp.raise_for_status()
         with open(save_path, "wb") as f:
             f.write(resp.content)
@@ -111,9 +175,15 @@ class ChatChannel(Channel):
     user_id = None  # 登录的用户id
     futures = {}  # 记录每个session_id提交到线程池的future对象, 用于重置会话时把没执行的future取消掉，正在执行的不会被取消
     sessions = {}  # 用于控制并发，每个session_id同时只能有一个context在处理
-    lock = threading.Lock()  # 用于控制对sessions的访问
+    ready_sessions = OrderedDict()  # 就绪队列，仅包含有待处理消息的session_id，按入队顺序调度
+    lock = threading.Condition(threading.RLock())  # 用于控制对sessions的访问，并在有新消息时唤醒调度线程
 
     def __init__(self):
+        init_handler_pools()
+        try:
+            init_db()
+        except Exception as e:
+            logger.warning(f"[chat_channel] 群成员数据库初始化失败: {e}")
         _thread = threading.Thread(target=self.consume)
         _thread.setDaemon(True)
         _thread.start()
@@ -481,10 +551,44 @@ class ChatChannel(Channel):
             except Exception as e:
                 logger.exception("Worker raise exception: {}".format(e))
             with self.lock:
-                self.sessions[session_id][1].release()
+                if session_id not in self.sessions:
+                    return
+                context_queue, semaphore = self.sessions[session_id]
+                semaphore.release()
+                if not context_queue.empty():
+                    self._mark_ready(session_id)
+                elif semaphore._initial_value == semaphore._value:  # 队列为空且没有正在处理的任务，回收session
+                    self._remove_session(session_id)
 
         return func
 
+    # 根据消息类型选择处理通道
+    def _select_handler_lane(self, context: Context):
+        if context.type == ContextType.TEXT:
+            content = context.content or ""
+            if content.startswith("#") or content.startswith(conf().get("plugin_trigger_prefix", "$")):
+                return "command"
+        # 只有语音输入走voice通道；开启语音回复时的文本消息仍走text通道，避免所有对话都挤在voice线程池
+        if context.type == ContextType.VOICE:
+            return "voice"
+        if context.type in [ContextType.IMAGE, ContextType.FILE, ContextType.VIDEO]:
+            return "media"
+        return "text"
+
+    # 以下 _mark_ready/_remove_session 均需在持有 self.lock 的情况下调用
+    def _mark_ready(self, session_id):
+        """将有待处理消息的session加入就绪队列，并唤醒调度线程"""
+        if session_id not in self.ready_sessions:
+            self.ready_sessions[session_id] = None
+            self.lock.notify()
+
+    def _remove_session(self, session_id):
+        self.futures[session_id] = [t for t in self.futures.get(session_id, []) if not t.done()]
+        assert len(self.futures[session_id]) == 0, "thread pool error"
+        del self.futures[session_id]
+        del self.sessions[session_id]
+        self.ready_sessions.pop(session_id, None)
+
     def produce(self, context: Context):
         session_id = context.get("session_id", 0)
         with self.lock:
@@ -497,54 +601,48 @@ class ChatChannel(Channel):
                 self.sessions[session_id][0].putleft(context)  # 优先处理管理命令
             else:
                 self.sessions[session_id][0].put(context)
+            self._mark_ready(session_id)
 
-    # 消费者函数，单独线程，用于从消息队列中取出消息并处理
+    # 消费者函数，单独线程，只遍历就绪队列中有待处理消息的session，由produce和任务完成回调唤醒
     def consume(self):
         while True:
             with self.lock:
-                session_ids = list(self.sessions.keys())
-            for session_id in session_ids:
-                with self.lock:
-                    context_queue, semaphore = self.sessions[session_id]
-                if semaphore.acquire(blocking=False):  # 等线程处理完毕才能删除
-                    if not context_queue.empty():
-                        context = context_queue.get()
-                        logger.debug("[chat_channel] consume context: {}".format(context))
-                        future: Future = handler_pool.submit(self._handle, context)
-                        future.add_done_callback(self._thread_pool_callback(session_id, context=context))
-                        with self.lock:
-                            if session_id not in self.futures:
-                                self.futures[session_id] = []
-                            self.futures[session_id].append(future)
-                    elif semaphore._initial_value == semaphore._value + 1:  # 除了当前，没有任务再申请到信号量，说明所有任务都处理完毕
-                        with self.lock:
-                            self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
-                            assert len(self.futures[session_id]) == 0, "thread pool error"
-                            del self.sessions[session_id]
-                    else:
-                        semaphore.release()
-            time.sleep(0.2)
+                while not self.ready_sessions:
+                    self.lock.wait()
+                session_id, _ = self.ready_sessions.popitem(last=False)
+                context_queue, semaphore = self.sessions[session_id]
+                if not semaphore.acquire(blocking=False):
+                    continue  # 并发已满，等任务完成回调再次加入就绪队列
+                if context_queue.empty():  # 队列可能已被cancel_session清空
+                    semaphore.release()
+                    if semaphore._initial_value == semaphore._value:
+                        self._remove_session(session_id)
+                    continue
+                context = context_queue.get()
+                if not context_queue.empty():
+                    self._mark_ready(session_id)  # 重新排到队尾，保证各session之间公平
+            logger.debug("[chat_channel] consume context: {}".format(context))
+            future: Future = handler_pools[self._select_handler_lane(context)].submit(self._handle, context)
+            with self.lock:
+                self.futures.setdefault(session_id, []).append(future)
+            # 回调可能在add_done_callback内同步执行，因此不能持有锁
+            future.add_done_callback(self._thread_pool_callback(session_id, context=context))
 
     # 取消session_id对应的所有任务，只能取消排队的消息和已提交线程池但未执行的任务
     def cancel_session(self, session_id):
         with self.lock:
             if session_id in self.sessions:
-                for future in self.futures[session_id]:
-                    future.cancel()
                 cnt = self.sessions[session_id][0].qsize()
                 if cnt > 0:
                     logger.info("Cancel {} messages in session {}".format(cnt, session_id))
                 self.sessions[session_id][0] = Dequeue()
+                for future in list(self.futures.get(session_id, [])):
+                    future.cancel()
 
     def cancel_all_session(self):
         with self.lock:
-            for session_id in self.sessions:
-                for future in self.futures[session_id]:
-                    future.cancel()
-                cnt = self.sessions[session_id][0].qsize()
-                if cnt > 0:
-                    logger.info("Cancel {} messages in session {}".format(cnt, session_id))
-                self.sessions[session_id][0] = Dequeue()
+            for session_id in list(self.sessions.keys()):
+                self.cancel_session(session_id)
 
 
 def check_prefix(content, prefix_list):
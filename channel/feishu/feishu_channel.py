@@ -8,11 +8,12 @@
 # -*- coding=utf-8 -*-
 import uuid
 
-import requests
+from common import http_client
 import web
 from channel.feishu.feishu_message import FeishuMessage
 from bridge.context import Context
 from bridge.reply import Reply, ReplyType
+from common.credential_cache import credential_key, get_credential_cache
 from common.log import logger
 from common.singleton import singleton
 from config import conf
@@ -80,7 +81,7 @@ class FeiShuChanel(ChatChannel):
                 "msg_type": msg_type,
                 "content": json.dumps({content_key: reply_content})
             }
-            res = requests.post(url=url, headers=headers, json=data, timeout=(5, 10))
+            res = http_client.post(url=url, headers=headers, json=data, timeout=(5, 10))
         else:
             url = "https://open.feishu.cn/open-apis/im/v1/messages"
             params = {"receive_id_type": context.get("receive_id_type") or "open_id"}
@@ -89,7 +90,7 @@ class FeiShuChanel(ChatChannel):
                 "msg_type": msg_type,
                 "content": json.dumps({content_key: reply_content})
             }
-            res = requests.post(url=url, headers=headers, params=params, json=data, timeout=(5, 10))
+            res = http_client.post(url=url, headers=headers, params=params, json=data, timeout=(5, 10))
         res = res.json()
         if res.get("code") == 0:
             logger.info(f"[FeiShu] send message success")
@@ -98,6 +99,15 @@ class FeiShuChanel(ChatChannel):
 
 
     def fetch_access_token(self) -> str:
+        """tenant_access_token有效期内从凭证缓存中读取，获取失败时返回空字符串"""
+        key = credential_key("feishu_tenant", self.feishu_app_id, self.feishu_app_secret)
+        try:
+            return get_credential_cache().get(key, self._fetch_tenant_access_token)
+        except Exception as e:
+            logger.error(f"[FeiShu] fetch token error, {e}")
+            return ""
+
+    def _fetch_tenant_access_token(self):
         url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal/"
         headers = {
             "Content-Type": "application/json"
@@ -107,21 +117,18 @@ class FeiShuChanel(ChatChannel):
             "app_secret": self.feishu_app_secret
         }
         data = bytes(json.dumps(req_body), encoding='utf8')
-        response = requests.post(url=url, data=data, headers=headers)
-        if response.status_code == 200:
-            res = response.json()
-            if res.get("code") != 0:
-                logger.error(f"[FeiShu] get tenant_access_token error, code={res.get('code')}, msg={res.get('msg')}")
-                return ""
-            else:
-                return res.get("tenant_access_token")
-        else:
-            logger.error(f"[FeiShu] fetch token error, res={response}")
+        response = http_client.post(url=url, data=data, headers=headers)
+        if response.status_code != 200:
+            raise Exception(f"res={response}")
+        res = response.json()
+        if res.get("code") != 0:
+            raise Exception(f"get tenant_access_token error, code={res.get('code')}, msg={res.get('msg')}")
+        return res.get("tenant_access_token"), res.get("expire", 7200)
 
 
     def _upload_image_url(self, img_url, access_token):
         logger.debug(f"[WX] start download image, img_url={img_url}")
-        response = requests.get(img_url)
+        response = http_client.get(img_url)
         suffix = utils.get_path_suffix(img_url)
         temp_name = str(uuid.uuid4()) + "." + suffix
         if response.status_code == 200:
@@ -138,7 +145,7 @@ class FeiShuChanel(ChatChannel):
             'Authorization': f'Bearer {access_token}',
         }
         with open(temp_name, "rb") as file:
-            upload_response = requests.post(upload_url, files={"image": file}, data=data, headers=headers)
+            upload_response = http_client.post(upload_url, files={"image": file}, data=data, headers=headers)
             logger.info(f"[FeiShu] upload file, res={upload_response.content}")
             os.remove(temp_name)
             return upload_response.json().get("data").get("image_key")
@@ -1,7 +1,7 @@
 from bridge.context import ContextType
 from channel.chat_message import ChatMessage
 import json
-import requests
+from common import http_client
 from common.log import logger
 from common.tmp_dir import TmpDir
 from common import utils
@@ -39,7 +39,7 @@ class FeishuMessage(ChatMessage):
                 params = {
                     "type": "file"
                 }
-                response = requests.get(url=url, headers=headers, params=params)
+                response = http_client.get(url=url, headers=headers, params=params)
                 if response.status_code == 200:
                     with open(self.content, "wb") as f:
                         f.write(response.content)
@@ -1,8 +1,9 @@
 import sys
+import threading
 import time
 import web
 import json
-from queue import Queue
+from queue import Empty, Queue
 from bridge.context import *
 from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel, check_prefix
@@ -31,6 +32,61 @@ class WebMessage(ChatMessage):
         self.other_user_id = other_user_id
 
 
+# 一次发送的最多消息数，队列中积压的消息合并为一次写出
+SSE_BATCH_SIZE = 20
+
+
+class SSEStreams(object):
+    """
+    每个用户的消息队列与SSE连接计数。
+    SSE连接在队列上阻塞等待，等待超时即发送心跳，不再轮询；连接总数超过max_streams时拒绝新连接，
+    避免SSE长连接占满web服务线程，导致发送消息的请求无法处理
+    """
+
+    def __init__(self, max_streams):
+        self.max_streams = max_streams
+        self.queues = {}  # user_id -> Queue
+        self.streams = {}  # user_id -> 该用户打开的连接数
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def get_queue(self, user_id) -> Queue:
+        with self._lock:
+            queue = self.queues.get(user_id)
+            if queue is None:
+                queue = self.queues[user_id] = Queue()
+            return queue
+
+    def open(self, user_id):
+        """打开一个连接，超过上限时返回None"""
+        with self._lock:
+            if self.active >= self.max_streams:
+                return None
+            self.active += 1
+            self.streams[user_id] = self.streams.get(user_id, 0) + 1
+            queue = self.queues.get(user_id)
+            if queue is None:
+                queue = self.queues[user_id] = Queue()
+            return queue
+
+    def close(self, user_id):
+        with self._lock:
+            self.active -= 1
+            count = self.streams.get(user_id, 0) - 1
+            if count > 0:
+                self.streams[user_id] = count
+                return
+            self.streams.pop(user_id, None)
+            # 没有连接且没有未发送的消息时才删除队列
+            queue = self.queues.get(user_id)
+            if queue is not None and queue.empty():
+                del self.queues[user_id]
+
+
+def format_sse_batch(messages):
+    return "".join(f"data: {json.dumps(message)}\n\n" for message in messages)
+
+
 @singleton
 class WebChannel(ChatChannel):
     NOT_SUPPORT_REPLYTYPE = [ReplyType.VOICE]
@@ -43,7 +99,7 @@ class WebChannel(ChatChannel):
 
     def __init__(self):
         super().__init__()
-        self.message_queues = {}  # 为每个用户存储一个消息队列
+        self.sse_streams = SSEStreams(conf().get("web_sse_max_streams", 100))
         self.msg_id_counter = 0  # 添加消息ID计数器
 
     def _generate_msg_id(self):
@@ -64,11 +120,11 @@ class WebChannel(ChatChannel):
             elif reply.type == ReplyType.IMAGE_URL:
                 import io
 
-                import requests
+                from common import http_client
                 from PIL import Image
 
                 img_url = reply.content
-                pic_res = requests.get(img_url, stream=True)
+                pic_res = http_client.get(img_url, stream=True)
                 image_storage = io.BytesIO()
                 for block in pic_res.iter_content(1024):
                     image_storage.write(block)
@@ -82,17 +138,13 @@ class WebChannel(ChatChannel):
             # 获取用户ID，如果没有则使用默认值
             # user_id = getattr(context.get("session", None), "session_id", "default_user")
             user_id = context["receiver"]
-            # 确保用户有对应的消息队列
-            if user_id not in self.message_queues:
-                self.message_queues[user_id] = Queue()
-                
-            # 将消息放入对应用户的队列
+            # 将消息放入对应用户的队列，等待中的SSE连接会立即被唤醒
             message_data = {
                 "type": str(reply.type),
                 "content": reply.content,
                 "timestamp": time.time()
             }
-            self.message_queues[user_id].put(message_data)
+            self.sse_streams.get_queue(user_id).put(message_data)
             logger.debug(f"Message queued for user {user_id}")
             
         except Exception as e:
@@ -106,31 +158,36 @@ class WebChannel(ChatChannel):
         web.header('Content-Type', 'text/event-stream')
         web.header('Cache-Control', 'no-cache')
         web.header('Connection', 'keep-alive')
-        
-        # 确保用户有消息队列
-        if user_id not in self.message_queues:
-            self.message_queues[user_id] = Queue()
-        
-        try:    
+
+        queue = self.sse_streams.open(user_id)
+        if queue is None:
+            # 连接数已满，让浏览器稍后重连
+            logger.warning(f"[WEB] too many SSE streams, reject {user_id}")
+            yield "retry: 5000\n\n"
+            return
+
+        heartbeat = conf().get("web_sse_heartbeat", 15)
+        try:
+            yield ": connected\n\n"
             while True:
                 try:
-                    # 发送心跳
-                    yield f": heartbeat\n\n"
-                    
-                    # 非阻塞方式获取消息
-                    if not self.message_queues[user_id].empty():
-                        message = self.message_queues[user_id].get_nowait()
-                        yield f"data: {json.dumps(message)}\n\n"
-                    time.sleep(0.5)
-                except Exception as e:
-                    logger.error(f"SSE Error: {e}")
-                    break
+                    # 阻塞等待消息，超时则发送心跳
+                    message = queue.get(timeout=heartbeat)
+                except Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                # 合并队列中积压的消息一起发送
+                messages = [message]
+                while len(messages) < SSE_BATCH_SIZE:
+                    try:
+                        messages.append(queue.get_nowait())
+                    except Empty:
+                        break
+                yield format_sse_batch(messages)
+        except Exception as e:
+            logger.error(f"SSE Error: {e}")
         finally:
-            # 清理资源
-            if user_id in self.message_queues:
-                # 只有当队列为空时才删除
-                if self.message_queues[user_id].empty():
-                    del self.message_queues[user_id]
+            self.sse_streams.close(user_id)
 
     def post_message(self):
         """
@@ -186,7 +243,14 @@ class WebChannel(ChatChannel):
         )
         port = conf().get("web_port", 9899)
         app = web.application(urls, globals(), autoreload=False)
-        web.httpserver.runsimple(app.wsgifunc(), ("0.0.0.0", port))
+        # 每个SSE连接占用一个线程，在SSE连接数上限之外预留处理其他请求的线程
+        from cheroot import wsgi
+
+        server = wsgi.Server(("0.0.0.0", port), app.wsgifunc(), numthreads=self.sse_streams.max_streams + 10, server_name="localhost")
+        try:
+            server.start()
+        except (KeyboardInterrupt, SystemExit):
+            server.stop()
 
 
 class SSEHandler:
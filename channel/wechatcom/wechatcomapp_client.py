@@ -1,21 +1,26 @@
-import threading
-import time
-
 from wechatpy.enterprise import WeChatClient
 
+from common import http_client
+from common.credential_cache import credential_key, get_credential_cache
+
 
 class WechatComAppClient(WeChatClient):
     def __init__(self, corp_id, secret, access_token=None, session=None, timeout=None, auto_retry=True):
         super(WechatComAppClient, self).__init__(corp_id, secret, access_token, session, timeout, auto_retry)
-        self.fetch_access_token_lock = threading.Lock()
+        self.credential_key = credential_key("wechatcom", corp_id, secret)
+        if session is None:  # 使用共享连接池
+            self._http = http_client.get_session(getattr(self, "API_BASE_URL", "https://qyapi.weixin.qq.com/cgi-bin/"))
+
+    @property
+    def access_token(self):  # 重载父类属性，access token保存在共享的凭证缓存中，过期前在后台提前刷新
+        access_token = get_credential_cache().get(self.credential_key, self._fetch_credential)
+        self.session.set(self.access_token_key, access_token)
+        return access_token
+
+    def fetch_access_token(self):  # 重载父类方法，接口返回token失效时调用，多个线程同时发现失效时只重新获取一次
+        get_credential_cache().invalidate(self.credential_key, self.session.get(self.access_token_key))
+        return self.access_token
 
-    def fetch_access_token(self):  # 重载父类方法，加锁避免多线程重复获取access_token
-        with self.fetch_access_token_lock:
-            access_token = self.session.get(self.access_token_key)
-            if access_token:
-                if not self.expires_at:
-                    return access_token
-                timestamp = time.time()
-                if self.expires_at - timestamp > 60:
-                    return access_token
-            return super().fetch_access_token()
+    def _fetch_credential(self):
+        result = super().fetch_access_token()
+        return result["access_token"], result.get("expires_in", 7200)
@@ -4,7 +4,7 @@ import json
 import os
 import time
 
-import requests
+from common import http_client
 import web
 from wechatpy.enterprise import create_reply, parse_message
 from wechatpy.enterprise.crypto import WeChatCrypto
@@ -110,7 +110,7 @@ class WechatComServiceChannel(ChatChannel):
             logger.info("[wechatcs] sendVoice={}, receiver={}".format(reply.content, receiver))
         elif reply.type == ReplyType.IMAGE_URL:  # 从网络下载图片
             img_url = reply.content
-            pic_res = requests.get(img_url, stream=True)
+            pic_res = http_client.get(img_url, stream=True)
             image_storage = io.BytesIO()
             for block in pic_res.iter_content(1024):
                 image_storage.write(block)
@@ -178,7 +178,7 @@ class WechatComServiceChannel(ChatChannel):
                 logger.error("Invalid JSON format in reply.content")
 
     def send_text_message(self, external_userid, open_kfid, content, msgid=None):
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/send_msg?access_token={self.client.fetch_access_token()}"
+        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/send_msg?access_token={self.client.access_token}"
         data = {
             "touser": external_userid,
             "open_kfid": open_kfid,
@@ -188,11 +188,11 @@ class WechatComServiceChannel(ChatChannel):
         if msgid:
             data["msgid"] = msgid
 
-        response = requests.post(url, json=data)
+        response = http_client.post(url, json=data)
         return response.json()
 
     def send_image_message(self, external_userid, open_kfid, msgid=None, media_id=None):
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/send_msg?access_token={self.client.fetch_access_token()}"
+        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/send_msg?access_token={self.client.access_token}"
         data = {
             "touser": external_userid,
             "open_kfid": open_kfid,
@@ -202,7 +202,7 @@ class WechatComServiceChannel(ChatChannel):
         if msgid:
             data["msgid"] = msgid
 
-        response = requests.post(url, json=data).json()
+        response = http_client.post(url, json=data).json()
         if response['errmsg'] == 'ok':
             print(f"Send IMAGE Message Success")
         else:
@@ -210,7 +210,7 @@ class WechatComServiceChannel(ChatChannel):
         return response
 
     def send_voice_message(self, external_userid, open_kfid, media_id, msgid=None):
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/send_msg?access_token={self.client.fetch_access_token()}"
+        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/send_msg?access_token={self.client.access_token}"
         data = {
             "touser": external_userid,
             "open_kfid": open_kfid,
@@ -220,7 +220,7 @@ class WechatComServiceChannel(ChatChannel):
         if msgid:
             data["msgid"] = msgid
 
-        response = requests.post(url, json=data).json()
+        response = http_client.post(url, json=data).json()
         if response['errmsg'] == 'ok':
             print(f"Send VOICE Message Success")
         else:
@@ -239,8 +239,8 @@ class WechatComServiceChannel(ChatChannel):
         if msgid:
             data["msgid"] = msgid
         # 发送图文链接消息
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/send_msg?access_token={self.client.fetch_access_token()}"
-        response = requests.post(url, json=data).json()
+        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/send_msg?access_token={self.client.access_token}"
+        response = http_client.post(url, json=data).json()
         if response['errmsg'] == 'ok':
             print("Send LINK Message Success")
         else:
@@ -248,8 +248,7 @@ class WechatComServiceChannel(ChatChannel):
         return response
 
     def get_latest_message(self, token, open_kfid, next_cursor=""):
-        logger.debug(f"self.client.fetch_access_token():{self.client.fetch_access_token()}")
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/sync_msg?access_token={self.client.fetch_access_token()}"
+        url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/sync_msg?access_token={self.client.access_token}"
         data = {
             "token": token,
             "open_kfid": open_kfid,
@@ -258,7 +257,7 @@ class WechatComServiceChannel(ChatChannel):
         if next_cursor:
             data["cursor"] = next_cursor
 
-        response = requests.post(url, json=data)
+        response = http_client.post(url, json=data)
         response_data = response.json()
         # if response_data["errcode"] == 0 and response_data["msg_list"]:
         #     return response_data["msg_list"][-1]  # 返回最新的一条消息
@@ -1,31 +1,25 @@
-import threading
-import time
-import requests
-import time
+from common import http_client
 from wechatpy.enterprise import WeChatClient
+from common.credential_cache import credential_key, get_credential_cache
 from config import conf
 
 
 class WeChatTokenManager:
+    """与WechatComAppClient共用凭证缓存中的access token"""
+
     def __init__(self):
-        self.access_token = None
-        self.expires_at = 0
+        self.corpid = conf().get("wechatcom_corp_id")
+        self.corpsecret = conf().get("wechatcomapp_secret")
+        self.credential_key = credential_key("wechatcom", self.corpid, self.corpsecret)
 
     def get_token(self):
-        current_time = time.time()
-        if self.access_token and self.expires_at - current_time > 60:
-            return self.access_token
-
-        corpid = conf().get("wechatcom_corp_id")
-        corpsecret = conf().get("wechatcomapp_secret")
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corpid}&corpsecret={corpsecret}"
+        return get_credential_cache().get(self.credential_key, self._fetch_token)
 
-        response = requests.get(url).json()
+    def _fetch_token(self):
+        url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={self.corpid}&corpsecret={self.corpsecret}"
+        response = http_client.get(url, timeout=30).json()
         if 'access_token' in response:
-            self.access_token = response['access_token']
-            self.expires_at = current_time + response['expires_in'] - 60
-            print(f'access_token:{self.access_token}')
-            return self.access_token
+            return response['access_token'], response['expires_in']
         else:
             raise Exception("Failed to retrieve access token")
 
@@ -51,9 +45,7 @@ class WechatComServiceClient(WeChatClient):
     def __init__(self, corp_id, secret, access_token=None, session=None, timeout=None, auto_retry=True):
         super(WechatComServiceClient, self).__init__(corp_id, secret, access_token, session, timeout, auto_retry)
         self.token_manager = WeChatTokenManager()
-        self.fetch_access_token_lock = threading.Lock()
 
     def fetch_access_token(self):
-        with self.fetch_access_token_lock:
-            return self.token_manager.get_token()
+        return self.token_manager.get_token()
 
@@ -3,10 +3,9 @@ import asyncio
 import imghdr
 import io
 import os
-import threading
 import time
 
-import requests
+from common import http_client
 import web
 from wechatpy.crypto import WeChatCrypto
 from wechatpy.exceptions import WeChatClientException
@@ -17,6 +16,7 @@ from bridge.reply import *
 from channel.chat_channel import ChatChannel
 from channel.wechatmp.common import *
 from channel.wechatmp.wechatmp_client import WechatMPClient
+from common.async_loop import get_event_loop
 from common.log import logger
 from common.singleton import singleton
 from common.utils import split_string_by_utf8_length, remove_markdown_symbol
@@ -53,10 +53,8 @@ class WechatMPChannel(ChatChannel):
             # Count the request from wechat official server by message_id
             self.request_cnt = dict()
             # The permanent media need to be deleted to avoid media number limit
-            self.delete_media_loop = asyncio.new_event_loop()
-            t = threading.Thread(target=self.start_loop, args=(self.delete_media_loop,))
-            t.setDaemon(True)
-            t.start()
+            # 使用进程内共享的后台事件循环，不再单独启动线程
+            self.delete_media_loop = get_event_loop()
 
     def startup(self):
         if self.passive_reply:
@@ -67,14 +65,11 @@ class WechatMPChannel(ChatChannel):
         port = conf().get("wechatmp_port", 8080)
         web.httpserver.runsimple(app.wsgifunc(), ("0.0.0.0", port))
 
-    def start_loop(self, loop):
-        asyncio.set_event_loop(loop)
-        loop.run_forever()
-
     async def delete_media(self, media_id):
         logger.debug("[wechatmp] permanent media {} will be deleted in 10s".format(media_id))
         await asyncio.sleep(10)
-        self.client.material.delete(media_id)
+        # 删除素材是阻塞的http请求，放到线程池中执行，不阻塞共享的事件循环
+        await asyncio.get_running_loop().run_in_executor(None, self.client.material.delete, media_id)
         logger.info("[wechatmp] permanent media {} has been deleted".format(media_id))
 
     def send(self, reply: Reply, context: Context):
@@ -108,7 +103,7 @@ class WechatMPChannel(ChatChannel):
 
             elif reply.type == ReplyType.IMAGE_URL:  # 从网络下载图片
                 img_url = reply.content
-                pic_res = requests.get(img_url, stream=True)
+                pic_res = http_client.get(img_url, stream=True)
                 image_storage = io.BytesIO()
                 for block in pic_res.iter_content(1024):
                     image_storage.write(block)
@@ -142,7 +137,7 @@ class WechatMPChannel(ChatChannel):
                 self.cache_dict[receiver].append(("image", media_id))
             elif reply.type == ReplyType.VIDEO_URL:  # 从网络下载视频
                 video_url = reply.content
-                video_res = requests.get(video_url, stream=True)
+                video_res = http_client.get(video_url, stream=True)
                 video_storage = io.BytesIO()
                 for block in video_res.iter_content(1024):
                     video_storage.write(block)
@@ -228,7 +223,7 @@ class WechatMPChannel(ChatChannel):
                 logger.info("[wechatmp] Do send voice to {}".format(receiver))
             elif reply.type == ReplyType.IMAGE_URL:  # 从网络下载图片
                 img_url = reply.content
-                pic_res = requests.get(img_url, stream=True)
+                pic_res = http_client.get(img_url, stream=True)
                 image_storage = io.BytesIO()
                 for block in pic_res.iter_content(1024):
                     image_storage.write(block)
@@ -260,7 +255,7 @@ class WechatMPChannel(ChatChannel):
                 logger.info("[wechatmp] Do send image to {}".format(receiver))
             elif reply.type == ReplyType.VIDEO_URL:  # 从网络下载视频
                 video_url = reply.content
-                video_res = requests.get(video_url, stream=True)
+                video_res = http_client.get(video_url, stream=True)
                 video_storage = io.BytesIO()
                 for block in video_res.iter_content(1024):
                     video_storage.write(block)
@@ -5,13 +5,14 @@ from wechatpy.client import WeChatClient
 from wechatpy.exceptions import APILimitedException
 
 from channel.wechatmp.common import *
+from common.credential_cache import credential_key, get_credential_cache
 from common.log import logger
 
 
 class WechatMPClient(WeChatClient):
     def __init__(self, appid, secret, access_token=None, session=None, timeout=None, auto_retry=True):
         super(WechatMPClient, self).__init__(appid, secret, access_token, session, timeout, auto_retry)
-        self.fetch_access_token_lock = threading.Lock()
+        self.credential_key = credential_key("wechatmp", appid, secret)
         self.clear_quota_lock = threading.Lock()
         self.last_clear_quota_time = -1
 
@@ -21,16 +22,19 @@ class WechatMPClient(WeChatClient):
     def clear_quota_v2(self):
         return self.post("clear_quota/v2", params={"appid": self.appid, "appsecret": self.secret})
 
-    def fetch_access_token(self):  # 重载父类方法，加锁避免多线程重复获取access_token
-        with self.fetch_access_token_lock:
-            access_token = self.session.get(self.access_token_key)
-            if access_token:
-                if not self.expires_at:
-                    return access_token
-                timestamp = time.time()
-                if self.expires_at - timestamp > 60:
-                    return access_token
-            return super().fetch_access_token()
+    @property
+    def access_token(self):  # 重载父类属性，access token保存在共享的凭证缓存中，过期前在后台提前刷新
+        access_token = get_credential_cache().get(self.credential_key, self._fetch_credential)
+        self.session.set(self.access_token_key, access_token)
+        return access_token
+
+    def fetch_access_token(self):  # 重载父类方法，接口返回token失效时调用，多个线程同时发现失效时只重新获取一次
+        get_credential_cache().invalidate(self.credential_key, self.session.get(self.access_token_key))
+        return self.access_token
+
+    def _fetch_credential(self):
+        result = super().fetch_access_token()
+        return result["access_token"], result.get("expires_in", 7200)
 
     def _request(self, method, url_or_endpoint, **kwargs):  # 重载父类方法，遇到API限流时，清除quota后重试
         try:
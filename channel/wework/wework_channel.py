@@ -5,7 +5,7 @@ import tempfile
 import threading
 os.environ['ntwork_LOG'] = "ERROR"
 import ntwork
-import requests
+from common import http_client
 import uuid
 
 from bridge.context import *
@@ -39,7 +39,7 @@ def download_and_compress_image(url, filename, quality=30):
         os.makedirs(directory)
 
     # 下载图片
-    pic_res = requests.get(url, stream=True)
+    pic_res = http_client.get(url, stream=True)
     image_storage = io.BytesIO()
     for block in pic_res.iter_content(1024):
         image_storage.write(block)
@@ -70,7 +70,7 @@ def download_video(url, filename):
         os.makedirs(directory)
 
     # 下载视频
-    response = requests.get(url, stream=True)
+    response = http_client.get(url, stream=True)
     total_size = 0
 
     video_path = os.path.join(directory, f"{filename}.mp4")
@@ -1,10 +1,10 @@
-import os
+import hmac
 import time
 import json
+import secrets
 import threading
 import uuid
-import base64
-import requests
+from common import http_client
 import tempfile
 import urllib.request
 from pydub import AudioSegment
@@ -15,21 +15,36 @@ from PIL import Image
 import io
 import qrcode
 import sys
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import web
 
 from bridge.context import Context, ContextType
 from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel
 from channel.xbot.gewechat_message import XBotMessage
+from common.bot_identity import ROBOT_STAT_PATH, get_bot_wxid
+from common.expired_dict import ExpiredDict
+from common.handler_pool import HandlerPool
 from common.log import logger
 from common.singleton import singleton
 from common.tmp_dir import TmpDir
 from config import conf, save_config
+from lib.xbot.api.login_api import LoginApi
 from lib.xbot.client import XBotClient
-from voice.audio_convert import mp3_to_silk
+from lib.xbot.util.media_body import MediaField, MediaJsonBody
+from voice.audio_convert import amr_duration_ms, mp3_to_silk
+from voice.transcoder import get_transcoder
 
 MAX_UTF8_LEN = 2048
-ROBOT_STAT_PATH = os.path.join(os.path.dirname(__file__), '../../resource/robot_stat.json')
-ROBOT_STAT_PATH = os.path.abspath(ROBOT_STAT_PATH)
+# 上传媒体的接口耗时和文件大小有关，单独设置超时时间(连接超时, 读取超时)
+MEDIA_UPLOAD_TIMEOUTS = {
+    "/Msg/UploadImg": (10, 60),
+    "/Msg/SendVoice": (10, 60),
+    "/Msg/SendVideo": (10, 300),
+}
+# 同步接口返回中可能存放消息列表的字段
+SYNC_MSG_KEYS = ["AddMsgs", "MsgList", "List", "Messages"]
 
 @singleton
 class XBotChannel(ChatChannel):
@@ -39,16 +54,68 @@ class XBotChannel(ChatChannel):
         super().__init__()
         self.base_url = conf().get("xbot_base_url")
         self.client = XBotClient(self.base_url)
+        for path, timeout in MEDIA_UPLOAD_TIMEOUTS.items():
+            http_client.set_endpoint_policy(self.client.base_url + path, timeout=timeout)
         self.robot_stat = None
         self.wxid = None
         self.device_id = None
         self.device_name = None
+        self.synckey = ""
+        self.callback_token = None
+        # 消息解析与构造上下文在单独的线程中按顺序执行，不阻塞下一次同步
+        self.receive_pool = HandlerPool("xbot_receive", max_workers=1)
+        # 回调重试或synckey重置时可能收到重复消息
+        self.received_msgs = ExpiredDict(conf().get("expires_in_seconds", 3600))
         logger.info(f"[xbot] init: base_url: {self.base_url}")
 
     def startup(self):
         self._ensure_login()
         logger.info(f"[xbot] channel startup, wxid: {self.wxid}")
-        threading.Thread(target=self._sync_message_loop, daemon=True).start()
+        callback_url = conf().get("xbot_callback_url")
+        if callback_url:
+            self.callback_token = conf().get("xbot_callback_token") or secrets.token_urlsafe(16)
+            self._register_callback(self._signed_callback_url(callback_url))
+            self._start_callback_server(callback_url)
+        else:
+            threading.Thread(target=self._sync_message_loop, daemon=True).start()
+
+    def _signed_callback_url(self, callback_url):
+        """在回调地址的查询参数中加上token，xbot服务端推送时原样带回"""
+        parts = urlsplit(callback_url)
+        query = parse_qsl(parts.query)
+        query.append(("token", self.callback_token))
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    def _check_callback_token(self, token):
+        """校验回调请求携带的token，未启用回调或token不一致时拒绝"""
+        if not self.callback_token or not token:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.callback_token.encode("utf-8"))
+
+    def _register_callback(self, callback_url):
+        """把回调地址设置到xbot服务端，失败时需要在xbot服务端手动配置回调地址"""
+        token = conf().get("xbot_token")
+        if token:
+            try:
+                LoginApi(self.base_url, token).set_callback(token, callback_url)
+                logger.info("[xbot] 回调地址设置成功")
+                return
+            except Exception as e:
+                logger.warning(f"[xbot] 回调地址设置失败: {e}")
+        logger.warning(f"[xbot] 未能自动设置回调地址，请在xbot服务端手动将消息回调地址配置为 {callback_url}")
+
+    def _start_callback_server(self, callback_url):
+        """
+        回调模式：由xbot服务端把新消息POST到xbot_callback_url，不再轮询同步接口。
+        默认只监听127.0.0.1，不带正确token的请求会被拒绝。
+        """
+        path = urlsplit(callback_url).path.rstrip("/") or "/xbot/callback"
+        urls = (path + "/?", "channel.xbot.gewechat_channel.Query")
+        app = web.application(urls, globals(), autoreload=False)
+        host = conf().get("xbot_callback_host", "127.0.0.1")
+        port = conf().get("xbot_callback_port", 9919)
+        logger.info(f"[xbot] start callback server on {host}:{port}, path {path}")
+        web.httpserver.runsimple(app.wsgifunc(), (host, port))
 
     def _ensure_login(self):
         stat = XBotClient.load_robot_stat(ROBOT_STAT_PATH)
@@ -119,28 +186,90 @@ class XBotChannel(ChatChannel):
             time.sleep(1)
         raise Exception("扫码超时，请重启程序重试")
 
+    @classmethod
+    def _extract_messages(cls, data):
+        """从同步接口或回调的数据中取出消息列表"""
+        if isinstance(data, list):
+            return data
+        if not isinstance(data, dict):
+            return []
+        inner = data.get("Data")
+        if isinstance(inner, dict) and (inner.get("MsgId") or inner.get("NewMsgId")):
+            return [data]  # 回调推送的单条消息，保留外层的Wxid等字段
+        if isinstance(inner, (dict, list)):
+            return cls._extract_messages(inner)
+        for key in SYNC_MSG_KEYS:
+            if isinstance(data.get(key), list):
+                return data[key]
+        if data.get("MsgId") or data.get("NewMsgId"):  # 单条消息
+            return [data]
+        return []
+
+    @staticmethod
+    def _extract_synckey(data):
+        """取出下一次同步使用的synckey，没有则返回None"""
+        for key in ["KeyBuf", "Synckey", "SyncKey"]:
+            value = data.get(key)
+            if isinstance(value, dict):
+                value = value.get("buffer") or value.get("Buffer")
+            if value:
+                return value
+        return None
+
     def _sync_message_loop(self):
+        """
+        自适应同步：收到消息后立即再次同步，空闲时等待间隔从xbot_sync_min_interval
+        按倍数增长到xbot_sync_max_interval，出错时同样退避，避免空闲时每秒几十次请求。
+        """
+        min_interval = conf().get("xbot_sync_min_interval", 0.1)
+        max_interval = conf().get("xbot_sync_max_interval", 2)
+        interval = 0
         while True:
+            interval = self._next_sync_interval(interval, self._sync_once(), min_interval, max_interval)
+            if interval:
+                time.sleep(interval)
+
+    @staticmethod
+    def _next_sync_interval(interval, received, min_interval, max_interval):
+        """收到消息时不等待，否则等待间隔翻倍，范围在[min_interval, max_interval]"""
+        if received:
+            return 0
+        return min(max(interval * 2, min_interval), max_interval)
+
+    def _sync_once(self):
+        """同步一次消息并提交到接收线程，收到消息时返回True"""
+        try:
+            resp = self.client.sync_message(self.wxid, self.device_id, self.device_name, synckey=self.synckey)
+            if isinstance(resp, dict) and resp.get("Data"):
+                data = resp["Data"]
+                synckey = self._extract_synckey(data) if isinstance(data, dict) else None
+                if synckey:
+                    self.synckey = synckey
+                msgs = self._extract_messages(data)
+                if msgs:
+                    self.receive_pool.submit(self._handle_messages, msgs)
+                    return True
+            else:
+                logger.error(f"[xbot] 消息同步返回异常: {resp}")
+        except Exception as e:
+            logger.error(f"[xbot] 消息同步异常: {e}")
+        return False
+
+    def _handle_messages(self, msgs):
+        for msg in msgs:
             try:
-                resp = self.client.sync_message(self.wxid, self.device_id, self.device_name)
-                if isinstance(resp, dict) and resp.get("Data"):
-                    data = resp["Data"]
-                    msgs = []
-                    for key in ["AddMsgs", "MsgList", "List", "Messages"]:
-                        if key in data and isinstance(data[key], list):
-                            msgs = data[key]
-                            break
-                    if msgs:
-                        for msg in msgs:
-                            self._handle_message(msg)
-                    # 没有消息时直接跳过
-                else:
-                    logger.error(f"[xbot] 消息同步返回异常: {resp}")
+                self._handle_message(msg)
             except Exception as e:
-                logger.error(f"[xbot] 消息同步异常: {e}")
-            time.sleep(0.05)
+                logger.exception(f"[xbot] 处理消息异常: {e}")
 
     def _handle_message(self, msg):
+        msg_data = msg.get("Data") if isinstance(msg, dict) and isinstance(msg.get("Data"), dict) else msg
+        msg_id = (msg_data.get("NewMsgId") or msg_data.get("MsgId")) if isinstance(msg_data, dict) else None
+        if msg_id:
+            if msg_id in self.received_msgs:
+                logger.debug(f"[xbot] ignore duplicate message {msg_id}")
+                return
+            self.received_msgs[msg_id] = True
         xmsg = XBotMessage(msg)
         # 新增：过滤非用户消息（如 weixin、公众号、系统号等）
         if xmsg._is_non_user_message(xmsg.msg_source, xmsg.from_user_id):
@@ -187,13 +316,10 @@ class XBotChannel(ChatChannel):
             elif reply.type == ReplyType.IMAGE:
                 # 获取 api_base_url 和 bot_wxid
                 api_base_url = conf().get("xbot_base_url") or conf().get("gewechat_base_url")
-                # 优先从 resource/robot_stat.json 读取 bot_wxid
+                # 优先使用 resource/robot_stat.json 中的 bot_wxid(进程内缓存)
                 bot_wxid = None
                 try:
-                    resource_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../resource/robot_stat.json'))
-                    with open(resource_path, "r", encoding="utf-8") as f:
-                        stat = json.load(f)
-                        bot_wxid = stat.get("wxid")
+                    bot_wxid = get_bot_wxid()
                 except Exception as e:
                     logger.error(f"[send_image] 读取robot_stat.json失败: {e}")
                 to_wxid = context.get("receiver") or context.get("group_name")
@@ -207,7 +333,6 @@ class XBotChannel(ChatChannel):
                 # 语音消息
                 try:
                     import os
-                    import base64
                     import subprocess
                     import tempfile
                     
@@ -220,47 +345,18 @@ class XBotChannel(ChatChannel):
                     file_ext = os.path.splitext(voice_file)[1].lower().replace('.', '')
                     logger.info(f"[xbot] 语音文件格式: {file_ext}, 大小: {os.path.getsize(voice_file)}字节")
                     
-                    # 对于MP3格式，先转换为AMR格式再发送
+                    # 对于MP3格式，先转换为AMR格式再发送，转码在转码线程池中通过管道完成，结果保存在内存中
                     final_voice_file = voice_file
-                    converted_file = None
+                    amr_data = None
                     voice_format = 0  # 默认使用AMR格式
                     
                     if file_ext == 'mp3':
                         try:
-                            # 创建临时AMR文件
-                            fd, amr_file = tempfile.mkstemp(suffix='.amr')
-                            os.close(fd)
-                            
-                            # 使用ffmpeg转换为AMR
-                            cmd = [
-                                "ffmpeg", 
-                                "-y",          # 覆盖输出
-                                "-i", voice_file,  # 输入文件
-                                "-ar", "8000",  # 采样率
-                                "-ab", "12.2k",  # 比特率
-                                "-ac", "1",    # 单声道
-                                amr_file       # 输出文件
-                            ]
-                            
-                            process = subprocess.run(
-                                cmd, 
-                                stdout=subprocess.PIPE, 
-                                stderr=subprocess.PIPE, 
-                                text=True, 
-                                check=False
-                            )
-                            
-                            if process.returncode == 0 and os.path.exists(amr_file) and os.path.getsize(amr_file) > 0:
-                                logger.info(f"[xbot] MP3转换为AMR成功: {amr_file}, 大小: {os.path.getsize(amr_file)}字节")
-                                final_voice_file = amr_file
-                                converted_file = amr_file
-                                voice_format = 0  # AMR格式
-                            else:
-                                logger.warning(f"[xbot] MP3转换为AMR失败: {process.stderr}")
-                                # 转换失败时仍使用原始MP3
-                                voice_format = 2  # MP3格式
+                            amr_data = get_transcoder().transcode(voice_file, "amr", sample_rate=8000, channels=1, bitrate="12.2k")
+                            logger.info(f"[xbot] MP3转换为AMR成功, 大小: {len(amr_data)}字节")
+                            voice_format = 0  # AMR格式
                         except Exception as e:
-                            logger.warning(f"[xbot] MP3转换为AMR异常: {e}")
+                            logger.warning(f"[xbot] MP3转换为AMR失败: {e}")
                             voice_format = 2  # 失败时使用MP3格式
                     elif file_ext == 'amr':
                         voice_format = 0  # AMR格式
@@ -269,21 +365,20 @@ class XBotChannel(ChatChannel):
                     else:
                         voice_format = 2  # 默认按MP3处理
                         
-                    # 读取语音文件
-                    with open(final_voice_file, "rb") as f:
-                        voice_byte = f.read()
-                        voice_base64 = base64.b64encode(voice_byte).decode()
-                    
                     # 获取音频时长 - 尝试多种方法
                     voice_time = None
                     
-                    # 方法1：尝试使用pydub获取时长
-                    try:
-                        audio = AudioSegment.from_file(final_voice_file)
-                        voice_time = len(audio)  # 毫秒
-                        logger.info(f"[xbot] 使用pydub获取音频时长: {voice_time}毫秒")
-                    except Exception as e:
-                        logger.warning(f"[xbot] 使用pydub获取音频时长失败: {e}")
+                    # 方法1：转码得到的AMR按帧数计算，其他尝试使用pydub获取时长
+                    if amr_data is not None:
+                        voice_time = amr_duration_ms(amr_data)
+                        logger.info(f"[xbot] 按AMR帧数计算音频时长: {voice_time}毫秒")
+                    else:
+                        try:
+                            audio = AudioSegment.from_file(final_voice_file)
+                            voice_time = len(audio)  # 毫秒
+                            logger.info(f"[xbot] 使用pydub获取音频时长: {voice_time}毫秒")
+                        except Exception as e:
+                            logger.warning(f"[xbot] 使用pydub获取音频时长失败: {e}")
                     
                     # 方法2：尝试使用mutagen获取时长
                     if voice_time is None:
@@ -323,7 +418,7 @@ class XBotChannel(ChatChannel):
                     data = {
                         "Wxid": self.wxid,
                         "ToWxid": receiver,
-                        "Base64": voice_base64,
+                        "Base64": MediaField(amr_data if amr_data is not None else final_voice_file),
                         "Type": voice_format,
                         "VoiceTime": voice_time
                     }
@@ -332,7 +427,7 @@ class XBotChannel(ChatChannel):
                     url = f"{self.base_url.rstrip('/')}/Msg/SendVoice"
                     logger.info(f"[xbot] 发送语音请求: {url}, 接收者={receiver}, 格式={voice_format}")
                     
-                    resp = requests.post(url, json=data, timeout=10)
+                    resp = self._post_media(url, data)
                     success = False
                     
                     if resp.status_code == 200:
@@ -347,7 +442,7 @@ class XBotChannel(ChatChannel):
                                 if voice_format != 0 and file_ext != 'amr':
                                     logger.info(f"[xbot] 尝试以AMR格式重新发送语音")
                                     data["Type"] = 0
-                                    resp = requests.post(url, json=data, timeout=10)
+                                    resp = self._post_media(url, data)
                                     if resp.status_code == 200 and resp.json().get("Success"):
                                         logger.info(f"[xbot] 以AMR格式重新发送成功: {receiver}")
                                         success = True
@@ -358,14 +453,6 @@ class XBotChannel(ChatChannel):
                     else:
                         logger.error(f"[xbot] 语音发送请求失败: 状态码={resp.status_code}, 响应={resp.text[:200]}")
                     
-                    # 清理临时文件
-                    if converted_file and os.path.exists(converted_file):
-                        try:
-                            os.remove(converted_file)
-                            logger.info(f"[xbot] 已清理临时转换文件: {converted_file}")
-                        except Exception as e:
-                            logger.warning(f"[xbot] 清理临时文件失败: {e}")
-                    
                     # 如果发送失败，发送文字提示
                     if not success:
                         try:
@@ -388,7 +475,6 @@ class XBotChannel(ChatChannel):
                 try:
                     import tempfile
                     import os
-                    import base64
                     
                     video_url = reply.content
                     logger.info(f"[xbot] 开始处理视频URL: {video_url}")
@@ -413,7 +499,7 @@ class XBotChannel(ChatChannel):
                         
                         # 下载视频到临时文件
                         with open(temp_path, 'wb') as f:
-                            response = requests.get(video_url, headers=headers, stream=True, timeout=60)
+                            response = http_client.get(video_url, headers=headers, stream=True, timeout=60)
                             response.raise_for_status()
                             total_size = int(response.headers.get('Content-Length', 0))
                             downloaded = 0
@@ -455,31 +541,29 @@ class XBotChannel(ChatChannel):
                         except Exception as e:
                             logger.warning(f"[xbot] ffprobe获取视频时长失败: {e}")
                         
-                        # 读取视频和缩略图为base64
-                        with open(temp_path, 'rb') as f:
-                            video_base64 = base64.b64encode(f.read()).decode('utf-8')
+                        # 视频和缩略图在发送请求时流式编码为base64
+                        video_field = MediaField(temp_path, "data:video/mp4;base64,")
                         if thumb_path and os.path.exists(thumb_path):
-                            with open(thumb_path, 'rb') as f:
-                                thumb_data = base64.b64encode(f.read()).decode('utf-8')
+                            thumb_field = MediaField(thumb_path, "data:image/jpeg;base64,")
                         else:
-                            thumb_data = ""
+                            thumb_field = "data:image/jpeg;base64,"
                         
-                        logger.info(f"[xbot] 视频Base64大小: {len(video_base64)}, 时长: {video_length}秒")
+                        logger.info(f"[xbot] 视频Base64大小: {len(video_field)}, 时长: {video_length}秒")
                         
                         # 构造请求数据
                         data = {
                             "Wxid": self.wxid,
                             "ToWxid": receiver,
-                            "Base64": "data:video/mp4;base64," + video_base64,
-                            "ImageBase64": "data:image/jpeg;base64," + thumb_data,
+                            "Base64": video_field,
+                            "ImageBase64": thumb_field,
                             "PlayLength": video_length
                         }
                         
                         # 发送请求
                         url = f"{self.base_url.rstrip('/')}/Msg/SendVideo"
-                        logger.info(f"[xbot] 发送视频请求: {url}, 数据大小: {len(video_base64)//1024}KB")
+                        logger.info(f"[xbot] 发送视频请求: {url}, 数据大小: {len(video_field)//1024}KB")
                         
-                        resp = requests.post(url, json=data, timeout=60)  # 增大超时时间
+                        resp = self._post_media(url, data)
                         
                         # 清理临时文件
                         if temp_path and os.path.exists(temp_path):
@@ -591,17 +675,23 @@ class XBotChannel(ChatChannel):
             except Exception as e2:
                 logger.error(f"[xbot] Failed to send error message: {e2}")
 
+    def _post_media(self, url, fields, timeout=None):
+        """
+        发送包含文件的json请求，MediaField字段在发送时流式编码，不把整个文件读入内存
+        未指定timeout时使用MEDIA_UPLOAD_TIMEOUTS中注册的超时时间
+        """
+        headers = {"Content-Type": "application/json"}
+        return http_client.post(url, data=MediaJsonBody(fields), headers=headers, timeout=timeout)
+
     def send_image(self, image_path, to_wxid, bot_wxid, api_base_url):
         try:
-            with open(image_path, "rb") as f:
-                img_b64 = base64.b64encode(f.read()).decode("utf-8")
             payload = {
-                "Base64": img_b64,
+                "Base64": MediaField(image_path),
                 "ToWxid": to_wxid,
                 "Wxid": bot_wxid
             }
             url = api_base_url.rstrip("/") + "/Msg/UploadImg"
-            resp = requests.post(url, json=payload, timeout=10)
+            resp = self._post_media(url, payload)
             logger.info(f"[send_image] POST {url} resp={resp.status_code} {resp.text[:200]}")
             if resp.status_code == 200:
                 return True
@@ -611,3 +701,21 @@ class XBotChannel(ChatChannel):
         except Exception as e:
             logger.error(f"[send_image] 发送图片异常: {e}")
             return False
+
+
+class Query:
+    def POST(self):
+        channel = XBotChannel()
+        token = web.input(_method="get").get("token") or web.ctx.env.get("HTTP_X_CALLBACK_TOKEN")
+        if not channel._check_callback_token(token):
+            logger.warning(f"[xbot] 拒绝token无效的回调请求, ip={web.ctx.ip}")
+            raise web.Forbidden()
+        try:
+            data = json.loads(web.data())
+        except Exception as e:
+            logger.error(f"[xbot] 回调数据解析失败: {e}")
+            return "fail"
+        msgs = channel._extract_messages(data)
+        if msgs:
+            channel.receive_pool.submit(channel._handle_messages, msgs)
+        return "success"
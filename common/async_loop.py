@@ -0,0 +1,51 @@
+"""
+进程内共享的后台asyncio事件循环
+
+在独立的守护线程中运行，普通线程通过run_coroutine提交协程，返回concurrent.futures.Future，
+不必为每次调用创建和销毁事件循环。
+
+    future = run_coroutine(handler(e_context))
+    result = future.result(timeout=10)
+    result = submit(edge_tts_save(text, path), timeout=60)   # 阻塞等待结果，超时时取消协程
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+from common.log import logger
+
+_loop = None
+_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """获取后台事件循环，首次调用时启动"""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=_run_loop, args=(loop,), name="async_loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    logger.debug("[async_loop] started")
+    loop.run_forever()
+
+
+def run_coroutine(coro):
+    """在后台事件循环中执行协程，返回concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def submit(coro, timeout=None):
+    """在后台事件循环中执行协程并等待结果，超时时取消协程并抛出TimeoutError；不能在后台事件循环线程中调用"""
+    future = run_coroutine(coro)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
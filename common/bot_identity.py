@@ -0,0 +1,63 @@
+"""
+机器人登录信息(resource/robot_stat.json)的进程内缓存
+
+发送消息时需要机器人的wxid，原来每次都打开并解析robot_stat.json。
+这里只在首次读取、XBotClient.save_robot_stat写入或文件修改时间变化时重新加载，
+文件修改时间最多每CHECK_INTERVAL秒检查一次。
+"""
+import json
+import os
+import threading
+import time
+
+ROBOT_STAT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../resource/robot_stat.json"))
+# 检查文件修改时间的最小间隔，单位秒
+CHECK_INTERVAL = 1.0
+
+_entries = {}  # path -> {"stat": dict或None, "mtime": 修改时间, "checked_at": 上次检查时间}
+_lock = threading.Lock()
+
+
+def _file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _load(path):
+    mtime = _file_mtime(path)
+    stat = None
+    if mtime is not None:
+        with open(path, "r", encoding="utf-8") as f:
+            stat = json.load(f)
+    return {"stat": stat, "mtime": mtime, "checked_at": time.monotonic()}
+
+
+def get_robot_stat(path=ROBOT_STAT_PATH):
+    """获取机器人登录信息，文件不存在时返回None。返回的dict不要修改"""
+    path = os.path.abspath(path)
+    entry = _entries.get(path)
+    now = time.monotonic()
+    if entry is not None and now - entry["checked_at"] < CHECK_INTERVAL:
+        return entry["stat"]
+    with _lock:
+        entry = _entries.get(path)
+        if entry is None or _file_mtime(path) != entry["mtime"]:
+            entry = _load(path)
+            _entries[path] = entry
+        else:
+            entry["checked_at"] = now
+        return entry["stat"]
+
+
+def get_bot_wxid(path=ROBOT_STAT_PATH):
+    stat = get_robot_stat(path)
+    return stat.get("wxid") if stat else None
+
+
+def update_robot_stat(path, stat):
+    """登录信息已写入文件后调用，直接更新缓存"""
+    path = os.path.abspath(path)
+    with _lock:
+        _entries[path] = {"stat": dict(stat), "mtime": _file_mtime(path), "checked_at": time.monotonic()}
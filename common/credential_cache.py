@@ -0,0 +1,159 @@
+"""
+第三方接口access token等凭证的共享缓存
+
+记录每个凭证的过期时间，过期前credential_refresh_ahead秒内由一个后台线程提前刷新，刷新期间其他调用继续使用旧凭证；
+已过期或还没有凭证时，同一个key只有一个线程去获取，其他线程等待结果(single-flight)。
+凭证保存在<appdata_dir>/credentials.json，重启后未过期的凭证可以继续使用。
+
+    from common.credential_cache import credential_key, get_credential_cache
+
+    def fetch():  # 获取失败时抛出异常
+        res = requests.post(token_url, params=...).json()
+        return res["access_token"], res["expires_in"]
+
+    key = credential_key("baidu_wenxin", api_key, secret_key)
+    token = get_credential_cache().get(key, fetch)
+    get_credential_cache().invalidate(key, token)  # 接口返回token失效时
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from common.log import logger
+from config import conf, get_appdata_dir
+
+# 距离过期不足该秒数时视为已过期，避免请求途中过期
+EXPIRY_MARGIN = 30
+
+
+def credential_key(kind, *parts):
+    """按凭证类型和app id、secret等生成key，secret变化后不会用到旧凭证，文件中也不保存secret"""
+    digest = hashlib.sha1("\0".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return "{}:{}".format(kind, digest[:16])
+
+
+class CredentialCache(object):
+    def __init__(self, path=None, refresh_ahead=300, clock=time.time):
+        self.path = path  # None时不保存到磁盘
+        self.refresh_ahead = refresh_ahead
+        self.clock = clock
+        self._entries = {}  # key -> {"value": 凭证, "fetched_at": 获取时间, "expires_at": 过期时间}
+        self._key_locks = {}  # key -> Lock，同一个key同时只获取一次
+        self._refreshing = set()  # 正在后台刷新的key
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("[credential_cache] load {} failed: {}".format(self.path, e))
+            return
+        now = self.clock()
+        self._entries = {k: v for k, v in entries.items() if v.get("expires_at", 0) > now}
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            with self._lock:
+                data = json.dumps(self._entries, ensure_ascii=False)
+            tmp_path = "{}.{}.tmp".format(self.path, threading.get_ident())
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("[credential_cache] save {} failed: {}".format(self.path, e))
+
+    def _valid(self, entry, now):
+        return entry is not None and now < entry["expires_at"] - EXPIRY_MARGIN
+
+    def _need_refresh(self, entry, now):
+        # 有效期较短的凭证最多提前一半有效期刷新
+        ahead = min(self.refresh_ahead, (entry["expires_at"] - entry["fetched_at"]) / 2)
+        return now >= entry["expires_at"] - EXPIRY_MARGIN - ahead
+
+    def get(self, key, fetcher):
+        """
+        返回key对应的凭证，没有或已过期时调用fetcher获取
+        :param fetcher: 无参数函数，返回(凭证, 有效期秒数)，有效期<=0时不缓存；获取失败时抛出异常，异常会抛给调用者
+        """
+        entry = self._entries.get(key)
+        now = self.clock()
+        if self._valid(entry, now):
+            if self._need_refresh(entry, now):
+                self._refresh_async(key, fetcher)
+            return entry["value"]
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = self._entries.get(key)
+            if self._valid(entry, self.clock()):  # 其他线程刚刚获取过
+                return entry["value"]
+            return self._fetch(key, fetcher)
+
+    def _fetch(self, key, fetcher):
+        fetched_at = self.clock()
+        value, expires_in = fetcher()
+        if not expires_in or expires_in <= 0:
+            return value
+        with self._lock:
+            self._entries[key] = {"value": value, "fetched_at": fetched_at, "expires_at": fetched_at + expires_in}
+        logger.debug("[credential_cache] fetched {}, expires in {}s".format(key, expires_in))
+        self._save()
+        return value
+
+    def _refresh_async(self, key, fetcher):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        def refresh():
+            try:
+                with key_lock:
+                    entry = self._entries.get(key)
+                    if entry is None or self._need_refresh(entry, self.clock()):
+                        self._fetch(key, fetcher)
+            except Exception as e:
+                logger.warning("[credential_cache] refresh {} failed, keep using the old one: {}".format(key, e))
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="credential-refresh", daemon=True).start()
+
+    def invalidate(self, key, value=None):
+        """
+        删除key对应的凭证，下次get时重新获取。
+        传入value时只有缓存中仍是该凭证才删除，多个请求同时发现token失效时只会重新获取一次
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (value is not None and entry["value"] != value):
+                return
+            del self._entries[key]
+        self._save()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_credential_cache() -> CredentialCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CredentialCache(
+                    os.path.join(get_appdata_dir(), "credentials.json"),
+                    conf().get("credential_refresh_ahead", 300),
+                )
+    return _cache
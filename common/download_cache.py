@@ -0,0 +1,187 @@
+"""
+按url缓存下载文件的磁盘缓存
+
+每个url一个目录: <缓存目录>/<url的sha1>/，保存原文件名的文件和记录ETag、Last-Modified的meta.json。
+下载后download_cache_ttl秒内直接使用缓存文件；之后带If-None-Match/If-Modified-Since重新请求，
+服务器返回304时继续使用缓存，请求失败时也退回到缓存文件。总大小超过download_cache_mb时删除最久未使用的文件。
+
+    from common.download_cache import get_download_cache
+    path = get_download_cache().get("https://example.com/manual.pdf")
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+import requests
+
+from common import http_client
+from common.log import logger
+from config import conf, get_appdata_dir
+
+META_NAME = "meta.json"
+CHUNK_SIZE = 64 * 1024
+# 淘汰时跳过最近这段时间内使用过的文件，调用方拿到路径后可能还在发送
+KEEP_RECENT_SECONDS = 10
+
+
+def url_file_name(url):
+    name = os.path.basename(unquote(urlsplit(url).path))
+    return name if name and name != META_NAME else "download"
+
+
+class DownloadCache(object):
+    def __init__(self, dir_path, max_bytes, ttl):
+        self.dir_path = dir_path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._metas = {}  # key -> meta dict
+        self._key_locks = {}  # key -> Lock，同一个url同时只下载一次
+        self._lock = threading.Lock()
+        os.makedirs(dir_path, exist_ok=True)
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _load_meta(self, key):
+        meta = self._metas.get(key)
+        if meta is None:
+            try:
+                with open(os.path.join(self.dir_path, key, META_NAME), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._metas[key] = meta
+        return meta
+
+    def _save_meta(self, key, meta):
+        path = os.path.join(self.dir_path, key, META_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        self._metas[key] = meta
+
+    def _cached_path(self, key, meta):
+        if meta is None:
+            return None
+        path = os.path.join(self.dir_path, key, meta["name"])
+        return path if os.path.exists(path) else None
+
+    def get(self, url, timeout=60) -> str:
+        """返回url对应的本地文件路径，下载失败且没有缓存时抛出requests的异常"""
+        key = self._key(url)
+        meta = self._load_meta(key)
+        path = self._cached_path(key, meta)
+        if path and time.time() - meta["checked_at"] < self.ttl:
+            try:
+                os.utime(path)  # 更新访问时间，淘汰时按最久未使用
+                return path
+            except OSError:  # 刚好被淘汰删除，加锁后重新下载
+                pass
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            meta = self._load_meta(key)
+            path = self._cached_path(key, meta)
+            if path and time.time() - meta["checked_at"] < self.ttl:  # 其他线程刚刚更新过
+                return path
+            return self._fetch(url, key, meta if path else None, timeout)
+
+    def _fetch(self, url, key, meta, timeout):
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            resp = http_client.get(url, headers=headers, stream=True, timeout=timeout)
+        except requests.RequestException as e:
+            if meta:
+                logger.warning("[download_cache] revalidate {} failed, use cached file: {}".format(url, e))
+                return self._cached_path(key, meta)
+            raise
+        with resp:
+            if meta and resp.status_code == 304:
+                path = self._cached_path(key, meta)
+                try:
+                    if path:
+                        os.utime(path)
+                        meta["checked_at"] = time.time()
+                        self._save_meta(key, meta)
+                        return path
+                except OSError:
+                    pass
+                # 确认期间缓存文件被淘汰删除，重新下载
+                return self._fetch(url, key, None, timeout)
+            resp.raise_for_status()
+            entry_dir = os.path.join(self.dir_path, key)
+            os.makedirs(entry_dir, exist_ok=True)
+            name = url_file_name(url)
+            path = os.path.join(entry_dir, name)
+            tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+            try:
+                with open(tmp_path, "wb") as f:
+                    for chunk in resp.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(tmp_path, path)  # 正在读取旧文件的发送不受影响
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._save_meta(key, {
+                "url": url,
+                "name": name,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "checked_at": time.time(),
+            })
+        logger.debug("[download_cache] downloaded {} -> {}".format(url, path))
+        self._prune()
+        return path
+
+    def _prune(self):
+        """缓存总大小超过max_bytes时删除最久未使用的文件"""
+        with self._lock:
+            try:
+                entries = []
+                for key in os.listdir(self.dir_path):
+                    meta = self._load_meta(key)
+                    path = self._cached_path(key, meta)
+                    if not path:
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except OSError:  # 同时被删除
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, key))
+                total = sum(e[1] for e in entries)
+                recent = time.time() - KEEP_RECENT_SECONDS
+                for mtime, size, key in sorted(entries):
+                    if total <= self.max_bytes or mtime > recent:
+                        break
+                    shutil.rmtree(os.path.join(self.dir_path, key), ignore_errors=True)
+                    self._metas.pop(key, None)
+                    total -= size
+            except OSError as e:
+                logger.warning("[download_cache] prune failed: {}".format(e))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_download_cache() -> DownloadCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DownloadCache(
+                    os.path.join(get_appdata_dir(), "download_cache"),
+                    conf().get("download_cache_mb", 256) * 1024 * 1024,
+                    conf().get("download_cache_ttl", 300),
+                )
+    return _cache
@@ -1,22 +1,95 @@
-from datetime import datetime, timedelta
+import heapq
+import itertools
+import threading
+from time import monotonic
 
 
 class ExpiredDict(dict):
-    def __init__(self, expires_in_seconds):
+    """
+    带过期时间的字典，每次读写都会刷新key的过期时间。
+    1. 使用单调时钟，过期时间记录在最小堆中，写入时顺带清理少量已过期的key(均摊)，不再依赖读取来删除。
+    2. 可选max_size，超出时按LRU淘汰最久未访问的key。
+    3. keys()/items()/values()只取一次当前时间，遍历时不修改字典。
+    """
+
+    # 每次写入时最多顺带清理的过期key数量
+    SWEEP_BATCH = 16
+    # 堆中记录数超过key数量的2倍(且不少于该值)时重建堆，丢弃已删除或重新写入的key留下的失效记录
+    COMPACT_MIN = 64
+
+    def __init__(self, expires_in_seconds, max_size=None):
         super().__init__()
         self.expires_in_seconds = expires_in_seconds if expires_in_seconds else 3600
+        self.max_size = max_size
+        self._heap = []  # (堆中记录的过期时间, 序号, key)，堆中时间不会晚于实际过期时间
+        self._counter = itertools.count()
+        self._lock = threading.RLock()
 
-    def __getitem__(self, key):
-        value, expiry_time = super().__getitem__(key)
-        if datetime.now() > expiry_time:
-            del self[key]
+    # 内部存储的值为 [value, expiry_time, 序号]，序号与堆中记录对应，用于识别堆中已失效的记录
+    def _get_entry(self, key, now):
+        entry = super().__getitem__(key)
+        if now >= entry[1]:
+            super().__delitem__(key)
             raise KeyError("expired {}".format(key))
-        self.__setitem__(key, value)
-        return value
+        return entry
+
+    def _touch(self, key, entry, now):
+        entry[1] = now + self.expires_in_seconds
+        if self.max_size:
+            super().__delitem__(key)
+            super().__setitem__(key, entry)
+
+    def _sweep(self, now, limit=None):
+        """清理已过期的key，limit为None时清理全部"""
+        heap = self._heap
+        count = 0
+        while heap and heap[0][0] <= now and (limit is None or count < limit):
+            _, seq, key = heapq.heappop(heap)
+            count += 1
+            entry = super().get(key)
+            if entry is None or entry[2] != seq:  # key已被删除或重新写入，堆中记录已失效
+                continue
+            if now >= entry[1]:
+                super().__delitem__(key)
+            else:  # 过期时间已被刷新，按新的过期时间重新入堆
+                entry[2] = next(self._counter)
+                heapq.heappush(heap, (entry[1], entry[2], key))
+
+    def _maybe_compact(self):
+        size = super().__len__()
+        if len(self._heap) > max(2 * size, self.COMPACT_MIN):
+            self._heap = [(entry[1], entry[2], key) for key, entry in super().items()]
+            heapq.heapify(self._heap)
+
+    def __getitem__(self, key):
+        now = monotonic()
+        with self._lock:
+            entry = self._get_entry(key, now)
+            self._touch(key, entry, now)
+            return entry[0]
 
     def __setitem__(self, key, value):
-        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
-        super().__setitem__(key, (value, expiry_time))
+        now = monotonic()
+        with self._lock:
+            entry = super().get(key)
+            if entry is not None:
+                entry[0] = value
+                self._touch(key, entry, now)
+            else:
+                seq = next(self._counter)
+                expiry_time = now + self.expires_in_seconds
+                super().__setitem__(key, [value, expiry_time, seq])
+                heapq.heappush(self._heap, (expiry_time, seq, key))
+            self._sweep(now, self.SWEEP_BATCH)
+            if self.max_size:
+                while super().__len__() > self.max_size:
+                    super().__delitem__(next(super().__iter__()))  # 淘汰最久未访问的key
+            self._maybe_compact()
+
+    def __delitem__(self, key):
+        with self._lock:
+            super().__delitem__(key)
+            self._maybe_compact()
 
     def get(self, key, default=None):
         try:
@@ -24,6 +97,18 @@ class ExpiredDict(dict):
         except KeyError:
             return default
 
+    def pop(self, key, *default):
+        with self._lock:
+            try:
+                value = self._get_entry(key, monotonic())[0]
+            except KeyError:
+                if default:
+                    return default[0]
+                raise
+            super().__delitem__(key)
+            self._maybe_compact()
+            return value
+
     def __contains__(self, key):
         try:
             self[key]
@@ -31,12 +116,26 @@ class ExpiredDict(dict):
         except KeyError:
             return False
 
-    def keys(self):
-        keys = list(super().keys())
-        return [key for key in keys if key in self]
+    def __len__(self):
+        with self._lock:
+            self._sweep(monotonic())
+            return super().__len__()
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._heap = []
 
     def items(self):
-        return [(key, self[key]) for key in self.keys()]
+        now = monotonic()
+        with self._lock:
+            return [(key, entry[0]) for key, entry in super().items() if now < entry[1]]
+
+    def keys(self):
+        return [key for key, _ in self.items()]
+
+    def values(self):
+        return [value for _, value in self.items()]
 
     def __iter__(self):
         return self.keys().__iter__()
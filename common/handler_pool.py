@@ -0,0 +1,39 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HandlerPool(ThreadPoolExecutor):
+    """带运行状态统计的线程池，每个处理通道(lane)一个，便于观察消息在哪里排队"""
+
+    def __init__(self, name, max_workers):
+        super().__init__(max_workers=max_workers, thread_name_prefix=f"handler_{name}")
+        self.name = name
+        self._active = 0
+        self._active_lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn, *args, **kwargs):
+        with self._active_lock:
+            self._active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._active_lock:
+                self._active -= 1
+
+    def queue_depth(self):
+        """已提交但还未开始执行的任务数"""
+        return self._work_queue.qsize()
+
+    def active_count(self):
+        """正在执行任务的线程数"""
+        return self._active
+
+    def stats(self):
+        return {
+            "max_workers": self._max_workers,
+            "queue_depth": self.queue_depth(),
+            "active": self.active_count(),
+        }
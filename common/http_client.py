@@ -0,0 +1,184 @@
+"""
+共享的HTTP连接池
+
+每个 scheme://host:port 复用一个 requests.Session，保持长连接，避免每次请求都重新建立TCP+TLS连接。
+Session不保存cookie，需要cookie的调用方通过cookies参数或headers自行传入。
+连接池大小、默认超时从配置读取，可以按url前缀设置超时与重试策略:
+
+    from common import http_client
+    http_client.set_endpoint_policy("https://api.example.com/v1/upload", timeout=120, retries=2, backoff=1)
+    resp = http_client.post("https://api.example.com/v1/chat", json=data)
+
+也可以在配置文件的http_endpoint_policies中设置，配置文件中的策略优先于代码中注册的默认策略:
+
+    "http_endpoint_policies": {"https://api.example.com/v1/upload": {"timeout": 300, "retries": 1}}
+"""
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.log import logger
+from config import conf
+
+# 可以安全重试的请求方法
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# 网关错误，通常是上游暂时不可用，可以重试
+GATEWAY_ERRORS = (502, 503, 504)
+
+_sessions = {}  # origin -> requests.Session
+_policies = {}  # url前缀 -> 策略dict，修改时整体替换，读取时不需要加锁
+_config_prefixes = None  # 配置文件中设置了策略的url前缀，首次使用时加载
+_lock = threading.Lock()
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_session(url) -> requests.Session:
+    """获取url所在主机的共享Session"""
+    origin = _origin(url)
+    session = _sessions.get(origin)
+    if session is None:
+        with _lock:
+            session = _sessions.get(origin)
+            if session is None:
+                pool_size = conf().get("http_pool_maxsize", 20)
+                session = requests.Session()
+                # 同一主机的所有调用方(不同账号、不同api key)共用Session，不保存服务端返回的cookie，避免串号
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                # 重试由request()按端点策略处理，这里不使用urllib3的重试
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+                session.mount(origin, adapter)
+                _sessions[origin] = session
+    return session
+
+
+def set_endpoint_policy(url_prefix, timeout=None, retries=None, backoff=None, retry_on_status=None, retry_non_idempotent=False):
+    """
+    设置某个url前缀的请求策略，匹配最长前缀，配置文件中已设置的前缀不会被覆盖
+    :param timeout: 超时时间，同requests的timeout参数
+    :param retries: 连接错误、超时或retry_on_status中的状态码时的重试次数
+    :param backoff: 第n次重试前等待 backoff * 2^(n-1) 秒
+    :param retry_on_status: 需要重试的状态码，如 (502, 503, 504)
+    :param retry_non_idempotent: 是否允许重试POST等非幂等请求
+    """
+    with _lock:
+        _load_config_policies()
+        if url_prefix not in _config_prefixes:
+            _set_policy(url_prefix, timeout, retries, backoff, retry_on_status, retry_non_idempotent)
+
+
+def _set_policy(url_prefix, timeout=None, retries=None, backoff=None, retry_on_status=None, retry_non_idempotent=False):
+    """调用前需要持有_lock"""
+    global _policies
+    policies = dict(_policies)
+    policies[url_prefix] = {
+        "timeout": tuple(timeout) if isinstance(timeout, list) else timeout,
+        "retries": retries,
+        "backoff": backoff,
+        "retry_on_status": tuple(retry_on_status or ()),
+        "retry_non_idempotent": retry_non_idempotent,
+    }
+    _policies = policies
+
+
+def _load_config_policies():
+    """从配置项http_endpoint_policies加载策略，调用前需要持有_lock"""
+    global _config_prefixes
+    if _config_prefixes is not None:
+        return
+    _config_prefixes = set()
+    for url_prefix, policy in (conf().get("http_endpoint_policies") or {}).items():
+        try:
+            _set_policy(url_prefix, **policy)
+            _config_prefixes.add(url_prefix)
+        except TypeError as e:
+            logger.error(f"[http_client] invalid http_endpoint_policies for {url_prefix}: {e}")
+
+
+def _get_policy(url):
+    if _config_prefixes is None:
+        with _lock:
+            _load_config_policies()
+    policies = _policies
+    matched = None
+    for prefix in policies:
+        if url.startswith(prefix) and (matched is None or len(prefix) > len(matched)):
+            matched = prefix
+    return policies[matched] if matched else {}
+
+
+def request(method, url, timeout=None, retries=None, backoff=None, **kwargs) -> requests.Response:
+    """
+    通过共享连接池发送请求，参数同requests.request
+    未指定的timeout/retries/backoff依次使用端点策略和全局配置
+    """
+    policy = _get_policy(url)
+    if timeout is None:
+        timeout = policy.get("timeout") or conf().get("http_timeout", 120)
+    if retries is None:
+        retries = policy.get("retries") or 0
+    if backoff is None:
+        backoff = policy.get("backoff")
+        if backoff is None:
+            backoff = 0.5
+    retry_on_status = policy.get("retry_on_status", ())
+    if method.upper() not in IDEMPOTENT_METHODS and not policy.get("retry_non_idempotent"):
+        retries = 0
+    session = get_session(url)
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+            if attempt < retries and response.status_code in retry_on_status:
+                logger.warning(f"[http_client] {method} {url} status={response.status_code}, retry {attempt + 1}/{retries}")
+                response.close()
+            else:
+                return response
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= retries:
+                raise
+            logger.warning(f"[http_client] {method} {url} error={e}, retry {attempt + 1}/{retries}")
+        time.sleep(backoff * (2 ** attempt))
+        attempt += 1
+
+
+def get(url, params=None, **kwargs) -> requests.Response:
+    return request("GET", url, params=params, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs) -> requests.Response:
+    return request("POST", url, data=data, json=json, **kwargs)
+
+
+def get_stats():
+    """
+    各主机的连接复用情况
+    :return: {origin: {"requests": 请求数, "connections": 新建连接数, "reused": 复用连接的请求数}}
+    """
+    stats = {}
+    with _lock:
+        sessions = list(_sessions.items())
+    for origin, session in sessions:
+        adapter = session.get_adapter(origin + "/")
+        total_requests = 0
+        total_connections = 0
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+        stats[origin] = {
+            "requests": total_requests,
+            "connections": total_connections,
+            "reused": total_requests - total_connections,
+        }
+    return stats
@@ -1,39 +1,118 @@
+"""
+令牌桶限流
+
+不启动后台线程，每次取令牌时按上次取令牌以来经过的时间补充令牌。
+令牌不足时先预留(令牌数可以为负)，再等待补足所需的时间，多个等待者按先后顺序得到令牌，不会同时被唤醒去争抢。
+
+    bucket = TokenBucket(20)                        # 每分钟20个令牌
+    if not bucket.get_token(): ...                  # 阻塞等待，超过timeout返回False
+    if not bucket.try_acquire(cost=tokens): ...     # 不等待，按权重扣除
+    await bucket.acquire()                          # asyncio中等待
+
+    buckets = TokenBuckets(5)                       # 每个用户每分钟5个令牌
+    if not buckets.try_acquire(session_id): ...
+"""
+import asyncio
 import threading
 import time
+from collections import OrderedDict
 
 
 class TokenBucket:
-    def __init__(self, tpm, timeout=None):
-        self.capacity = int(tpm)  # 令牌桶容量
-        self.tokens = 0  # 初始令牌数为0
-        self.rate = int(tpm) / 60  # 令牌每秒生成速率
-        self.timeout = timeout  # 等待令牌超时时间
-        self.cond = threading.Condition()  # 条件变量
-        self.is_running = True
-        # 开启令牌生成线程
-        threading.Thread(target=self._generate_tokens).start()
-
-    def _generate_tokens(self):
-        """生成令牌"""
-        while self.is_running:
-            with self.cond:
-                if self.tokens < self.capacity:
-                    self.tokens += 1
-                self.cond.notify()  # 通知获取令牌的线程
-            time.sleep(1 / self.rate)
-
-    def get_token(self):
-        """获取令牌"""
-        with self.cond:
-            while self.tokens <= 0:
-                flag = self.cond.wait(self.timeout)
-                if not flag:  # 超时
-                    return False
-            self.tokens -= 1
+    def __init__(self, tpm, timeout=None, capacity=None, clock=time.monotonic):
+        self.capacity = capacity or int(tpm)  # 令牌桶容量
+        self.rate = tpm / 60  # 令牌每秒生成速率
+        self.timeout = timeout  # 等待令牌超时时间，None为一直等待
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def _reserve(self, cost, max_wait):
+        """扣除cost个令牌，返回需要等待的秒数；等待时间超过max_wait时不扣除，返回None"""
+        with self._lock:
+            self._refill(self.clock())
+            wait = max(0.0, (cost - self.tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= cost
+            return wait
+
+    def available(self):
+        with self._lock:
+            self._refill(self.clock())
+            return self.tokens
+
+    def try_acquire(self, cost=1):
+        """令牌足够时扣除并返回True，否则立即返回False"""
+        return self._reserve(cost, 0) is not None
+
+    def get_token(self, cost=1, timeout=None):
+        """获取令牌，需要等待的时间超过timeout(默认为创建时的timeout)时立即返回False"""
+        wait = self._reserve(cost, self.timeout if timeout is None else timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    async def acquire(self, cost=1, timeout=None):
+        """asyncio版本的get_token，等待时不阻塞事件循环"""
+        wait = self._reserve(cost, self.timeout if timeout is None else timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
         return True
 
     def close(self):
-        self.is_running = False
+        """不再有后台线程，保留以兼容旧的调用"""
+        pass
+
+
+class TokenBuckets:
+    """
+    按key(用户、会话、群、api key等)区分的多个令牌桶，参数相同。
+    最多保留max_keys个，超过时淘汰最久未使用的，被淘汰的key再次使用时按满桶重新开始
+    """
+
+    def __init__(self, tpm, timeout=None, capacity=None, max_keys=10000, clock=time.monotonic):
+        self.tpm = tpm
+        self.timeout = timeout
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket(self, key) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.tpm, self.timeout, self.capacity, self.clock)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def try_acquire(self, key, cost=1):
+        return self.bucket(key).try_acquire(cost)
+
+    def get_token(self, key, cost=1, timeout=None):
+        return self.bucket(key).get_token(cost, timeout)
+
+    async def acquire(self, key, cost=1, timeout=None):
+        return await self.bucket(key).acquire(cost, timeout)
+
+    def __len__(self):
+        return len(self._buckets)
 
 
 if __name__ == "__main__":
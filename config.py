@@ -56,24 +56,33 @@ available_setting = {
     "image_proxy": True,  # 是否需要图片代理，国内访问LinkAI时需要
     "image_create_prefix": ["画", "看", "找"],  # 开启图片回复的前缀
     "concurrency_in_session": 1,  # 同一会话最多有多少条消息在处理中，大于1可能乱序
+    "handler_pool_size": {"command": 2, "text": 8, "voice": 2, "media": 2},  # 各处理通道的线程数: 管理员/插件命令、文本LLM调用、语音识别/合成、图片等媒体
     "image_create_size": "256x256",  # 图片大小,可选有 256x256, 512x512, 1024x1024 (dall-e-3默认为1024x1024)
     "group_chat_exit_group": False,
     "group_exit_msg": "",  # 退出群聊的消息
     "accept_friend_msg": "",  # 接受好友请求后发送的消息
     # chatgpt会话参数
     "expires_in_seconds": 3600,  # 无操作会话的过期时间
+    "session_store": "memory",  # 会话存储方式，可选 memory(仅内存), sqlite(多进程共享), file(追加写入的日志文件)，后两者重启后可恢复会话
+    "session_store_path": "",  # 会话存储目录，默认为数据目录下的sessions
+    "session_max_count": 0,  # 内存中最多保留的会话数，超出时淘汰最久未使用的会话，0为不限制
     # 人格描述
     "character_desc": "你是ChatGPT, 一个由OpenAI训练的大型语言模型, 你旨在回答并解决人们的任何问题，并且可以使用多种语言与人交流。",
     "conversation_max_tokens": 1000,  # 支持上下文记忆的最多字符数
     # chatgpt限流配置
     "rate_limit_chatgpt": 20,  # chatgpt的调用频率限制
     "rate_limit_dalle": 50,  # openai dalle的调用频率限制
+    "rate_limit_chatgpt_per_session": 0,  # 每个会话每分钟的chatgpt调用次数限制，0为不限制
     # chatgpt api参数 参考https://platform.openai.com/docs/api-reference/chat/create
     "temperature": 0.9,
     "top_p": 1,
     "frequency_penalty": 0,
     "presence_penalty": 0,
     "request_timeout": 180,  # chatgpt请求超时时间，openai接口默认设置为600，对于难问题一般需要较长时间
+    # 共享HTTP连接池配置
+    "http_pool_maxsize": 20,  # 每个主机最多保持的长连接数
+    "http_timeout": 120,  # 未指定超时时间的请求的默认超时时间，单位秒
+    "http_endpoint_policies": {},  # 按url前缀设置超时与重试，如 {"https://api.example.com/v1/upload": {"timeout": 300, "retries": 1, "backoff": 1, "retry_on_status": [502, 503]}}
     "timeout": 120,  # chatgpt重试超时时间，在这个时间内，将会自动重试
     # Baidu 文心一言参数
     "baidu_wenxin_model": "eb-instant",  # 默认使用ERNIE-Bot-turbo模型
@@ -107,6 +116,7 @@ available_setting = {
     "dify_app_type": "chatbot", # dify助手类型 chatbot(对应聊天助手或对话流)/agent(对应Agent)/workflow(对应工作流，则默认为chatbot
     "dify_conversation_max_messages": 5, # dify目前不支持设置历史消息长度，暂时使用超过最大消息数清空会话的策略，缺点是没有滑动窗口，会突然丢失历史消息，当设置的值小于等于0，则不限制历史消息长度
     "dify_error_reply": "", # dify bot错误时给用户的回复
+    "dify_stream_split": "", # agent/workflow流式回复时的分段发送方式，sentence(按句)/paragraph(按段)，为空则每段回复完整后再发送
     # coze配置
     "coze_api_base": "https://api.coze.cn",
     "coze_api_key": "xxx",
@@ -124,6 +134,11 @@ available_setting = {
     "text_to_voice": "openai",  # 语音合成引擎，支持openai,baidu,google,azure,xunfei,ali,pytts(offline),elevenlabs,edge(online)
     "text_to_voice_model": "tts-1",
     "tts_voice_id": "alloy",
+    "tts_cache_mb": 100,  # 语音合成结果的磁盘缓存大小上限(MB)，相同引擎、音色和文本只合成一次，0表示不缓存
+    "tts_cache_warmup": [],  # 启动时预先合成并缓存的常用语音回复，如问候语、出错提示
+    "voice_async_concurrency": 4,  # edge-tts等异步语音引擎同时进行的合成/识别数量上限
+    "transcode_workers": 2,  # 同时运行的ffmpeg转码进程数
+    "transcode_cache_mb": 64,  # 内存中缓存的转码结果大小，单位MB
     # baidu 语音api配置， 使用百度语音识别和语音合成时需要
     "baidu_app_id": "",
     "baidu_api_key": "",
@@ -192,6 +207,9 @@ available_setting = {
     "plugin_trigger_prefix": "$",  # 规范插件提供聊天相关指令的前缀，建议不要和管理员指令前缀"#"冲突
     # 是否使用全局插件配置
     "use_global_plugin_config": False,
+    "plugin_timeout": 0,  # 插件处理事件的默认时限(秒)，0为不限制；可在plugins.json中为单个插件设置timeout和on_timeout(skip/defer)
+    "plugin_pool_size": 8,  # 执行有时限的插件和异步插件的线程数
+    "plugin_defer_hint": "正在处理中，请稍候~",  # 插件超时转为稍后回复(defer)时先发送的提示，为空则不提示
     "max_media_send_count": 3,  # 单次最大发送媒体资源的个数
     "media_send_interval": 1,  # 发送图片的事件间隔，单位秒
     # 智谱AI 平台配置
@@ -211,13 +229,29 @@ available_setting = {
     "Minimax_group_id": "",
     "Minimax_base_url": "",
     "web_port": 9899,
+    "web_sse_max_streams": 100,  # web channel同时打开的SSE连接数上限，每个连接占用一个web服务线程
+    "web_sse_heartbeat": 15,  # SSE心跳间隔(秒)，没有消息时按此间隔发送心跳
+    "download_cache_mb": 256,  # 插件回复的文件、图片等下载缓存的大小上限(MB)
+    "download_cache_ttl": 300,  # 下载缓存的有效期(秒)，过期后通过ETag/Last-Modified确认文件是否更新
+    "credential_refresh_ahead": 300,  # 第三方接口access token过期前多少秒在后台提前刷新
     # xbot新协议配置
     "xbot_token": "",
     "xbot_app_id": "",
     "xbot_base_url": "",
-    "xbot_callback_url": "",
+    "xbot_callback_url": "",  # 配置后使用回调接收消息，不再轮询同步接口
+    "xbot_callback_host": "127.0.0.1",  # 回调模式监听的地址，xbot服务端不在本机时改为0.0.0.0
+    "xbot_callback_port": 9919,  # 回调模式监听的端口
+    "xbot_callback_token": "",  # 回调请求需要携带的token(查询参数token或请求头X-Callback-Token)，为空时启动时随机生成
+    "xbot_sync_min_interval": 0.1,  # 轮询同步的最小间隔，单位秒，收到消息后立即再次同步
+    "xbot_sync_max_interval": 2,  # 空闲时同步间隔逐渐增长到的最大值，单位秒
     "xbot_download_url": "",
     "xbot_qr_api": "ipad",
+    "xbot_media_cache_mb": 256,  # 发送图片/语音/视频时base64编码结果的磁盘缓存大小，单位MB，0为不缓存
+    # 群成员@名称缓存
+    "group_member_cache_size": 10000,  # 最多缓存的群成员数
+    "group_member_cache_ttl": 3600,  # 缓存有效期，单位秒
+    "group_member_cache_negative_ttl": 300,  # 查询不到的成员的缓存有效期，单位秒
+    "group_member_cache_refresh_ahead": False,  # 是否在缓存临近过期时后台刷新整个群的成员
 }
 
 
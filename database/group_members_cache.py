@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+from common.log import logger
+
+# get()未命中时的返回值，用于和缓存的None(未命中结果缓存)区分
+MISS = object()
+
+
+class GroupMemberCache:
+    """
+    群成员@名称的进程内缓存，位于sqlite之前。
+    1. 以(group_id, wxid)为key，LRU淘汰+TTL过期。
+    2. 接口也查不到的成员缓存为None(negative_ttl)，避免反复请求接口。
+    3. 同一个群的并发加载合并为一次请求(single-flight)。
+    4. 开启refresh_ahead后，命中的条目临近过期时在后台重新加载整个群的成员。
+    """
+
+    def __init__(self, loader=None, max_size=10000, ttl=3600, negative_ttl=300, refresh_ahead=False, refresh_ratio=0.2):
+        """
+        :param loader: loader(group_id) -> {wxid: display_name}，加载失败返回None
+        """
+        self.loader = loader
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh_ahead = refresh_ahead
+        self.refresh_ratio = refresh_ratio
+        self._data = OrderedDict()  # (group_id, wxid) -> (value, expire_at)
+        self._inflight = {}  # group_id -> threading.Event
+        self._lock = threading.Lock()
+
+    def get(self, group_id, wxid):
+        key = (group_id, wxid)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISS
+            value, expire_at = entry
+            if expire_at <= now:
+                del self._data[key]
+                return MISS
+            self._data.move_to_end(key)
+            event = None
+            if (self.refresh_ahead and self.loader and value is not None and expire_at - now < self.ttl * self.refresh_ratio
+                    and group_id not in self._inflight):
+                # 在锁内标记为加载中，避免线程启动前其他get重复触发刷新
+                event = threading.Event()
+                self._inflight[group_id] = event
+        if event is not None:
+            threading.Thread(target=self._load, args=(group_id, self.loader, event), daemon=True).start()
+        return value
+
+    def put(self, group_id, wxid, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl if value is not None else self.negative_ttl
+        key = (group_id, wxid)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def put_many(self, group_id, names: dict):
+        for wxid, value in names.items():
+            self.put(group_id, wxid, value)
+
+    def load_group(self, group_id, loader=None, wxid=None, timeout=10):
+        """
+        加载整个群的成员并写入缓存，同一个群同时只会有一个加载请求，其余调用等待其完成
+        :param wxid: 若指定且该成员已被其他线程加载到缓存中，则跳过本次加载
+        :return: 本次是否实际执行了加载
+        """
+        loader = loader or self.loader
+        with self._lock:
+            entry = self._data.get((group_id, wxid)) if wxid is not None else None
+            if entry is not None and entry[1] > time.monotonic():
+                return False
+            event = self._inflight.get(group_id)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight[group_id] = event
+        if not leader:
+            event.wait(timeout)
+            return False
+        self._load(group_id, loader, event)
+        return True
+
+    def _load(self, group_id, loader, event):
+        """执行加载，调用前需要已在_inflight中登记event"""
+        try:
+            names = loader(group_id)
+            if names:
+                self.put_many(group_id, names)
+        except Exception as e:
+            logger.warning(f"[GroupMemberCache] load group {group_id} failed: {e}")
+        finally:
+            with self._lock:
+                self._inflight.pop(group_id, None)
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
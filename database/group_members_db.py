@@ -1,49 +1,104 @@
 import sqlite3
 import os
+import threading
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "group_members.db")
 
+# 每个线程复用一个长连接，避免每次查询都重新打开数据库
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+# sqlite单条语句的参数个数有上限(旧版本为999)，批量查询时分批
+_MAX_QUERY_PARAMS = 900
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS group_members (
-            group_id TEXT,
-            wxid TEXT,
-            display_name TEXT,
-            nickname TEXT,
-            PRIMARY KEY (group_id, wxid)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """创建表结构，进程内只执行一次"""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        conn = _connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS group_members (
+                    group_id TEXT,
+                    wxid TEXT,
+                    display_name TEXT,
+                    nickname TEXT,
+                    PRIMARY KEY (group_id, wxid)
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+        _initialized = True
+
+
+def get_connection():
+    """获取当前线程的数据库连接"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        init_db()
+        conn = _connect()
+        _local.conn = conn
+    return conn
+
 
 def save_group_members_to_db(group_id, members):
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    rows = []
     for member in members:
-        c.execute('''
-            INSERT OR REPLACE INTO group_members (group_id, wxid, display_name, nickname)
-            VALUES (?, ?, ?, ?)
-        ''', (
+        rows.append((
             group_id,
             member.get("UserName") or member.get("wxid"),
             member.get("DisplayName") or member.get("display_name"),
             member.get("NickName") or member.get("nickname"),
         ))
-    conn.commit()
-    conn.close()
+    if not rows:
+        return
+    conn = get_connection()
+    with conn:  # 单个事务内批量写入
+        conn.executemany('''
+            INSERT OR REPLACE INTO group_members (group_id, wxid, display_name, nickname)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+
 
 def get_group_member_from_db(group_id, wxid):
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
+    conn = get_connection()
+    row = conn.execute('''
         SELECT display_name, nickname FROM group_members WHERE group_id=? AND wxid=?
-    ''', (group_id, wxid))
-    row = c.fetchone()
-    conn.close()
+    ''', (group_id, wxid)).fetchone()
     if row:
         return {"display_name": row[0], "nickname": row[1]}
-    return None 
\ No newline at end of file
+    return None
+
+
+def get_group_members_from_db(group_id, wxids):
+    """
+    批量查询一个群内多个成员
+    :return: {wxid: {"display_name": ..., "nickname": ...}}，未找到的wxid不包含在结果中
+    """
+    wxids = list(dict.fromkeys(wxids))
+    result = {}
+    conn = get_connection()
+    for i in range(0, len(wxids), _MAX_QUERY_PARAMS):
+        batch = wxids[i:i + _MAX_QUERY_PARAMS]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(
+            f"SELECT wxid, display_name, nickname FROM group_members WHERE group_id=? AND wxid IN ({placeholders})",
+            [group_id] + batch,
+        ).fetchall()
+        for row in rows:
+            result[row[0]] = {"display_name": row[1], "nickname": row[2]}
+    return result
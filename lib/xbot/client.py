@@ -1,4 +1,4 @@
-import requests
+from common import bot_identity, http_client
 import os
 import json
 
@@ -10,7 +10,7 @@ class XBotClient:
         url = self.base_url + path
         headers = {'Content-Type': 'application/json'}
         try:
-            resp = requests.post(url, json=data, params=params, headers=headers, timeout=60)
+            resp = http_client.post(url, json=data, params=params, headers=headers, timeout=60)
             resp.raise_for_status()
             result = resp.json()
             if not result.get("Success", True):
@@ -45,7 +45,7 @@ class XBotClient:
         url = self.base_url + f'/Login/{qr_api}'
         data = {"DeviceId": device_id, "DeviceName": device_name}
         try:
-            resp = requests.post(url, json=data, timeout=60)
+            resp = http_client.post(url, json=data, timeout=60)
             resp.raise_for_status()
             result = resp.json()
             if not result.get("Success", True):
@@ -71,7 +71,7 @@ class XBotClient:
         url = self.base_url + '/Login/LoginCheckQR'
         params = {"uuid": uuid}
         try:
-            resp = requests.post(url, params=params, timeout=60)
+            resp = http_client.post(url, params=params, timeout=60)
             resp.raise_for_status()
             result = resp.json()
             if not result.get("Success", True):
@@ -92,7 +92,7 @@ class XBotClient:
         url = self.base_url + '/Login/LoginAwaken'
         data = {"Wxid": wxid}
         try:
-            resp = requests.post(url, json=data, timeout=60)
+            resp = http_client.post(url, json=data, timeout=60)
             resp.raise_for_status()
             result = resp.json()
             if not result.get("Success", True):
@@ -113,7 +113,7 @@ class XBotClient:
         url = self.base_url + '/Login/LoginTwiceAutoAuth'
         params = {"wxid": wxid}
         try:
-            resp = requests.post(url, params=params, timeout=60)
+            resp = http_client.post(url, params=params, timeout=60)
             resp.raise_for_status()
             result = resp.json()
             if not result.get("Success", True):
@@ -134,7 +134,7 @@ class XBotClient:
         url = self.base_url + '/Login/HeartBeat'
         params = {"wxid": wxid}
         try:
-            resp = requests.post(url, params=params, timeout=60)
+            resp = http_client.post(url, params=params, timeout=60)
             resp.raise_for_status()
             result = resp.json()
             if not result.get("Success", True):
@@ -575,7 +575,7 @@ class XBotClient:
         if device_name:
             data["DeviceName"] = device_name
         try:
-            resp = requests.post(url, json=data, timeout=60)
+            resp = http_client.post(url, json=data, timeout=60)
             resp.raise_for_status()
             result = resp.json()
             if not isinstance(result, dict):
@@ -597,10 +597,8 @@ class XBotClient:
         Returns:
             状态信息字典
         """
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return None
+        stat = bot_identity.get_robot_stat(path)
+        return dict(stat) if stat else None
 
     @staticmethod
     def save_robot_stat(path, stat):
@@ -613,3 +611,4 @@ class XBotClient:
         os.makedirs(os.path.dirname(path), exist_ok=True)
         with open(path, 'w', encoding='utf-8') as f:
             json.dump(stat, f, ensure_ascii=False, indent=2)
+        bot_identity.update_robot_stat(path, stat)
@@ -0,0 +1,193 @@
+"""
+流式的base64 json请求体，用于发送图片、语音、视频
+
+xbot的媒体接口要求把文件base64编码后放在json字段中。原来的做法是读入整个文件、编码、再json.dumps，
+一个20MB的视频会在内存中同时存在3-4份。这里按块读取文件、增量编码并直接写入请求体，
+内存占用与文件大小无关；编码结果按文件内容的sha1缓存到磁盘，重复发送同一个文件时直接读取缓存。
+
+    body = MediaJsonBody({"Wxid": wxid, "ToWxid": to_wxid, "Base64": MediaField(path)})
+    resp = http_client.post(url, data=body, headers={"Content-Type": "application/json"})
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+
+from common.log import logger
+from config import conf, get_appdata_dir
+
+# 每次读取的原始字节数，必须是3的倍数，保证分块编码拼接后与整体编码一致
+READ_CHUNK_SIZE = 3 * 64 * 1024
+CACHE_SUFFIX = ".b64"
+
+
+def base64_length(size):
+    return (size + 2) // 3 * 4
+
+
+def iter_base64_file(path, chunk_size=READ_CHUNK_SIZE):
+    """按块读取文件并逐块输出base64编码"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk)
+
+
+class MediaEncodeCache(object):
+    """
+    base64编码结果的磁盘缓存，key为文件内容的sha1。
+    (路径, 大小, 修改时间)到sha1的映射保存在内存中，同一个文件不会重复计算hash。
+    """
+
+    def __init__(self, dir_path, max_bytes):
+        self.dir_path = dir_path
+        self.max_bytes = max_bytes
+        self._digests = {}
+        self._lock = threading.Lock()
+        os.makedirs(dir_path, exist_ok=True)
+
+    def digest(self, path):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(key)
+        if digest is None:
+            sha1 = hashlib.sha1()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                    sha1.update(chunk)
+            digest = sha1.hexdigest()
+            with self._lock:
+                if len(self._digests) > 1024:
+                    self._digests.clear()
+                self._digests[key] = digest
+        return digest
+
+    def _path(self, digest):
+        return os.path.join(self.dir_path, digest + CACHE_SUFFIX)
+
+    def iter_encoded(self, path):
+        """输出文件的base64编码，命中缓存时直接读取缓存文件，否则边编码边写入缓存"""
+        cache_path = self._path(self.digest(path))
+        try:
+            f = open(cache_path, "rb")
+        except FileNotFoundError:
+            yield from self._encode_to_cache(path, cache_path)
+            return
+        with f:
+            os.utime(cache_path)  # 更新访问时间，淘汰时按最久未使用
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                yield chunk
+
+    def _encode_to_cache(self, path, cache_path):
+        tmp_path = "{}.{}.tmp".format(cache_path, threading.get_ident())
+        completed = False
+        try:
+            with open(tmp_path, "wb") as out:
+                for chunk in iter_base64_file(path):
+                    out.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            # 请求中断时不保留不完整的缓存
+            if completed:
+                os.replace(tmp_path, cache_path)
+                self._prune()
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _prune(self):
+        """缓存总大小超过max_bytes时删除最久未使用的文件"""
+        with self._lock:
+            try:
+                entries = []
+                for name in os.listdir(self.dir_path):
+                    if name.endswith(CACHE_SUFFIX):
+                        stat = os.stat(os.path.join(self.dir_path, name))
+                        entries.append((stat.st_mtime, stat.st_size, name))
+                total = sum(e[1] for e in entries)
+                for _, size, name in sorted(entries):
+                    if total <= self.max_bytes:
+                        break
+                    os.remove(os.path.join(self.dir_path, name))
+                    total -= size
+            except OSError as e:
+                logger.warning("[xbot] prune media cache failed: {}".format(e))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_encode_cache():
+    """根据配置xbot_media_cache_mb获取编码缓存，为0时不缓存"""
+    global _cache
+    max_mb = conf().get("xbot_media_cache_mb", 256)
+    if not max_mb:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MediaEncodeCache(os.path.join(get_appdata_dir(), "xbot_media_cache"), max_mb * 1024 * 1024)
+    return _cache
+
+
+def iter_base64_bytes(data, chunk_size=READ_CHUNK_SIZE):
+    view = memoryview(data)
+    for i in range(0, len(view), chunk_size):
+        yield base64.b64encode(view[i:i + chunk_size])
+
+
+class MediaField(object):
+    """
+    json中以base64字符串形式发送的文件，prefix如 "data:video/mp4;base64,"
+    source为文件路径，或已在内存中的bytes(如转码结果，不做缓存)
+    """
+
+    def __init__(self, source, prefix=""):
+        self.source = source
+        self.prefix = prefix.encode("utf-8")
+
+    def __len__(self):
+        size = os.path.getsize(self.source) if isinstance(self.source, str) else len(self.source)
+        return len(self.prefix) + base64_length(size)
+
+    def __iter__(self):
+        if self.prefix:
+            yield self.prefix
+        if not isinstance(self.source, str):
+            yield from iter_base64_bytes(self.source)
+            return
+        cache = get_encode_cache()
+        yield from (cache.iter_encoded(self.source) if cache else iter_base64_file(self.source))
+
+
+class MediaJsonBody(object):
+    """
+    json请求体，MediaField类型的值以流的方式输出。
+    实现了__len__，requests会设置Content-Length并逐块发送，而不是使用chunked编码；
+    可以重复迭代，请求重试时会重新读取文件。
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._parts = []  # bytes 或 MediaField
+        for i, (key, value) in enumerate(fields.items()):
+            head = ("{" if i == 0 else ",") + json.dumps(key) + ":"
+            if isinstance(value, MediaField):
+                self._parts += [(head + '"').encode("utf-8"), value, b'"']
+            else:
+                self._parts.append((head + json.dumps(value, ensure_ascii=False)).encode("utf-8"))
+        self._parts.append(b"{}" if not fields else b"}")
+
+    def __len__(self):
+        return sum(len(part) for part in self._parts)
+
+    def __iter__(self):
+        for part in self._parts:
+            if isinstance(part, MediaField):
+                yield from part
+            else:
+                yield part
@@ -9,7 +9,7 @@ from bridge.reply import Reply, ReplyType
 from common.log import logger
 from plugins import *
 
-from .lib.WordsSearch import WordsSearch
+from .lib.banwords_index import BanwordsIndex
 
 
 @plugins.register(
@@ -35,19 +35,15 @@ class Banwords(Plugin):
                     with open(config_path, "w") as f:
                         json.dump(conf, f, indent=4)
 
-            self.searchr = WordsSearch()
             self.action = conf["action"]
             banwords_path = os.path.join(curdir, "banwords.txt")
-            with open(banwords_path, "r", encoding="utf-8") as f:
-                words = []
-                for line in f:
-                    word = line.strip()
-                    if word:
-                        words.append(word)
-            self.searchr.SetKeywords(words)
+            # 加载预构建的索引，banwords.txt修改后自动在后台重建并替换
+            self.index = BanwordsIndex(banwords_path, check_interval=conf.get("reload_interval", 5))
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+            self.filters[Event.ON_HANDLE_CONTEXT] = EventFilter(ctypes=[ContextType.TEXT, ContextType.IMAGE_CREATE])
             if conf.get("reply_filter", True):
                 self.handlers[Event.ON_DECORATE_REPLY] = self.on_decorate_reply
+                self.filters[Event.ON_DECORATE_REPLY] = EventFilter(reply_types=[ReplyType.TEXT])
                 self.reply_action = conf.get("reply_action", "ignore")
             logger.info("[Banwords] inited")
         except Exception as e:
@@ -63,15 +59,16 @@ class Banwords(Plugin):
 
         content = e_context["context"].content
         logger.debug("[Banwords] on_handle_context. content: %s" % content)
+        searchr = self.index.get()
         if self.action == "ignore":
-            f = self.searchr.FindFirst(content)
+            f = searchr.FindFirst(content)
             if f:
                 logger.info("[Banwords] %s in message" % f["Keyword"])
                 e_context.action = EventAction.BREAK_PASS
                 return
         elif self.action == "replace":
-            if self.searchr.ContainsAny(content):
-                reply = Reply(ReplyType.INFO, "发言中包含敏感词，请重试: \n" + self.searchr.Replace(content))
+            if searchr.ContainsAny(content):
+                reply = Reply(ReplyType.INFO, "发言中包含敏感词，请重试: \n" + searchr.Replace(content))
                 e_context["reply"] = reply
                 e_context.action = EventAction.BREAK_PASS
                 return
@@ -82,19 +79,23 @@ class Banwords(Plugin):
 
         reply = e_context["reply"]
         content = reply.content
+        searchr = self.index.get()
         if self.reply_action == "ignore":
-            f = self.searchr.FindFirst(content)
+            f = searchr.FindFirst(content)
             if f:
                 logger.info("[Banwords] %s in reply" % f["Keyword"])
                 e_context["reply"] = None
                 e_context.action = EventAction.BREAK_PASS
                 return
         elif self.reply_action == "replace":
-            if self.searchr.ContainsAny(content):
-                reply = Reply(ReplyType.INFO, "已替换回复中的敏感词: \n" + self.searchr.Replace(content))
+            if searchr.ContainsAny(content):
+                reply = Reply(ReplyType.INFO, "已替换回复中的敏感词: \n" + searchr.Replace(content))
                 e_context["reply"] = reply
                 e_context.action = EventAction.CONTINUE
                 return
 
+    def reload(self):
+        self.index.check_update()
+
     def get_help_text(self, **kwargs):
         return "过滤消息中的敏感词。"
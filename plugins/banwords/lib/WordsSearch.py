@@ -7,244 +7,299 @@
 # 2020.04.06 第一次提交
 # 2020.05.16 修改，支持大于0xffff的字符
 
+import mmap
+import struct
+from array import array
+
 __all__ = ['WordsSearch']
 __author__ = 'Lin Zhijun'
 __date__ = '2020.05.16'
 
-class TrieNode():
-    def __init__(self):
-        self.Index = 0
-        self.Index = 0
-        self.Layer = 0
-        self.End = False
-        self.Char = ''
-        self.Results = []
-        self.m_values = {}
-        self.Failure = None
-        self.Parent = None
-
-    def Add(self,c):
-        if c in self.m_values :
-            return self.m_values[c]
-        node = TrieNode()
-        node.Parent = self
-        node.Char = c
-        self.m_values[c] = node
-        return node
-
-    def SetResults(self,index):
-        if (self.End == False):
-            self.End = True
-        self.Results.append(index)
-
-class TrieNode2():
-    def __init__(self):
-        self.End = False
-        self.Results = []
-        self.m_values = {}
-        self.minflag = 0xffff
-        self.maxflag = 0
-
-    def Add(self,c,node3):
-        if (self.minflag > c):
-            self.minflag = c
-        if (self.maxflag < c):
-             self.maxflag = c
-        self.m_values[c] = node3
-
-    def SetResults(self,index):
-        if (self.End == False) :
-            self.End = True
-        if (index in self.Results )==False : 
-            self.Results.append(index)
-
-    def HasKey(self,c):
-        return c in self.m_values
-        
- 
-    def TryGetValue(self,c):
-        if (self.minflag <= c and self.maxflag >= c):
-            if c in self.m_values:
-                return self.m_values[c]
-        return None
+# 索引文件格式: 文件头 + 按_ARRAYS顺序排列的数组 + 关键词utf-8数据
+_MAGIC = b"WSAC"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("<4sIIIIIII")  # magic, 格式版本, 状态数, 边数, 字符数, 关键词数, 重复关键词数组长度, 关键词utf8字节数
+# (数组名, 类型)，edge_keys为int64放在最前面，保证8字节对齐
+_ARRAYS = [
+    ("edge_keys", "q"), ("edge_targets", "i"), ("edge_start", "i"), ("alphabet", "i"), ("root_next", "i"),
+    ("fail", "i"), ("word", "i"), ("out", "i"), ("olink", "i"), ("depth", "i"), ("word_offsets", "i"), ("dups", "i"),
+]
+
+
+class _Keywords():
+    """按需从utf-8数据中解码关键词，避免加载时创建大量字符串"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
 
 
 class WordsSearch():
+    """
+    AC自动机，所有数据保存在扁平数组中，可以保存为文件并通过mmap直接加载：
+      edge_keys      所有转移边的key: 状态 * 字符数 + 字符编号，升序
+      edge_targets   转移边指向的状态
+      edge_start     每个状态的边在edge_keys中的起始位置，共 状态数+1 个
+      alphabet       出现过的字符，下标即字符编号
+      root_next      根状态按字符编号直接索引的转移表(扫描时大部分字符都从根状态转移)
+      fail           失败指针
+      word           以该状态结尾的关键词下标，-1表示没有
+      out            失败链上(包括自身)第一个有关键词的状态，-1表示没有
+      olink          失败链上(不包括自身)下一个有关键词的状态
+      depth          状态深度，即关键词长度
+      dups           重复的关键词 [状态, 关键词下标, ...]
+    加载时不重建任何按边数增长的结构，扫描第一次经过某个非根状态时，才把它的边(edge_start范围内)放入转移字典，
+    字典只包含实际经过的状态，多个进程mmap同一个索引文件时大部分数据仍然共享。
+    """
+
     def __init__(self):
-        self._first = {}
         self._keywords = []
-        self._indexs=[]
-    
-    def SetKeywords(self,keywords):
+        self._indexs = []
+        self._mmap = None
+        self._set_arrays({
+            "edge_keys": array("q"), "edge_targets": array("i"), "edge_start": array("i", [0, 0]),
+            "alphabet": array("i"), "root_next": array("i"), "fail": array("i", [0]), "word": array("i", [-1]),
+            "out": array("i", [-1]), "olink": array("i", [-1]), "depth": array("i", [0]), "word_offsets": array("i", [0]),
+            "dups": array("i"),
+        })
+
+    def _set_arrays(self, arrays):
+        self._arrays = arrays
+        self._alphabet_size = len(arrays["alphabet"])
+        self._char_codes = {chr(c): i for i, c in enumerate(arrays["alphabet"])}
+        self._edge_keys = arrays["edge_keys"]
+        self._edge_targets = arrays["edge_targets"]
+        self._edge_start = arrays["edge_start"]
+        self._goto = {}
+        self._loaded = bytearray(len(arrays["fail"]))  # 状态的边是否已放入_goto
+        self._root_next = arrays["root_next"]
+        self._fail = arrays["fail"]
+        self._word = arrays["word"]
+        self._out = arrays["out"]
+        self._olink = arrays["olink"]
+        self._depth = arrays["depth"]
+        dups = arrays["dups"]
+        self._dups = {}
+        for i in range(0, len(dups), 2):
+            self._dups.setdefault(dups[i], []).append(dups[i + 1])
+
+    def SetKeywords(self, keywords):
         self._keywords = keywords
-        self._indexs=[]
-        for i in range(len(keywords)):
-            self._indexs.append(i)
-
-        root = TrieNode()
-        allNodeLayer={}
-
-        for i in range(len(self._keywords)): # for (i = 0; i < _keywords.length; i++) 
-            p = self._keywords[i]
-            nd = root
-            for j in range(len(p)): # for (j = 0; j < p.length; j++) 
-                nd = nd.Add(ord(p[j]))
-                if (nd.Layer == 0):
-                    nd.Layer = j + 1
-                    if nd.Layer in allNodeLayer:
-                        allNodeLayer[nd.Layer].append(nd)
-                    else:
-                        allNodeLayer[nd.Layer]=[]
-                        allNodeLayer[nd.Layer].append(nd)
-            nd.SetResults(i)
-
-
-        allNode = []
-        allNode.append(root)
-        for key in allNodeLayer.keys():
-            for nd in allNodeLayer[key]:
-                allNode.append(nd)
-        allNodeLayer=None
-
-        for i in range(len(allNode)): # for (i = 0; i < allNode.length; i++) 
-            if i==0 :
+        self._indexs = list(range(len(keywords)))
+        self._mmap = None
+
+        chars = sorted(set("".join(keywords)))
+        char_codes = {c: i for i, c in enumerate(chars)}
+        size = len(chars)
+        # 构建trie，转移保存在以 状态*字符数+字符编号 为key的字典中
+        trans = {}
+        word = array("i", [-1])
+        dups = array("i")
+        for i, keyword in enumerate(keywords):
+            if not keyword:
                 continue
-            nd=allNode[i]
-            nd.Index = i
-            r = nd.Parent.Failure
-            c = nd.Char
-            while (r != None and (c in r.m_values)==False):
-                r = r.Failure
-            if (r == None):
-                nd.Failure = root
+            s = 0
+            for c in keyword:
+                key = s * size + char_codes[c]
+                nxt = trans.get(key)
+                if nxt is None:
+                    nxt = len(word)
+                    trans[key] = nxt
+                    word.append(-1)
+                s = nxt
+            if word[s] < 0:
+                word[s] = i
             else:
-                nd.Failure = r.m_values[c]
-                for key2 in nd.Failure.Results :
-                    nd.SetResults(key2)
-        root.Failure = root
-
-        allNode2 = []
-        for i in range(len(allNode)): # for (i = 0; i < allNode.length; i++) 
-            allNode2.append( TrieNode2())
-        
-        for i in range(len(allNode2)): # for (i = 0; i < allNode2.length; i++) 
-            oldNode = allNode[i]
-            newNode = allNode2[i]
-
-            for key in oldNode.m_values :
-                index = oldNode.m_values[key].Index
-                newNode.Add(key, allNode2[index])
-            
-            for index in range(len(oldNode.Results)): # for (index = 0; index < oldNode.Results.length; index++) 
-                item = oldNode.Results[index]
-                newNode.SetResults(item)
-            
-            oldNode=oldNode.Failure
-            while oldNode != root:
-                for key in oldNode.m_values :
-                    if (newNode.HasKey(key) == False):
-                        index = oldNode.m_values[key].Index
-                        newNode.Add(key, allNode2[index])
-                for index in range(len(oldNode.Results)): 
-                    item = oldNode.Results[index]
-                    newNode.SetResults(item)
-                oldNode=oldNode.Failure
-        allNode = None
-        root = None
-
-        # first = []
-        # for index in range(65535):# for (index = 0; index < 0xffff; index++) 
-        #     first.append(None)
-        
-        # for key in allNode2[0].m_values :
-        #     first[key] = allNode2[0].m_values[key]
-        
-        self._first = allNode2[0]
-    
-
-    def FindFirst(self,text):
-        ptr = None
-        for index in range(len(text)): # for (index = 0; index < text.length; index++) 
-            t =ord(text[index]) # text.charCodeAt(index)
-            tn = None
-            if (ptr == None):
-                tn = self._first.TryGetValue(t)
-            else:
-                tn = ptr.TryGetValue(t)
-                if (tn==None):
-                    tn = self._first.TryGetValue(t)
-                
-            
-            if (tn != None):
-                if (tn.End):
-                    item = tn.Results[0]
-                    keyword = self._keywords[item]
-                    return { "Keyword": keyword, "Success": True, "End": index, "Start": index + 1 - len(keyword), "Index": self._indexs[item] }
-            ptr = tn
-        return None
-
-    def FindAll(self,text):
-        ptr = None
-        list = []
-
-        for index in range(len(text)): # for (index = 0; index < text.length; index++) 
-            t =ord(text[index]) # text.charCodeAt(index)
-            tn = None
-            if (ptr == None):
-                tn = self._first.TryGetValue(t)
-            else:
-                tn = ptr.TryGetValue(t)
-                if (tn==None):
-                    tn = self._first.TryGetValue(t)
-                
-            
-            if (tn != None):
-                if (tn.End):
-                    for j in range(len(tn.Results)): # for (j = 0; j < tn.Results.length; j++) 
-                        item = tn.Results[j]
-                        keyword = self._keywords[item]
-                        list.append({ "Keyword": keyword, "Success": True, "End": index, "Start": index + 1 - len(keyword), "Index": self._indexs[item] })
-            ptr = tn
-        return list
-
-
-    def ContainsAny(self,text):
-        ptr = None
-        for index in range(len(text)): # for (index = 0; index < text.length; index++) 
-            t =ord(text[index]) # text.charCodeAt(index)
-            tn = None
-            if (ptr == None):
-                tn = self._first.TryGetValue(t)
+                dups.extend((s, i))
+        n = len(word)
+
+        # key升序排列后同一个状态的边是连续的
+        edge_keys = array("q", sorted(trans))
+        edge_targets = array("i", [trans[key] for key in edge_keys])
+        edge_start = array("i", [0]) * (n + 1)
+        for key in edge_keys:
+            edge_start[key // size + 1] += 1
+        for s in range(n):
+            edge_start[s + 1] += edge_start[s]
+
+        # 按广度优先顺序计算失败指针与输出链
+        fail = array("i", [0]) * n
+        out = array("i", [-1]) * n
+        olink = array("i", [-1]) * n
+        depth = array("i", [0]) * n
+        queue = [0]
+        for s in queue:
+            for j in range(edge_start[s], edge_start[s + 1]):
+                code = edge_keys[j] - s * size
+                child = edge_targets[j]
+                depth[child] = depth[s] + 1
+                f = 0
+                if s != 0:
+                    f = fail[s]
+                    while True:
+                        nxt = trans.get(f * size + code)
+                        if nxt is not None:
+                            f = nxt
+                            break
+                        if f == 0:
+                            break
+                        f = fail[f]
+                fail[child] = f
+                olink[child] = out[f]
+                out[child] = child if word[child] >= 0 else out[f]
+                queue.append(child)
+
+        root_next = array("i", [0]) * size
+        for j in range(edge_start[0], edge_start[1]):
+            root_next[edge_keys[j]] = edge_targets[j]
+
+        word_offsets = array("i", [0])
+        offset = 0
+        for keyword in keywords:
+            offset += len(keyword.encode("utf-8"))
+            word_offsets.append(offset)
+
+        self._set_arrays({
+            "edge_keys": edge_keys, "edge_targets": edge_targets, "edge_start": edge_start,
+            "alphabet": array("i", [ord(c) for c in chars]),
+            "root_next": root_next, "fail": fail, "word": word, "out": out, "olink": olink, "depth": depth,
+            "word_offsets": word_offsets, "dups": dups,
+        })
+
+    def Save(self, path):
+        """保存为索引文件，可通过Load加载而无需重新构建"""
+        arrays = self._arrays
+        blob = "".join(self._keywords[i] for i in range(len(self._keywords))).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, FORMAT_VERSION, len(self._fail), len(arrays["edge_keys"]), self._alphabet_size,
+                                 len(self._keywords), len(arrays["dups"]), len(blob)))
+            for name, _ in _ARRAYS:
+                f.write(bytes(arrays[name]))
+            f.write(blob)
+
+    @classmethod
+    def Load(cls, path, use_mmap=True):
+        """
+        加载Save保存的索引文件。use_mmap为True时数组直接引用映射的文件内容，不复制到内存，
+        多个进程加载同一个文件时共享页缓存
+        """
+        with open(path, "rb") as f:
+            if use_mmap:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
             else:
-                tn = ptr.TryGetValue(t)
-                if (tn==None):
-                    tn = self._first.TryGetValue(t)
-            
-            if (tn != None):
-                if (tn.End):
-                    return True
-            ptr = tn
-        return False
-    
-    def Replace(self,text, replaceChar = '*'):
-        result = list(text) 
-
-        ptr = None
-        for i in range(len(text)): # for (i = 0; i < text.length; i++) 
-            t =ord(text[i]) # text.charCodeAt(index)
-            tn = None
-            if (ptr == None):
-                tn = self._first.TryGetValue(t)
+                data = f.read()
+        view = memoryview(data)
+        magic, version, n, edges, chars, count, dup_size, blob_size = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC or version != FORMAT_VERSION:
+            raise ValueError("invalid words index file: {}".format(path))
+        lengths = {
+            "edge_keys": edges, "edge_targets": edges, "edge_start": n + 1, "alphabet": chars, "root_next": chars,
+            "fail": n, "word": n, "out": n, "olink": n, "depth": n, "word_offsets": count + 1, "dups": dup_size,
+        }
+        pos = _HEADER.size
+        arrays = {}
+        for name, typecode in _ARRAYS:
+            size = lengths[name] * array(typecode).itemsize
+            arrays[name] = view[pos:pos + size].cast(typecode)
+            pos += size
+        search = cls()
+        search._set_arrays(arrays)
+        search._keywords = _Keywords(view[pos:pos + blob_size], arrays["word_offsets"])
+        search._indexs = range(count)
+        search._mmap = data if use_mmap else None
+        return search
+
+    def _load_edges(self, s):
+        lo = self._edge_start[s]
+        hi = self._edge_start[s + 1]
+        self._goto.update(zip(self._edge_keys[lo:hi], self._edge_targets[lo:hi]))
+        self._loaded[s] = 1
+
+    def _scan(self, text, first_only=False):
+        """
+        扫描文本，返回 [(结束位置, 输出状态), ...]，输出状态为失败链上第一个有关键词的状态
+        """
+        codes_get = self._char_codes.get
+        goto_get = self._goto.get
+        loaded = self._loaded
+        size = self._alphabet_size
+        root_next = self._root_next
+        fail = self._fail
+        out = self._out
+        matches = []
+        s = 0
+        for index, ch in enumerate(text):
+            code = codes_get(ch)
+            if code is None:
+                s = 0
+                continue
+            # 沿失败链查找有该字符转移的状态，回到根状态时查根状态的转移表
+            while s:
+                key = s * size + code
+                t = goto_get(key)
+                if t is None and not loaded[s]:
+                    self._load_edges(s)
+                    t = goto_get(key)
+                if t is not None:
+                    s = t
+                    break
+                s = fail[s]
             else:
-                tn = ptr.TryGetValue(t)
-                if (tn==None):
-                    tn = self._first.TryGetValue(t)
-            
-            if (tn != None):
-                if (tn.End):
-                    maxLength = len( self._keywords[tn.Results[0]])
-                    start = i + 1 - maxLength
-                    for j in range(start,i+1): # for (j = start; j <= i; j++) 
-                        result[j] = replaceChar
-            ptr = tn
-        return ''.join(result) 
\ No newline at end of file
+                s = root_next[code]
+            o = out[s]
+            if o >= 0:
+                matches.append((index, o))
+                if first_only:
+                    break
+        return matches
+
+    def _result(self, item, index):
+        keyword = self._keywords[item]
+        return {"Keyword": keyword, "Success": True, "End": index, "Start": index + 1 - len(keyword), "Index": self._indexs[item]}
+
+    def FindFirst(self, text):
+        matches = self._scan(text, True)
+        if not matches:
+            return None
+        index, o = matches[0]
+        return self._result(self._word[o], index)
+
+    def FindAll(self, text):
+        word = self._word
+        olink = self._olink
+        dups = self._dups
+        results = []
+        for index, o in self._scan(text):
+            while o >= 0:
+                results.append(self._result(word[o], index))
+                if dups and o in dups:
+                    for item in dups[o]:
+                        results.append(self._result(item, index))
+                o = olink[o]
+        return results
+
+    def ContainsAny(self, text):
+        return len(self._scan(text, True)) > 0
+
+    def Replace(self, text, replaceChar='*'):
+        result = list(text)
+        depth = self._depth
+        for index, o in self._scan(text):
+            for j in range(index + 1 - depth[o], index + 1):
+                result[j] = replaceChar
+        return ''.join(result)
+
+    def FindAllBatch(self, texts):
+        """批量查找多条消息，返回每条消息的FindAll结果"""
+        return [self.FindAll(text) for text in texts]
+
+    def ContainsAnyBatch(self, texts):
+        """批量判断多条消息，返回每条消息是否包含关键词"""
+        scan = self._scan
+        return [len(scan(text, True)) > 0 for text in texts]
@@ -0,0 +1,135 @@
+# encoding:utf-8
+"""
+预构建的敏感词索引
+
+banwords.txt按内容sha1和索引格式版本构建为 banwords_index/<sha1>.v<版本>.idx，
+启动时直接mmap加载已有的索引，不再重新构建；词库修改后在后台线程构建新索引，构建完成后整体替换，
+正在进行的扫描继续使用旧的索引，不会被阻塞。
+
+也可以在部署时预先构建: python plugins/banwords/lib/banwords_index.py [banwords.txt路径]
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+
+if __package__:
+    from common.log import logger
+
+    from .WordsSearch import FORMAT_VERSION, WordsSearch
+else:  # 作为脚本直接运行
+    import logging
+
+    from WordsSearch import FORMAT_VERSION, WordsSearch
+
+    logger = logging.getLogger(__name__)
+
+INDEX_DIR_NAME = "banwords_index"
+INDEX_SUFFIX = ".v{}.idx".format(FORMAT_VERSION)
+
+
+def read_words(words_path):
+    with open(words_path, "r", encoding="utf-8") as f:
+        return [word for word in (line.strip() for line in f) if word]
+
+
+def index_path(words_path):
+    """词库对应的索引文件路径"""
+    with open(words_path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return os.path.join(os.path.dirname(os.path.abspath(words_path)), INDEX_DIR_NAME, digest + INDEX_SUFFIX)
+
+
+def build_index(words_path):
+    """构建词库的索引文件并删除旧的索引，返回索引文件路径"""
+    path = index_path(words_path)
+    index_dir = os.path.dirname(path)
+    os.makedirs(index_dir, exist_ok=True)
+    search = WordsSearch()
+    search.SetKeywords(read_words(words_path))
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    search.Save(tmp_path)
+    os.replace(tmp_path, path)  # 其他进程不会读到写了一半的索引
+    for name in os.listdir(index_dir):
+        if name != os.path.basename(path) and (name.endswith(".idx") or name.endswith(".tmp")):
+            try:
+                os.remove(os.path.join(index_dir, name))
+            except OSError:
+                pass  # 可能正在被其他进程使用
+    return path
+
+
+def load_index(words_path):
+    """加载词库的索引，索引不存在或已损坏时重新构建"""
+    path = index_path(words_path)
+    if os.path.exists(path):
+        try:
+            return WordsSearch.Load(path)
+        except ValueError as e:
+            logger.warning("[Banwords] invalid index {}, rebuild: {}".format(path, e))
+    start = time.time()
+    path = build_index(words_path)
+    logger.info("[Banwords] index built in {:.2f}s: {}".format(time.time() - start, path))
+    return WordsSearch.Load(path)
+
+
+class BanwordsIndex(object):
+    """
+    持有当前使用的WordsSearch，get()最多每check_interval秒检查一次词库的修改时间，
+    发现修改后在后台线程重建索引，期间get()继续返回旧的索引
+    """
+
+    def __init__(self, words_path, check_interval=5):
+        self.words_path = words_path
+        self.check_interval = check_interval
+        self._mtime = self._words_mtime()
+        self._search = load_index(words_path)
+        self._checked_at = time.monotonic()
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def _words_mtime(self):
+        try:
+            return os.stat(self.words_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def get(self) -> WordsSearch:
+        now = time.monotonic()
+        if self.check_interval > 0 and now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self.check_update()
+        return self._search
+
+    def check_update(self, wait=False):
+        """词库修改时间变化时重建索引，wait为True时等待重建完成"""
+        mtime = self._words_mtime()
+        if mtime is None or mtime == self._mtime:
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        thread = threading.Thread(target=self._reload, args=(mtime,), name="banwords-reload", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+
+    def _reload(self, mtime):
+        try:
+            search = load_index(self.words_path)
+            self._search = search  # 替换引用是原子的，正在扫描的调用仍持有旧对象
+            self._mtime = mtime
+            logger.info("[Banwords] reloaded {}".format(self.words_path))
+        except Exception as e:
+            logger.warning("[Banwords] reload failed: {}".format(e))
+            self._mtime = mtime  # 文件再次修改时重试
+        finally:
+            self._reloading = False
+
+
+if __name__ == "__main__":
+    words_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "banwords.txt")
+    start = time.time()
+    print("{} built in {:.2f}s".format(build_index(words_path), time.time() - start))
@@ -4,7 +4,7 @@ import os
 import uuid
 from uuid import getnode as get_mac
 
-import requests
+from common import http_client
 
 import plugins
 from bridge.context import ContextType
@@ -37,6 +37,7 @@ class BDunit(Plugin):
             self.secret_key = conf["secret_key"]
             self.access_token = self.get_token()
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+            self.filters[Event.ON_HANDLE_CONTEXT] = EventFilter(ctypes=[ContextType.TEXT])
             logger.info("[BDunit] inited")
         except Exception as e:
             logger.warn("[BDunit] init failed, ignore ")
@@ -75,7 +76,7 @@ class BDunit(Plugin):
         payload = ""
         headers = {"Content-Type": "application/json", "Accept": "application/json"}
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = http_client.request("POST", url, headers=headers, data=payload)
 
         # print(response.text)
         return response.json()["access_token"]
@@ -102,7 +103,7 @@ class BDunit(Plugin):
         }
         try:
             headers = {"Content-Type": "application/json"}
-            response = requests.post(url, json=body, headers=headers)
+            response = http_client.post(url, json=body, headers=headers)
             return json.loads(response.text)
         except Exception:
             return None
@@ -125,7 +126,7 @@ class BDunit(Plugin):
         }
         try:
             headers = {"Content-Type": "application/json"}
-            response = requests.post(url, json=body, headers=headers)
+            response = http_client.post(url, json=body, headers=headers)
             return json.loads(response.text)
         except Exception:
             return None
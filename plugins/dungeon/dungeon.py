@@ -54,6 +54,7 @@ class Dungeon(Plugin):
     def __init__(self):
         super().__init__()
         self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+        self.filters[Event.ON_HANDLE_CONTEXT] = EventFilter(ctypes=[ContextType.TEXT])
         logger.info("[Dungeon] inited")
         # 目前没有设计session过期事件，这里先暂时使用过期字典
         if conf().get("expires_in_seconds"):
@@ -53,3 +53,31 @@ class EventContext:
 
     def is_break(self):
         return self.action == EventAction.BREAK or self.action == EventAction.BREAK_PASS
+
+
+class EventFilter:
+    """
+    插件声明的事件过滤条件，不满足条件的事件不会调用插件的处理函数
+    self.filters[Event.ON_HANDLE_CONTEXT] = EventFilter(ctypes=[ContextType.TEXT], prefixes=["$"])
+    :param ctypes: context的类型
+    :param reply_types: reply的类型，用于ON_DECORATE_REPLY和ON_SEND_REPLY
+    :param prefixes: context内容的前缀
+    """
+
+    def __init__(self, ctypes=None, reply_types=None, prefixes=None):
+        self.ctypes = frozenset(ctypes) if ctypes else None
+        self.reply_types = frozenset(reply_types) if reply_types else None
+        self.prefixes = tuple(prefixes) if prefixes else None
+
+    def match(self, e_context: EventContext) -> bool:
+        econtext = e_context.econtext
+        context = econtext.get("context")
+        if self.ctypes is not None and (context is None or context.type not in self.ctypes):
+            return False
+        if self.prefixes is not None and (context is None or not isinstance(context.content, str) or not context.content.startswith(self.prefixes)):
+            return False
+        if self.reply_types is not None:
+            reply = econtext.get("reply")
+            if reply is None or reply.type not in self.reply_types:
+                return False
+        return True
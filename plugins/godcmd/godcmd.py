@@ -92,6 +92,14 @@ ADMIN_COMMANDS = {
         "alias": ["plist", "插件"],
         "desc": "打印当前插件列表",
     },
+    "pstats": {
+        "alias": ["pstats", "插件耗时"],
+        "desc": "打印各插件处理消息的次数与耗时",
+    },
+    "tstats": {
+        "alias": ["tstats", "线程池状态"],
+        "desc": "打印各消息处理线程池的排队数与活跃线程数",
+    },
     "setpri": {
         "alias": ["setpri", "设置插件优先级"],
         "args": ["插件名", "优先级"],
@@ -402,6 +410,24 @@ class Godcmd(Plugin):
                                     result += "已启用\n"
                                 else:
                                     result += "未启用\n"
+                        elif cmd == "pstats":
+                            stats = PluginManager().get_handler_stats()
+                            ok = True
+                            result = "插件耗时统计：\n"
+                            for name, calls, total_ms, avg_ms, max_ms in stats:
+                                result += f"{name} {calls}次 总计{total_ms:.0f}ms 平均{avg_ms:.1f}ms 最大{max_ms:.0f}ms\n"
+                            if not stats:
+                                result += "暂无数据"
+                        elif cmd == "tstats":
+                            from channel.chat_channel import get_handler_pool_stats
+
+                            stats = get_handler_pool_stats()
+                            ok = True
+                            result = "线程池状态：\n"
+                            for lane, lane_stats in stats.items():
+                                result += f"{lane} 线程数{lane_stats['max_workers']} 活跃{lane_stats['active']} 排队{lane_stats['queue_depth']}\n"
+                            if not stats:
+                                result += "暂无数据"
                         elif cmd == "scanp":
                             new_plugins = PluginManager().scan_plugins()
                             ok, result = True, "插件扫描完成"
@@ -37,6 +37,7 @@ class Hello(Plugin):
             self.patpat_prompt = self.config.get("patpat_prompt", self.patpat_prompt)
             logger.info("[Hello] inited")
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+            self.filters[Event.ON_HANDLE_CONTEXT] = EventFilter(ctypes=[ContextType.TEXT, ContextType.JOIN_GROUP, ContextType.PATPAT, ContextType.EXIT_GROUP])
         except Exception as e:
             logger.error(f"[Hello]初始化异常：{e}")
             raise "[Hello] init failed, ignore "
@@ -9,6 +9,7 @@ import random
 import asyncio
 import nest_asyncio
 import requests
+from common import http_client
 from newspaper import Article
 import newspaper
 from bs4 import BeautifulSoup
@@ -36,6 +37,8 @@ from plugins import *
     desc="Sum url link content with jina reader and llm",
     version="0.0.1",
     author="hanfangyuan",
+    timeout=10,
+    on_timeout="defer",
 )
 class JinaSum(Plugin):
 
@@ -66,6 +69,7 @@ class JinaSum(Plugin):
             self.black_url_list = self.config.get("black_url_list", self.black_url_list)
             logger.info(f"[JinaSum] inited, config={self.config}")
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+            self.filters[Event.ON_HANDLE_CONTEXT] = EventFilter(ctypes=[ContextType.SHARING, ContextType.TEXT])
         except Exception as e:
             logger.error(f"[JinaSum] 初始化异常：{e}")
             raise "[JinaSum] init failed, ignore "
@@ -122,7 +126,7 @@ class JinaSum(Plugin):
             logger.debug(f"[JinaSum] openai_chat_url: {openai_chat_url}, openai_headers: {openai_headers}, openai_payload: {openai_payload}")
             
             # 发送请求获取摘要
-            response = requests.post(openai_chat_url, headers=openai_headers, json=openai_payload, timeout=60)
+            response = http_client.post(openai_chat_url, headers=openai_headers, json=openai_payload, timeout=60)
             response.raise_for_status()
             result = response.json()['choices'][0]['message']['content']
             
@@ -175,7 +179,7 @@ class JinaSum(Plugin):
             logger.debug(f"[JinaSum] 使用Jina提取内容: {target_url}")
             jina_url = self._get_jina_url(target_url)
             headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"}
-            response = requests.get(jina_url, headers=headers, timeout=60)
+            response = http_client.get(jina_url, headers=headers, timeout=60)
             response.raise_for_status()
             return response.text
         except Exception as e:
@@ -203,7 +207,7 @@ class JinaSum(Plugin):
                         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
                         "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8"
                     }
-                    response = requests.head(url, headers=headers, allow_redirects=True, timeout=10)
+                    response = http_client.request("HEAD", url, headers=headers, allow_redirects=True, timeout=10)
                     if response.status_code == 200:
                         real_url = response.url
                         logger.debug(f"[JinaSum] B站短链接解析结果: {real_url}")
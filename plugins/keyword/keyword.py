@@ -2,14 +2,19 @@
 
 import json
 import os
-import requests
 import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common.download_cache import get_download_cache
 from common.log import logger
 from plugins import *
 import random
 
+from .matcher import KeywordMatcher
+
+IMAGE_EXTS = (".jpg", ".webp", ".jpeg", ".png", ".gif", ".img")
+FILE_EXTS = (".pdf", ".doc", ".docx", ".xls", "xlsx", ".zip", ".rar")
+
 
 @plugins.register(
     name="Keyword",
@@ -18,6 +23,8 @@ import random
     desc="关键词匹配过滤",
     version="0.1",
     author="fengyege.top",
+    timeout=10,
+    on_timeout="defer",
 )
 class Keyword(Plugin):
     def __init__(self):
@@ -37,9 +44,16 @@ class Keyword(Plugin):
                     conf = json.load(f)
             # 加载关键词
             self.keyword = conf["keyword"]
+            self.matcher = KeywordMatcher(
+                exact=self.keyword,
+                prefix=conf.get("prefix_keyword"),
+                contains=conf.get("contains_keyword"),
+                regex=conf.get("regex_keyword"),
+            )
 
             logger.info("[keyword] {}".format(self.keyword))
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+            self.filters[Event.ON_HANDLE_CONTEXT] = EventFilter(ctypes=[ContextType.TEXT])
             logger.info("[keyword] inited.")
         except Exception as e:
             logger.warn("[keyword] init failed, ignore or see https://github.com/zhayujie/chatgpt-on-wechat/tree/master/plugins/keyword .")
@@ -51,35 +65,35 @@ class Keyword(Plugin):
 
         content = e_context["context"].content.strip()
         logger.debug("[keyword] on_handle_context. content: %s" % content)
-        if content in self.keyword:
-            logger.info(f"[keyword] 匹配到关键字【{content}】")
-            reply_text = self.keyword[content]
+        matched = self.matcher.match(content)
+        if matched:
+            match_type, word, reply_text = matched
+            logger.info(f"[keyword] 匹配到关键字【{word}】({match_type})")
 
             if isinstance(reply_text, list):
                 # 如果关键词对应的是一个列表，则随机选择列表中的一个元素
                 reply_text = random.choice(reply_text)
 
             # 判断匹配内容的类型
-            if (reply_text.startswith("http://") or reply_text.startswith("https://")) and any(reply_text.endswith(ext) for ext in [".jpg", ".webp", ".jpeg", ".png", ".gif", ".img"]):
+            if (reply_text.startswith("http://") or reply_text.startswith("https://")) and reply_text.endswith(IMAGE_EXTS):
             # 如果是以 http:// 或 https:// 开头，且".jpg", ".jpeg", ".png", ".gif", ".img"结尾，则认为是图片 URL。
+            # 通过下载缓存获取本地图片，频繁触发的关键词不会每次都重新下载
                 reply = Reply()
-                reply.type = ReplyType.IMAGE_URL
-                reply.content = reply_text
-                
-            elif (reply_text.startswith("http://") or reply_text.startswith("https://")) and any(reply_text.endswith(ext) for ext in [".pdf", ".doc", ".docx", ".xls", "xlsx",".zip", ".rar"]):
-            # 如果是以 http:// 或 https:// 开头，且".pdf", ".doc", ".docx", ".xls", "xlsx",".zip", ".rar"结尾，则下载文件到tmp目录并发送给用户
-                file_path = "tmp"
-                if not os.path.exists(file_path):
-                    os.makedirs(file_path)
-                file_name = reply_text.split("/")[-1]  # 获取文件名
-                file_path = os.path.join(file_path, file_name)
-                response = requests.get(reply_text)
-                with open(file_path, "wb") as f:
-                    f.write(response.content)
+                try:
+                    reply.type = ReplyType.IMAGE
+                    reply.content = get_download_cache().get(reply_text)
+                except Exception as e:
+                    logger.warning(f"[keyword] 下载图片失败，交给channel下载: {e}")
+                    reply.type = ReplyType.IMAGE_URL
+                    reply.content = reply_text
+
+            elif (reply_text.startswith("http://") or reply_text.startswith("https://")) and reply_text.endswith(FILE_EXTS):
+            # 如果是以 http:// 或 https:// 开头，且".pdf", ".doc", ".docx", ".xls", "xlsx",".zip", ".rar"结尾，则下载文件并发送给用户
+            # 下载结果按url和ETag缓存，只在文件更新后重新下载
                 #channel/wechat/wechat_channel.py和channel/wechat_channel.py中缺少ReplyType.FILE类型。
                 reply = Reply()
                 reply.type = ReplyType.FILE
-                reply.content = file_path
+                reply.content = get_download_cache().get(reply_text)
             
             elif (reply_text.startswith("http://") or reply_text.startswith("https://")) and any(reply_text.endswith(ext) for ext in [".mp4"]):
             # 如果是以 http:// 或 https:// 开头，且".mp4"结尾，则下载视频到tmp目录并发送给用户
@@ -0,0 +1,132 @@
+# encoding:utf-8
+"""
+关键词匹配索引，按以下顺序匹配，返回第一个命中的规则:
+  keyword           完全匹配，dict查找
+  prefix_keyword    前缀匹配，trie树，多个前缀命中时取最长的
+  contains_keyword  包含匹配，AC自动机一次扫描，取最先出现的关键词(同一位置结束时取最长的)
+  regex_keyword     正则匹配，所有正则合并为一个模式只编译一次，取最先匹配的位置
+"""
+import re
+
+from common.log import logger
+
+_END = ""  # trie节点中表示关键词结束的key，关键词的字符都不为空字符串
+# 按编号的反向引用(如\1)，合并后分组编号会改变
+_NUMBERED_BACKREF = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]")
+
+
+class PrefixTrie(object):
+    def __init__(self, words):
+        self.root = {}
+        for word in words:
+            node = self.root
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[_END] = word
+
+    def longest_prefix(self, text):
+        node = self.root
+        found = None
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            if _END in node:
+                found = node[_END]
+        return found
+
+
+class AhoCorasick(object):
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]  # 该状态或其失败链上最长的关键词
+        for word in words:
+            s = 0
+            for ch in word:
+                nxt = self.goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[s][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                s = nxt
+            self.output[s] = word
+        queue = list(self.goto[0].values())
+        for s in queue:
+            for ch, child in self.goto[s].items():
+                f = self.fail[s]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                if self.output[child] is None:
+                    self.output[child] = self.output[self.fail[child]]
+                queue.append(child)
+
+    def find_first(self, text):
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        s = 0
+        for ch in text:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if output[s] is not None:
+                return output[s]
+        return None
+
+
+class RegexRules(object):
+    """所有正则合并为 (?P<_r0>...)|(?P<_r1>...) 一次匹配，无法合并时(如使用了反向引用)逐个匹配"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.compiled = [re.compile(p) for p in self.patterns]
+        self.combined = None
+        if self.patterns and not any(_NUMBERED_BACKREF.search(p) for p in self.patterns):
+            try:
+                self.combined = re.compile("|".join("(?P<_r{}>{})".format(i, p) for i, p in enumerate(self.patterns)))
+            except re.error as e:
+                logger.warning("[keyword] combine regex failed, match one by one: {}".format(e))
+
+    def search(self, text):
+        if self.combined is not None:
+            m = self.combined.search(text)
+            return self.patterns[int(m.lastgroup[2:])] if m else None
+        for pattern, compiled in zip(self.patterns, self.compiled):
+            if compiled.search(text):
+                return pattern
+        return None
+
+
+class KeywordMatcher(object):
+    def __init__(self, exact=None, prefix=None, contains=None, regex=None):
+        self.exact = exact or {}
+        self.prefix = prefix or {}
+        self.contains = contains or {}
+        self.regex = regex or {}
+        self._trie = PrefixTrie(w for w in self.prefix if w)
+        self._ac = AhoCorasick(w for w in self.contains if w)
+        self._regex = RegexRules(self.regex)
+
+    def match(self, content):
+        """
+        :return: (匹配方式, 关键词/正则, 回复) 或 None
+        """
+        if content in self.exact:
+            return "exact", content, self.exact[content]
+        if self.prefix:
+            word = self._trie.longest_prefix(content)
+            if word is not None:
+                return "prefix", word, self.prefix[word]
+        if self.contains:
+            word = self._ac.find_first(content)
+            if word is not None:
+                return "contains", word, self.contains[word]
+        if self.regex:
+            pattern = self._regex.search(content)
+            if pattern is not None:
+                return "regex", pattern, self.regex[pattern]
+        return None
@@ -1,7 +1,8 @@
 from enum import Enum
 from config import conf
+from common.async_loop import run_coroutine
 from common.log import logger
-import requests
+from common import http_client
 import threading
 import time
 from bridge.reply import Reply, ReplyType
@@ -76,7 +77,6 @@ class MJBot:
         self.tasks = {}
         self.temp_dict = {}
         self.tasks_lock = threading.Lock()
-        self.event_loop = asyncio.new_event_loop()
 
     def judge_mj_task_type(self, e_context: EventContext):
         """
@@ -199,7 +199,7 @@ class MJBot:
         body = {"prompt": prompt, "mode": mode, "auto_translate": self.config.get("auto_translate")}
         if not self.config.get("img_proxy"):
             body["img_proxy"] = False
-        res = requests.post(url=self.base_url + "/generate", json=body, headers=self.headers, timeout=(5, 40))
+        res = http_client.post(url=self.base_url + "/generate", json=body, headers=self.headers, timeout=(5, 40))
         if res.status_code == 200:
             res = res.json()
             logger.debug(f"[MJ] image generate, res={res}")
@@ -220,7 +220,6 @@ class MJBot:
                               task_type=TaskType.GENERATE)
                 # put to memory dict
                 self.tasks[task.id] = task
-                # asyncio.run_coroutine_threadsafe(self.check_task(task, e_context), self.event_loop)
                 self._do_check_task(task, e_context)
                 return reply
         else:
@@ -240,7 +239,7 @@ class MJBot:
             body["index"] = index
         if not self.config.get("img_proxy"):
             body["img_proxy"] = False
-        res = requests.post(url=self.base_url + "/operate", json=body, headers=self.headers, timeout=(5, 40))
+        res = http_client.post(url=self.base_url + "/operate", json=body, headers=self.headers, timeout=(5, 40))
         logger.debug(res)
         if res.status_code == 200:
             res = res.json()
@@ -255,7 +254,6 @@ class MJBot:
                 self.tasks[task.id] = task
                 key = f"{task_type.name}_{img_id}_{index}"
                 self.temp_dict[key] = True
-                # asyncio.run_coroutine_threadsafe(self.check_task(task, e_context), self.event_loop)
                 self._do_check_task(task, e_context)
                 return reply
         else:
@@ -267,23 +265,28 @@ class MJBot:
             reply = Reply(ReplyType.ERROR, error_msg or "图片生成失败，请稍后再试")
             return reply
 
-    def check_task_sync(self, task: MJTask, e_context: EventContext):
+    async def check_task(self, task: MJTask, e_context: EventContext):
+        """在共享的后台事件循环中轮询任务状态，等待期间不占用线程"""
         logger.debug(f"[MJ] start check task status, {task}")
+        loop = asyncio.get_running_loop()
         max_retry_times = 90
         while max_retry_times > 0:
-            time.sleep(10)
+            await asyncio.sleep(10)
             url = f"{self.base_url}/tasks/{task.id}"
             try:
-                res = requests.get(url, headers=self.headers, timeout=8)
+                res = await loop.run_in_executor(None, lambda: http_client.get(url, headers=self.headers, timeout=8))
                 if res.status_code == 200:
                     res_json = res.json()
-                    logger.debug(f"[MJ] task check res sync, task_id={task.id}, status={res.status_code}, "
-                                 f"data={res_json.get('data')}, thread={threading.current_thread().name}")
+                    logger.debug(f"[MJ] task check res, task_id={task.id}, status={res.status_code}, "
+                                 f"data={res_json.get('data')}")
                     if res_json.get("data") and res_json.get("data").get("status") == Status.FINISHED.name:
                         # process success res
                         if self.tasks.get(task.id):
                             self.tasks[task.id].status = Status.FINISHED
-                        self._process_success_task(task, res_json.get("data"), e_context)
+                        try:
+                            await loop.run_in_executor(None, self._process_success_task, task, res_json.get("data"), e_context)
+                        except Exception as e:
+                            logger.exception(f"[MJ] process success task error, task_id={task.id}, {e}")
                         return
                     max_retry_times -= 1
                 else:
@@ -298,7 +301,7 @@ class MJBot:
             self.tasks[task.id].status = Status.EXPIRED
 
     def _do_check_task(self, task: MJTask, e_context: EventContext):
-        threading.Thread(target=self.check_task_sync, args=(task, e_context)).start()
+        run_coroutine(self.check_task(task, e_context))
 
     def _process_success_task(self, task: MJTask, res: dict, e_context: EventContext):
         """
@@ -366,14 +369,6 @@ class MJBot:
             return TaskMode.RELAX.value
         return mode or TaskMode.FAST.value
 
-    def _run_loop(self, loop: asyncio.BaseEventLoop):
-        """
-        运行事件循环，用于轮询任务的线程
-        :param loop: 事件循环
-        """
-        loop.run_forever()
-        loop.stop()
-
     def _print_tasks(self):
         for id in self.tasks:
             logger.debug(f"[MJ] current task: {self.tasks[id]}")
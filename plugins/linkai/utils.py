@@ -1,4 +1,4 @@
-import requests
+from common import http_client
 from common.log import logger
 from config import global_config
 from bridge.reply import Reply, ReplyType
@@ -36,7 +36,7 @@ class Util:
             # do http request
             base_url = conf().get("linkai_api_base", "https://api.link-ai.tech")
             params = {"app_code": app_code}
-            res = requests.get(url=base_url + "/v1/app/info", params=params, headers=headers, timeout=(5, 10))
+            res = http_client.get(url=base_url + "/v1/app/info", params=params, headers=headers, timeout=(5, 10))
             if res.status_code == 200:
                 plugins = res.json().get("data").get("plugins")
                 for plugin in plugins:
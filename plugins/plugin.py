@@ -7,6 +7,7 @@ from common.log import logger
 class Plugin:
     def __init__(self):
         self.handlers = {}
+        self.filters = {}  # Event -> EventFilter，不满足过滤条件的事件不会调用handler
 
     def load_config(self) -> dict:
         """
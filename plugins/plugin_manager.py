@@ -1,11 +1,19 @@
 # encoding:utf-8
 
+import asyncio
+import copy
 import importlib
 import importlib.util
 import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 
+from bridge.reply import Reply, ReplyType
+from common.async_loop import run_coroutine
+from common.handler_pool import HandlerPool
 from common.log import logger
 from common.singleton import singleton
 from common.sorted_dict import SortedDict
@@ -23,6 +31,12 @@ class PluginManager:
         self.pconf = {}
         self.current_plugin_path = None
         self.loaded = {}
+        # event -> ((插件名, handler, EventFilter或None, 时限(秒)或None, 超时处理方式), ...)，按优先级排列且只包含已启用的插件，
+        # 在启用、禁用、重载插件和修改优先级时重新生成，emit_event不再逐个检查插件状态
+        self.dispatch_table = {}
+        self.handler_stats = {}  # 插件名 -> [调用次数, 总耗时(秒), 最大耗时(秒)]
+        self._stats_lock = threading.Lock()
+        self._guard_pool = None  # 执行有时限的插件handler的线程池
 
     def register(self, name: str, desire_priority: int = 0, **kwargs):
         def wrapper(plugincls):
@@ -35,6 +49,9 @@ class PluginManager:
             plugincls.namecn = kwargs.get("namecn") if kwargs.get("namecn") != None else name
             plugincls.hidden = kwargs.get("hidden") if kwargs.get("hidden") != None else False
             plugincls.enabled = kwargs.get("enabled") if kwargs.get("enabled") != None else True
+            # 处理事件的时限(秒)，超时后按on_timeout处理: skip 跳过该插件继续处理，defer 先结束事件，插件完成后再发送回复
+            plugincls.timeout = kwargs.get("timeout")
+            plugincls.on_timeout = kwargs.get("on_timeout") or "skip"
             if self.current_plugin_path == None:
                 raise Exception("Plugin path not set")
             self.plugins[name.upper()] = plugincls
@@ -136,6 +153,28 @@ class PluginManager:
     def refresh_order(self):
         for event in self.listening_plugins.keys():
             self.listening_plugins[event].sort(key=lambda name: self.plugins[name].priority, reverse=True)
+        self.rebuild_dispatch_table()
+
+    def rebuild_dispatch_table(self):
+        table = {}
+        for event, names in self.listening_plugins.items():
+            entries = []
+            for name in names:
+                instance = self.instances.get(name)
+                if not self.plugins[name].enabled or instance is None or event not in instance.handlers:
+                    continue
+                timeout, on_timeout = self._handler_budget(name)
+                entries.append((name, instance.handlers[event], getattr(instance, "filters", {}).get(event), timeout, on_timeout))
+            table[event] = tuple(entries)
+        self.dispatch_table = table  # 整体替换，正在分发的事件继续使用旧的表
+
+    def _handler_budget(self, name):
+        """插件的时限与超时处理方式，plugins.json中的timeout、on_timeout优先，其次是注册时声明的值和全局配置plugin_timeout"""
+        plugincls = self.plugins[name]
+        pconf = self.pconf.get("plugins", {}).get(plugincls.name, {}) if self.pconf else {}
+        timeout = pconf.get("timeout", getattr(plugincls, "timeout", None)) or conf().get("plugin_timeout", 0)
+        on_timeout = pconf.get("on_timeout", getattr(plugincls, "on_timeout", "skip"))
+        return (timeout if timeout and timeout > 0 else None), on_timeout
 
     def activate_plugins(self):  # 生成新开启的插件实例
         failed_plugins = []
@@ -158,7 +197,8 @@ class PluginManager:
                 for event in instance.handlers:
                     if event not in self.listening_plugins:
                         self.listening_plugins[event] = []
-                    self.listening_plugins[event].append(name)
+                    if name not in self.listening_plugins[event]:  # 重新生成实例时不重复添加
+                        self.listening_plugins[event].append(name)
         self.refresh_order()
         return failed_plugins
 
@@ -172,6 +212,7 @@ class PluginManager:
             if name in self.instances:
                 self.instances[name].handlers.clear()
             del self.instances[name]
+            self.rebuild_dispatch_table()
             self.activate_plugins()
             return True
         return False
@@ -189,17 +230,114 @@ class PluginManager:
         self.activate_plugins()
 
     def emit_event(self, e_context: EventContext, *args, **kwargs):
-        if e_context.event in self.listening_plugins:
-            for name in self.listening_plugins[e_context.event]:
-                if self.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
-                    logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
-                    instance = self.instances[name]
-                    instance.handlers[e_context.event](e_context, *args, **kwargs)
-                    if e_context.is_break():
-                        e_context["breaked_by"] = name
-                        logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
+        for name, handler, event_filter, timeout, on_timeout in self.dispatch_table.get(e_context.event, ()):
+            if e_context.action != EventAction.CONTINUE:
+                break
+            if event_filter is not None and not event_filter.match(e_context):
+                continue
+            logger.debug("Plugin %s triggered by event %s", name, e_context.event)
+            if timeout is not None or asyncio.iscoroutinefunction(handler):
+                self._call_guarded(name, handler, timeout, on_timeout, e_context, args, kwargs)
+            else:
+                start = time.perf_counter()
+                try:
+                    handler(e_context, *args, **kwargs)
+                finally:
+                    self._record_stats(name, time.perf_counter() - start)
+            if e_context.is_break():
+                e_context["breaked_by"] = name
+                logger.debug("Plugin %s breaked event %s", name, e_context.event)
         return e_context
 
+    def _get_guard_pool(self):
+        if self._guard_pool is None:
+            with self._stats_lock:
+                if self._guard_pool is None:
+                    self._guard_pool = HandlerPool("plugin", max_workers=conf().get("plugin_pool_size", 8))
+        return self._guard_pool
+
+    def _call_guarded(self, name, handler, timeout, on_timeout, e_context, args, kwargs):
+        """
+        在线程池(同步handler)或后台事件循环(协程handler)中执行，最多等待timeout秒。
+        handler操作的是e_context和其中context的副本，按时完成后再合并回来，超时后的修改不会影响后续的处理
+        """
+        guarded = EventContext(e_context.event, dict(e_context.econtext))
+        context = e_context.econtext.get("context")
+        if context is not None:
+            guarded["context"] = copy.copy(context)
+            guarded["context"].kwargs = dict(context.kwargs)
+        start = time.perf_counter()
+        if asyncio.iscoroutinefunction(handler):
+            future = run_coroutine(handler(guarded, *args, **kwargs))
+        else:
+            future = self._get_guard_pool().submit(handler, guarded, *args, **kwargs)
+        future.add_done_callback(lambda f: self._record_stats(name, time.perf_counter() - start))
+        try:
+            future.result(timeout)
+        except FuturesTimeoutError:
+            if future.done():  # handler自己抛出的超时异常
+                raise
+            self._on_handler_timeout(name, timeout, on_timeout, e_context, guarded, future)
+            return
+        if context is not None and guarded.econtext.get("context") is not None:
+            # 通道在事件结束后继续使用原来的context对象，所以把修改写回原对象
+            context.__dict__.update(guarded["context"].__dict__)
+            guarded["context"] = context
+        e_context.econtext.update(guarded.econtext)
+        e_context.action = guarded.action
+
+    def _on_handler_timeout(self, name, timeout, on_timeout, e_context, guarded, future):
+        if on_timeout != "defer" or e_context.event != Event.ON_HANDLE_CONTEXT:
+            logger.warning("[plugins] %s exceeded %ss on %s, skipped", name, timeout, e_context.event)
+            future.cancel()  # 协程handler可以取消，线程中的handler会继续运行但结果被丢弃
+            return
+        # 先结束本次事件，插件完成后再单独发送它的回复
+        logger.info("[plugins] %s exceeded %ss, reply later", name, timeout)
+        hint = conf().get("plugin_defer_hint")
+        e_context["reply"] = Reply(ReplyType.TEXT, hint) if hint else None
+        e_context.action = EventAction.BREAK_PASS
+        e_context["deferred_by"] = name
+        future.add_done_callback(lambda f: self._get_guard_pool().submit(self._send_deferred_reply, name, guarded, f))
+
+    def _send_deferred_reply(self, name, guarded, future):
+        if future.cancelled() or future.exception() is not None:
+            logger.warning("[plugins] deferred %s failed: %s", name, None if future.cancelled() else future.exception())
+            return
+        reply = guarded.econtext.get("reply")
+        if not reply or not reply.content:
+            logger.info("[plugins] deferred %s finished without reply", name)
+            return
+        channel = guarded["channel"]
+        context = guarded["context"]
+        try:
+            if hasattr(channel, "_decorate_reply"):
+                channel._send_reply(context, channel._decorate_reply(context, reply))
+            else:
+                channel.send(reply, context)
+        except Exception as e:
+            logger.exception("[plugins] send deferred reply of %s failed: %s", name, e)
+
+    def _record_stats(self, name, cost):
+        with self._stats_lock:
+            stats = self.handler_stats.get(name)
+            if stats is None:
+                self.handler_stats[name] = [1, cost, cost]
+            else:
+                stats[0] += 1
+                stats[1] += cost
+                if cost > stats[2]:
+                    stats[2] = cost
+
+    def get_handler_stats(self):
+        """
+        各插件处理事件的次数与耗时，按总耗时降序排列
+        :return: [(插件名, 调用次数, 总耗时ms, 平均耗时ms, 最大耗时ms), ...]
+        """
+        with self._stats_lock:
+            items = [(name, calls, total, peak) for name, (calls, total, peak) in self.handler_stats.items()]
+        items.sort(key=lambda item: item[2], reverse=True)
+        return [(name, calls, total * 1000, total * 1000 / calls, peak * 1000) for name, calls, total, peak in items]
+
     def set_plugin_priority(self, name: str, priority: int):
         name = name.upper()
         if name not in self.plugins:
@@ -239,6 +377,7 @@ class PluginManager:
             rawname = self.plugins[name].name
             self.pconf["plugins"][rawname]["enabled"] = False
             self.save_config()
+            self.rebuild_dispatch_table()
             return True
         return True
 
@@ -337,6 +476,7 @@ class PluginManager:
                 if name in self.listening_plugins[event]:
                     self.listening_plugins[event].remove(name)
             del self.plugins[name]
+            self.rebuild_dispatch_table()
             del self.pconf["plugins"][rawname]
             self.loaded[dirname] = None
             self.save_config()
@@ -66,6 +66,7 @@ class Role(Plugin):
             if len(self.roles) == 0:
                 raise Exception("no role found")
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+            self.filters[Event.ON_HANDLE_CONTEXT] = EventFilter(ctypes=[ContextType.TEXT])
             self.roleplays = {}
             logger.info("[Role] inited")
         except Exception as e:
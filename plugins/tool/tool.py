@@ -17,11 +17,14 @@ from plugins import *
     version="0.5",
     author="goldfishh",
     desire_priority=0,
+    timeout=15,
+    on_timeout="defer",
 )
 class Tool(Plugin):
     def __init__(self):
         super().__init__()
         self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+        self.filters[Event.ON_HANDLE_CONTEXT] = EventFilter(ctypes=[ContextType.TEXT])
         self.app = self._reset_app()
         if not self.tool_config.get("tools"):
             logger.warn("[tool] init failed, ignore ")
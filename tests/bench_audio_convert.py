@@ -0,0 +1,92 @@
+"""
+语音转换基准测试：60秒语音，对比经过临时文件中转的旧方式与内存中的PCM转换
+
+1. wav封装/解析与重采样(不依赖第三方库)
+2. silk解码为wav(需要安装silk-python和pilk，旧方式使用pilk读写文件)
+运行方式（项目根目录）: python -m tests.bench_audio_convert
+"""
+import math
+import os
+import shutil
+import struct
+import tempfile
+import time
+import tracemalloc
+import wave
+
+from voice import audio_convert
+
+DURATION_SECONDS = 60
+RATE = 24000
+ROUNDS = 5
+
+
+def make_pcm():
+    samples = (int(8000 * math.sin(2 * math.pi * 440 * i / RATE)) for i in range(RATE * DURATION_SECONDS))
+    return struct.pack("<{}h".format(RATE * DURATION_SECONDS), *samples)
+
+
+def wav_resample_by_file(pcm, work_dir):
+    """旧方式：写wav文件，再读出PCM重采样后写入临时pcm文件并读回"""
+    wav_path = os.path.join(work_dir, "voice.wav")
+    with wave.open(wav_path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(pcm)
+    frames = audio_convert.get_pcm_from_wav(wav_path)
+    pcm_path = os.path.join(work_dir, "voice.pcm")
+    with open(pcm_path, "wb") as f:
+        f.write(audio_convert.resample_pcm(frames, RATE, 16000))
+    with open(pcm_path, "rb") as f:
+        return len(f.read())
+
+
+def wav_resample_in_memory(pcm, work_dir):
+    frames, rate, _, _ = audio_convert.wav_to_pcm(audio_convert.pcm_to_wav(pcm, RATE))
+    return len(audio_convert.resample_pcm(frames, rate, 16000))
+
+
+def silk_to_wav_by_file(silk_data, work_dir):
+    """旧方式：silk写入文件，解码为wav文件再读回"""
+    silk_path = os.path.join(work_dir, "voice.silk")
+    wav_path = os.path.join(work_dir, "voice.wav")
+    with open(silk_path, "wb") as f:
+        f.write(silk_data)
+    audio_convert.pilk.silk_to_wav(silk_path, wav_path, rate=RATE)
+    return len(audio_convert.get_pcm_from_wav(wav_path))
+
+
+def silk_to_wav_in_memory(silk_data, work_dir):
+    frames, _, _, _ = audio_convert.wav_to_pcm(audio_convert.silk_bytes_to_wav(silk_data, RATE))
+    return len(frames)
+
+
+def bench(name, func, data, work_dir):
+    cost = 0
+    tracemalloc.start()
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func(data, work_dir)
+        cost += time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name}: {cost / ROUNDS * 1000:.2f}ms peak={peak / 1024 / 1024:.2f}MB")
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp()
+    try:
+        pcm = make_pcm()
+        print(f"wav + resample ({DURATION_SECONDS}s, {len(pcm) / 1024 / 1024:.1f}MB pcm)")
+        bench("file", wav_resample_by_file, pcm, work_dir)
+        bench("memory", wav_resample_in_memory, pcm, work_dir)
+        if audio_convert.pysilk and audio_convert.pilk:
+            silk_data = audio_convert.pcm_to_silk(pcm, RATE)
+            print(f"silk -> wav ({len(silk_data) / 1024:.0f}KB silk)")
+            bench("file", silk_to_wav_by_file, silk_data, work_dir)
+            bench("memory", silk_to_wav_in_memory, silk_data, work_dir)
+        else:
+            print("silk -> wav: skipped, silk-python or pilk not installed")
+    finally:
+        shutil.rmtree(work_dir)
@@ -0,0 +1,47 @@
+"""
+ChatGPTSession.discard_exceeding 基准测试：200条消息的会话裁剪到max_tokens
+
+对比逐条丢弃后重新计算全部token的旧方式与缓存每条消息token数的新方式
+运行方式（项目根目录）: python -m tests.bench_chat_gpt_session
+"""
+import time
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession, num_tokens_from_messages
+
+MESSAGE_COUNT = 200
+MAX_TOKENS = 1000
+ROUNDS = 20
+
+
+def build_session():
+    session = ChatGPTSession("bench", system_prompt="You are a helpful assistant.", model="gpt-3.5-turbo")
+    for i in range(MESSAGE_COUNT // 2):
+        session.add_query(f"第{i}个问题：请介绍一下这个项目的消息处理流程，以及各个插件之间的关系。")
+        session.add_reply(f"第{i}个回答：消息先经过通道构造上下文，再由插件处理，最后交给机器人生成回复并发送。")
+    return session
+
+
+def discard_by_recount(session, max_tokens):
+    """旧实现：每丢弃一条消息都重新计算整个会话的token数"""
+    cur_tokens = num_tokens_from_messages(session.messages, session.model)
+    while cur_tokens > max_tokens and len(session.messages) > 2:
+        session.messages.pop(1)
+        cur_tokens = num_tokens_from_messages(session.messages, session.model)
+    return cur_tokens
+
+
+def bench(name, func):
+    cost = 0
+    result = None
+    for _ in range(ROUNDS):
+        session = build_session()
+        start = time.perf_counter()
+        result = func(session)
+        cost += time.perf_counter() - start
+    print(f"{name}: {cost / ROUNDS * 1000:.2f}ms per trim, tokens after trim={result}")
+
+
+if __name__ == "__main__":
+    build_session().calc_tokens()  # 预先加载tiktoken编码
+    bench("recount", lambda s: discard_by_recount(s, MAX_TOKENS))
+    bench("incremental", lambda s: s.discard_exceeding(MAX_TOKENS))
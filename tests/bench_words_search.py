@@ -0,0 +1,84 @@
+"""
+敏感词AC自动机基准测试：50000个随机中文词，对比改写前的WordsSearch(tests/words_search_baseline.py)与扁平数组实现
+
+比较构建耗时、构建后内存、FindAll/ContainsAny吞吐量，以及索引文件mmap加载耗时
+运行方式（项目根目录）: python -m tests.bench_words_search
+"""
+import importlib.util
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+WORDS_SEARCH_PATH = "plugins/banwords/lib/WordsSearch.py"
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "words_search_baseline.py")
+WORD_COUNT = 50000
+TEXT_COUNT = 2000
+TEXT_LENGTH = 200
+
+
+def load_module(name, path):
+    # plugins.banwords依赖插件管理器，这里直接按文件路径加载
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_data():
+    random.seed(0)
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+    words = list({"".join(random.choices(chars, k=random.randint(2, 6))) for _ in range(WORD_COUNT)})
+    texts = ["".join(random.choices(chars + list("abc ,。"), k=TEXT_LENGTH)) for _ in range(TEXT_COUNT)]
+    return words, texts
+
+
+def bench(name, build, texts):
+    tracemalloc.start()
+    start = time.perf_counter()
+    search = build()
+    build_cost = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    found = sum(len(search.FindAll(text)) for text in texts)
+    find_cost = time.perf_counter() - start
+    start = time.perf_counter()
+    hits = sum(search.ContainsAny(text) for text in texts)
+    contains_cost = time.perf_counter() - start
+    chars = TEXT_COUNT * TEXT_LENGTH / 1000000
+    print(f"  {name}: build={build_cost:.2f}s mem={current / 1024 / 1024:.1f}MB "
+          f"FindAll={chars / find_cost:.2f}Mchar/s ContainsAny={chars / contains_cost:.2f}Mchar/s "
+          f"(found={found} hits={hits})")
+    if hasattr(search, "ContainsAnyBatch"):
+        start = time.perf_counter()
+        search.ContainsAnyBatch(texts)
+        print(f"  {name}: ContainsAnyBatch={chars / (time.perf_counter() - start):.2f}Mchar/s")
+    return search
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp()
+    try:
+        words, texts = make_data()
+        print(f"{len(words)} words, {TEXT_COUNT} texts x {TEXT_LENGTH} chars")
+        new_cls = load_module("words_search", WORDS_SEARCH_PATH).WordsSearch
+        old_cls = load_module("old_words_search", BASELINE_PATH).WordsSearch
+
+        def build_with(cls):
+            search = cls()
+            search.SetKeywords(words)
+            return search
+
+        bench("old", lambda: build_with(old_cls), texts)
+        search = bench("new", lambda: build_with(new_cls), texts)
+        index_path = os.path.join(work_dir, "banwords.idx")
+        search.Save(index_path)
+        print(f"index file: {os.path.getsize(index_path) / 1024 / 1024:.1f}MB")
+        bench("new(mmap)", lambda: new_cls.Load(index_path), texts)
+    finally:
+        for name in os.listdir(work_dir):
+            os.remove(os.path.join(work_dir, name))
+        os.rmdir(work_dir)
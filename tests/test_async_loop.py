@@ -0,0 +1,51 @@
+import asyncio
+import concurrent.futures
+import threading
+import unittest
+
+from common import async_loop
+from voice import voice
+
+
+class TestAsyncLoop(unittest.TestCase):
+    def test_submit(self):
+        async def add(a, b):
+            await asyncio.sleep(0.01)
+            return a + b
+
+        self.assertEqual(async_loop.submit(add(1, 2)), 3)
+
+    def test_submit_timeout_cancels(self):
+        cancelled = threading.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            async_loop.submit(slow(), timeout=0.05)
+        self.assertTrue(cancelled.wait(1))
+
+    def test_voice_concurrency_bounded(self):
+        """测试多个线程同时提交语音协程时，同时执行的数量不超过voice_async_concurrency"""
+        running = []
+        peak = []
+
+        async def synthesize():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.02)
+            running.pop()
+
+        threads = threading.active_count()
+        with concurrent.futures.ThreadPoolExecutor(12) as pool:
+            list(pool.map(lambda _: voice.submit(synthesize(), timeout=5), range(12)))
+        self.assertLessEqual(max(peak), 4)
+        self.assertLessEqual(threading.active_count(), threads + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import math
+import struct
+import unittest
+
+from voice import audio_convert
+
+RATE = 24000
+
+
+def make_pcm(seconds=1):
+    samples = [int(8000 * math.sin(2 * math.pi * 440 * i / RATE)) for i in range(RATE * seconds)]
+    return struct.pack("<{}h".format(len(samples)), *samples)
+
+
+@unittest.skipUnless(audio_convert.pysilk or audio_convert.pilk, "silk-python not installed")
+class TestSilk(unittest.TestCase):
+    def test_round_trip_tencent(self):
+        """测试微信格式silk的文件头，以及编码后再解码得到相同长度的PCM"""
+        pcm = make_pcm()
+        silk_data = audio_convert.pcm_to_silk(pcm, RATE, tencent=True)
+        self.assertTrue(silk_data.startswith(b"\x02#!SILK_V3"))
+        self.assertEqual(len(audio_convert.silk_to_pcm(silk_data, RATE)), len(pcm))
+
+    def test_round_trip_standard(self):
+        silk_data = audio_convert.pcm_to_silk(make_pcm(), RATE)
+        self.assertTrue(silk_data.startswith(b"#!SILK_V3"))
+        frames, rate, channels, _ = audio_convert.wav_to_pcm(audio_convert.silk_bytes_to_wav(silk_data, 16000))
+        self.assertEqual((len(frames), rate, channels), (16000 * 2, 16000, 1))
+
+    @unittest.skipUnless(audio_convert.pysilk and audio_convert.pilk, "silk-python or pilk not installed")
+    def test_pilk_fallback(self):
+        """测试内存编码的silk可以由pilk解码，pilk编码的silk也可以在内存中解码"""
+        pcm = make_pcm()
+        silk_data = audio_convert.pcm_to_silk(pcm, RATE, tencent=True)
+        self.assertEqual(len(audio_convert._silk_to_pcm_by_file(silk_data, RATE)), len(pcm))
+        silk_data = audio_convert._pcm_to_silk_by_file(pcm, RATE, True)
+        self.assertTrue(silk_data.startswith(b"\x02#!SILK_V3"))
+        self.assertEqual(len(audio_convert.silk_to_pcm(memoryview(silk_data), RATE)), len(pcm))
+
+
+class TestWav(unittest.TestCase):
+    def test_pcm_wav_round_trip(self):
+        pcm = make_pcm()
+        wav_data = audio_convert.pcm_to_wav(pcm, RATE)
+        self.assertEqual(audio_convert.wav_duration_ms(wav_data), 1000)
+        frames, rate, _, _ = audio_convert.wav_to_pcm(wav_data)
+        self.assertEqual((bytes(frames), rate), (pcm, RATE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+# plugins.banwords依赖插件管理器，这里把lib目录加入路径后按文件路径加载
+sys.path.insert(0, "plugins/banwords/lib")
+_spec = importlib.util.spec_from_file_location("banwords_index", "plugins/banwords/lib/banwords_index.py")
+banwords_index = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(banwords_index)
+
+
+class TestBanwordsIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.words_path = os.path.join(self.tmp_dir.name, "banwords.txt")
+        self.writes = 0
+        self.write_words("中国\nhello\n\n")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_words(self, content):
+        with open(self.words_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        # 保证每次写入后修改时间不同
+        self.writes += 1
+        mtime = time.time() + self.writes
+        os.utime(self.words_path, (mtime, mtime))
+
+    def test_index_built_once(self):
+        """测试首次加载时构建索引，之后直接加载已有的索引文件"""
+        index = banwords_index.BanwordsIndex(self.words_path)
+        path = banwords_index.index_path(self.words_path)
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(index.get().ContainsAny("say hello"))
+        built_at = os.stat(path).st_mtime_ns
+        banwords_index.BanwordsIndex(self.words_path)
+        self.assertEqual(os.stat(path).st_mtime_ns, built_at)
+
+    def test_hot_reload(self):
+        """测试词库修改后重建索引并替换，旧的索引仍可使用"""
+        index = banwords_index.BanwordsIndex(self.words_path, check_interval=0)
+        old_search = index.get()
+        old_path = banwords_index.index_path(self.words_path)
+        self.write_words("中国\nworld\n")
+        index.check_update(wait=True)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(index.get().ContainsAny("hello world"))
+        self.assertFalse(index.get().ContainsAny("hello"))
+        self.assertEqual(old_search.FindFirst("hello")["Keyword"], "hello")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import os
+import tempfile
+import unittest
+
+from common import bot_identity
+
+
+class TestBotIdentity(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "robot_stat.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _write(self, stat, mtime):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(stat, f)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_missing_file(self):
+        """测试文件不存在"""
+        self.assertIsNone(bot_identity.get_robot_stat(self.path))
+        self.assertIsNone(bot_identity.get_bot_wxid(self.path))
+
+    def test_reload_on_mtime_change(self):
+        """测试文件修改时间变化后重新加载"""
+        self._write({"wxid": "wxid_a"}, 1000)
+        self.assertEqual(bot_identity.get_bot_wxid(self.path), "wxid_a")
+        self._write({"wxid": "wxid_b"}, 2000)
+        self.assertEqual(bot_identity.get_bot_wxid(self.path), "wxid_a")  # 检查间隔内使用缓存
+        bot_identity._entries[self.path]["checked_at"] -= bot_identity.CHECK_INTERVAL
+        self.assertEqual(bot_identity.get_bot_wxid(self.path), "wxid_b")
+
+    def test_update(self):
+        """测试写入后直接更新缓存"""
+        self._write({"wxid": "wxid_a"}, 1000)
+        self.assertEqual(bot_identity.get_bot_wxid(self.path), "wxid_a")
+        self._write({"wxid": "wxid_b"}, 2000)
+        bot_identity.update_robot_stat(self.path, {"wxid": "wxid_b"})
+        self.assertEqual(bot_identity.get_bot_wxid(self.path), "wxid_b")
+
+
+if __name__ == '__main__':
+    unittest.main()
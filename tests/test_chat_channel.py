@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import OrderedDict
+
+from bridge.context import Context, ContextType
+from bridge.reply import ReplyType
+from channel.chat_channel import ChatChannel, get_handler_pool_stats
+from config import conf
+from database import group_members_db
+
+
+def setUpModule():
+    """ChatChannel初始化时会创建群成员数据库，测试时放到临时目录"""
+    global work_dir, saved_db
+    work_dir = tempfile.mkdtemp()
+    saved_db = (group_members_db.DB_PATH, group_members_db._local, group_members_db._initialized)
+    group_members_db.DB_PATH = os.path.join(work_dir, "group_members.db")
+    group_members_db._local = threading.local()
+    group_members_db._initialized = False
+
+
+def tearDownModule():
+    group_members_db.DB_PATH, group_members_db._local, group_members_db._initialized = saved_db
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def make_channel():
+    """每个用例使用独立的调度状态(ChatChannel的sessions等是类属性)"""
+
+    class RecordChannel(ChatChannel):
+        futures = {}
+        sessions = {}
+        ready_sessions = OrderedDict()
+        lock = threading.Condition(threading.RLock())
+
+        def __init__(self):
+            self.handled = []
+            self.running = {}
+            self.peak = {}
+            self.release = threading.Event()
+            self.started = threading.Event()
+            self.record_lock = threading.Lock()
+            super().__init__()
+
+        def _handle(self, context: Context):
+            session_id = context["session_id"]
+            with self.record_lock:
+                self.handled.append(context.content)
+                self.running[session_id] = self.running.get(session_id, 0) + 1
+                self.peak[session_id] = max(self.peak.get(session_id, 0), self.running[session_id])
+            self.started.set()
+            self.release.wait(2)
+            with self.record_lock:
+                self.running[session_id] -= 1
+
+    return RecordChannel()
+
+
+class TestChatChannelDispatch(unittest.TestCase):
+    def setUp(self):
+        self.saved = conf().get("concurrency_in_session")
+
+    def tearDown(self):
+        conf()["concurrency_in_session"] = self.saved
+
+    def produce(self, channel, session_id, content):
+        channel.produce(Context(ContextType.TEXT, content, kwargs={"session_id": session_id}))
+
+    def wait_idle(self, channel):
+        for _ in range(200):
+            with channel.lock:
+                if not channel.sessions:
+                    return
+            threading.Event().wait(0.01)
+        self.fail("sessions not drained: {}".format(channel.sessions))
+
+    def test_admin_command_first(self):
+        """测试#开头的管理命令插到会话队列的最前面"""
+        conf()["concurrency_in_session"] = 1
+        channel = make_channel()
+        self.produce(channel, "s1", "first")
+        self.assertTrue(channel.started.wait(1))
+        for content in ["a", "b", "#reset"]:
+            self.produce(channel, "s1", content)
+        channel.release.set()
+        self.wait_idle(channel)
+        self.assertEqual(channel.handled, ["first", "#reset", "a", "b"])
+
+    def test_concurrency_in_session(self):
+        """测试同一会话同时处理的消息数不超过concurrency_in_session，不影响其他会话"""
+        conf()["concurrency_in_session"] = 2
+        channel = make_channel()
+        for i in range(6):
+            self.produce(channel, "s1", "m{}".format(i))
+        self.produce(channel, "s2", "other")
+        for _ in range(200):
+            with channel.record_lock:
+                if channel.running.get("s1") == 2 and channel.running.get("s2") == 1:
+                    break
+            threading.Event().wait(0.01)
+        with channel.record_lock:
+            self.assertEqual((channel.running.get("s1"), channel.running.get("s2")), (2, 1))
+        channel.release.set()
+        self.wait_idle(channel)
+        self.assertEqual(channel.peak, {"s1": 2, "s2": 1})
+        self.assertEqual(sorted(channel.handled), ["m0", "m1", "m2", "m3", "m4", "m5", "other"])
+
+    def test_handler_lane(self):
+        """测试只有语音输入走voice通道，需要语音回复的文本消息仍走text通道"""
+        channel = make_channel()
+        lane = channel._select_handler_lane
+        self.assertEqual(lane(Context(ContextType.TEXT, "#help")), "command")
+        self.assertEqual(lane(Context(ContextType.VOICE, "voice.silk")), "voice")
+        self.assertEqual(lane(Context(ContextType.TEXT, "你好", kwargs={"desire_rtype": ReplyType.VOICE})), "text")
+        self.assertEqual(lane(Context(ContextType.IMAGE, "image.png")), "media")
+        self.assertEqual(set(get_handler_pool_stats()), {"command", "text", "voice", "media"})
+
+
+if __name__ == '__main__':
+    unittest.main()
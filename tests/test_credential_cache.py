@@ -0,0 +1,88 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from common.credential_cache import CredentialCache, credential_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Fetcher:
+    def __init__(self, expires_in=3600, delay=0):
+        self.calls = 0
+        self.expires_in = expires_in
+        self.delay = delay
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return "token-{}".format(self.calls), self.expires_in
+
+
+class TestCredentialCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "credentials.json")
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_single_flight(self):
+        """测试多个线程同时获取时只请求一次"""
+        cache = CredentialCache(refresh_ahead=300, clock=self.clock)
+        fetcher = Fetcher(delay=0.05)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get("k", fetcher))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(fetcher.calls, 1)
+        self.assertEqual(results, ["token-1"] * 8)
+
+    def test_refresh_ahead(self):
+        """测试过期前在后台刷新，刷新期间返回旧凭证"""
+        cache = CredentialCache(refresh_ahead=300, clock=self.clock)
+        fetcher = Fetcher(delay=0.05)
+        cache.get("k", fetcher)
+        self.clock.now += 3600 - 200
+        self.assertEqual(cache.get("k", fetcher), "token-1")
+        for _ in range(100):
+            if cache.get("k", fetcher) == "token-2":
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get("k", fetcher), "token-2")
+        self.assertEqual(fetcher.calls, 2)
+
+    def test_persist_and_invalidate(self):
+        cache = CredentialCache(self.path, clock=self.clock)
+        fetcher = Fetcher()
+        cache.get("k", fetcher)
+        # 重启后直接使用磁盘中的凭证
+        cache = CredentialCache(self.path, clock=self.clock)
+        self.assertEqual(cache.get("k", fetcher), "token-1")
+        # 只有传入的凭证仍是当前凭证时才删除
+        cache.invalidate("k", "token-0")
+        self.assertEqual(cache.get("k", fetcher), "token-1")
+        cache.invalidate("k", "token-1")
+        self.assertEqual(cache.get("k", fetcher), "token-2")
+        # 已过期的凭证不会加载
+        self.clock.now += 3600
+        self.assertEqual(CredentialCache(self.path, clock=self.clock).get("k", fetcher), "token-3")
+
+    def test_credential_key(self):
+        self.assertNotEqual(credential_key("feishu", "app", "s1"), credential_key("feishu", "app", "s2"))
+        self.assertNotIn("secret", credential_key("baidu", "key", "secret"))
+
+
+if __name__ == '__main__':
+    unittest.main()
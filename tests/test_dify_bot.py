@@ -0,0 +1,98 @@
+import json
+import unittest
+
+from bot.dify.dify_bot import DifyBot
+from bot.dify.dify_session import DifySession
+
+
+class FakeResponse:
+    def __init__(self, events):
+        self.lines = []
+        for event in events:
+            self.lines.append(event if isinstance(event, bytes) else ("data: " + json.dumps(event)).encode("utf-8"))
+            self.lines.append(b"")
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+
+def message(answer, event="agent_message"):
+    return {"event": event, "answer": answer, "conversation_id": "c1"}
+
+
+class TestDifyStream(unittest.TestCase):
+    def setUp(self):
+        self.bot = DifyBot()
+
+    def messages(self, events, split=None, state=None):
+        return list(self.bot._iter_sse_messages(FakeResponse(events), {} if state is None else state, split))
+
+    def test_iter_sse_events(self):
+        """测试跳过空行、非data行和无法解析的事件"""
+        response = FakeResponse([b"event: ping", message("a"), b"data: {broken", b"data: ", message("b")])
+        self.assertEqual([e["answer"] for e in self.bot._iter_sse_events(response)], ["a", "b"])
+
+    def test_merge_messages(self):
+        """测试连续的文本片段合并，遇到agent_thought、message_file时分开，message_end后停止"""
+        events = [
+            message("你"), message("好"),
+            {"event": "agent_thought", "conversation_id": "c1"},
+            message("图片如下"),
+            {"event": "message_file", "type": "image", "url": "/files/1.png", "conversation_id": "c1"},
+            {"event": "message_end", "conversation_id": "c1", "metadata": {"usage": {}}},
+            message("ignored"),
+        ]
+        messages = self.messages(events)
+        self.assertEqual([(m["type"], m["content"] if m["type"] == "agent_message" else m["content"]["url"])
+                          for m in messages],
+                         [("agent_message", "你好"), ("agent_message", "图片如下"), ("message_file", "/files/1.png")])
+
+    def test_split_sentence(self):
+        """测试按句子切分时，句子结束就返回，不等待后续片段"""
+        events = [message("第一句。第"), message("二句"), message("！第三"), message("句")]
+        messages = self.messages(events, split="sentence")
+        self.assertEqual([m["content"] for m in messages], ["第一句。", "第二句！", "第三句"])
+
+    def test_workflow_text_chunk(self):
+        events = [
+            {"event": "workflow_started", "data": {}},
+            {"event": "text_chunk", "data": {"text": "段落一\n\n段落"}},
+            {"event": "text_chunk", "data": {"text": "二"}},
+            {"event": "workflow_finished", "data": {"outputs": {"text": "段落一\n\n段落二"}}},
+        ]
+        self.assertEqual([m["content"] for m in self.messages(events, split="paragraph")], ["段落一", "段落二"])
+        finished_only = [{"event": "workflow_finished", "data": {"outputs": {"text": "结果"}}}]
+        self.assertEqual([m["content"] for m in self.messages(finished_only)], ["结果"])
+
+    def test_error_event(self):
+        """测试error事件抛出异常，之前已收到的conversation_id已经设置到session"""
+        session = DifySession("s1", "user")
+        events = [message("部分"), {"event": "error", "message": "rate limited"}]
+        with self.assertRaises(Exception):
+            self.messages(events, state={"session": session})
+        self.assertEqual(session.get_conversation_id(), "c1")
+
+    def test_conversation_id_from_first_event(self):
+        """测试收到第一个事件时就设置conversation_id，已有的conversation_id不被覆盖"""
+        session = DifySession("s1", "user")
+        state = {"session": session}
+        events = [{"event": "agent_thought", "conversation_id": "c1"}, message("a。")]
+        messages = self.bot._iter_sse_messages(FakeResponse(events), state, "sentence")
+        next(messages)
+        self.assertEqual(state["conversation_id"], "c1")
+        self.assertEqual(session.get_conversation_id(), "c1")
+        session = DifySession("s2", "user", conversation_id="c0")
+        self.messages(events, state={"session": session})
+        self.assertEqual(session.get_conversation_id(), "c0")
+
+    def test_split_stream_text(self):
+        split = self.bot._split_stream_text
+        self.assertEqual(split("你好。今天", "sentence"), ("你好。", "今天"))
+        self.assertEqual(split("Hi. There", "sentence"), ("Hi.", "There"))
+        self.assertEqual(split("v1.2 版本", "sentence"), ("", "v1.2 版本"))
+        self.assertEqual(split("一\n\n二\n三", "paragraph"), ("一", "二\n三"))
+        self.assertEqual(split("你好。", "unknown"), ("", "你好。"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common.download_cache import DownloadCache
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    body = b"file-v1"
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        FileHandler.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == FileHandler.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", FileHandler.etag)
+        self.send_header("Content-Length", str(len(FileHandler.body)))
+        self.end_headers()
+        self.wfile.write(FileHandler.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloadCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:{}/docs/manual.pdf".format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        FileHandler.requests = []
+        FileHandler.body, FileHandler.etag = b"file-v1", '"v1"'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_fresh_hit_without_request(self):
+        cache = DownloadCache(self.tmp_dir.name, 1024 * 1024, ttl=60)
+        path = cache.get(self.url)
+        self.assertEqual(os.path.basename(path), "manual.pdf")
+        self.assertEqual(cache.get(self.url), path)
+        self.assertEqual(FileHandler.requests, [None])
+
+    def test_revalidate_with_etag(self):
+        """测试过期后带ETag确认，未修改时使用缓存，修改后重新下载"""
+        cache = DownloadCache(self.tmp_dir.name, 1024 * 1024, ttl=0)
+        path = cache.get(self.url)
+        self.assertEqual(self.read(cache.get(self.url)), b"file-v1")
+        FileHandler.body, FileHandler.etag = b"file-v2", '"v2"'
+        self.assertEqual(self.read(cache.get(self.url)), b"file-v2")
+        self.assertEqual(FileHandler.requests, [None, '"v1"', '"v1"'])
+        # 重新创建的缓存从meta.json恢复ETag
+        cache = DownloadCache(self.tmp_dir.name, 1024 * 1024, ttl=0)
+        self.assertEqual(cache.get(self.url), path)
+        self.assertEqual(FileHandler.requests[-1], '"v2"')
+
+    def test_prune(self):
+        """测试超出大小时删除最久未使用的文件，最近使用过的文件保留"""
+        cache = DownloadCache(self.tmp_dir.name, 10, ttl=60)
+        first = cache.get(self.url)
+        second = cache.get(self.url + "?v=2")
+        self.assertTrue(os.path.exists(first))
+        used_at = time.time() - 60
+        os.utime(first, (used_at, used_at))
+        third = cache.get(self.url + "?v=3")
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second) and os.path.exists(third))
+
+    def test_fresh_hit_removed_by_prune(self):
+        """测试确认缓存文件存在后文件被其他线程淘汰删除时，重新下载"""
+        removed = []
+
+        class RacingCache(DownloadCache):
+            racing = False
+
+            def _cached_path(self, key, meta):
+                path = super()._cached_path(key, meta)
+                if path and self.racing:
+                    self.racing = False
+                    removed.append(path)
+                    os.remove(path)
+                return path
+
+        cache = RacingCache(self.tmp_dir.name, 1024 * 1024, ttl=60)
+        path = cache.get(self.url)
+        cache.racing = True
+        self.assertEqual(self.read(cache.get(self.url)), b"file-v1")
+        self.assertEqual(removed, [path])
+        self.assertEqual(FileHandler.requests, [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
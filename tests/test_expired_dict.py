@@ -0,0 +1,79 @@
+import time
+import unittest
+
+from common.expired_dict import ExpiredDict
+
+
+class TestExpiredDict(unittest.TestCase):
+    def test_get_and_expire(self):
+        """测试读取与过期"""
+        d = ExpiredDict(0.05)
+        d["a"] = 1
+        self.assertEqual(d["a"], 1)
+        self.assertIn("a", d)
+        time.sleep(0.06)
+        self.assertNotIn("a", d)
+        self.assertIsNone(d.get("a"))
+
+    def test_read_refreshes_expiry(self):
+        """测试读取会刷新过期时间"""
+        d = ExpiredDict(0.1)
+        d["a"] = 1
+        for _ in range(3):
+            time.sleep(0.05)
+            self.assertEqual(d.get("a"), 1)
+
+    def test_sweep_unread_keys(self):
+        """测试未再读取的key会在写入时被清理"""
+        d = ExpiredDict(0.05)
+        for i in range(10):
+            d[i] = i
+        time.sleep(0.06)
+        d["new"] = 1
+        self.assertEqual(len(d), 1)
+        self.assertEqual(d.keys(), ["new"])
+
+    def test_lru_eviction(self):
+        """测试超出max_size时淘汰最久未访问的key"""
+        d = ExpiredDict(60, max_size=2)
+        d["a"] = 1
+        d["b"] = 2
+        d["a"]
+        d["c"] = 3
+        self.assertEqual(sorted(d.keys()), ["a", "c"])
+
+    def test_items_and_delete(self):
+        """测试遍历与删除"""
+        d = ExpiredDict(60)
+        d["a"] = 1
+        d["b"] = 2
+        del d["a"]
+        d["a"] = 3
+        self.assertEqual(d.items(), [("b", 2), ("a", 3)])
+        self.assertEqual(d.pop("b"), 2)
+        self.assertEqual(d.pop("b", None), None)
+        self.assertEqual(list(d), ["a"])
+        d.clear()
+        self.assertEqual(len(d), 0)
+
+    def test_heap_compaction(self):
+        """测试反复删除、重新写入和LRU淘汰留下的失效记录不会让堆无限增长"""
+        d = ExpiredDict(0.05)
+        for i in range(1000):
+            d["k"] = i
+            del d["k"]
+        d["a"] = 1
+        self.assertLessEqual(len(d._heap), ExpiredDict.COMPACT_MIN + 1)
+        lru = ExpiredDict(60, max_size=100)
+        for i in range(10000):
+            lru[i] = i
+        self.assertLessEqual(len(lru._heap), 2 * 100 + 1)
+        self.assertEqual(len(lru), 100)
+        # 重建后的堆仍能清理过期的key
+        time.sleep(0.06)
+        d["b"] = 2
+        self.assertEqual(d.keys(), ["b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
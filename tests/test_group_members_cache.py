@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+
+from database.group_members_cache import MISS, GroupMemberCache
+
+
+class SlowLoader:
+    """记录调用次数，等待release后返回成员"""
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = 0
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def __call__(self, group_id):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(1)
+        return self.names
+
+
+class TestGroupMemberCache(unittest.TestCase):
+    def test_single_flight(self):
+        """测试同一个群的并发加载只调用一次loader，其余调用等待结果"""
+        loader = SlowLoader({"wx1": "Alice", "wx2": "Bob"})
+        cache = GroupMemberCache(loader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.load_group("g1", wxid="wx1")))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        self.assertTrue(loader.started.wait(1))
+        loader.release.set()
+        for t in threads:
+            t.join(1)
+        self.assertEqual(loader.calls, 1)
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+        self.assertEqual(cache.get("g1", "wx2"), "Bob")
+        # 已缓存的成员不再加载
+        self.assertFalse(cache.load_group("g1", wxid="wx1"))
+        self.assertEqual(loader.calls, 1)
+
+    def test_negative_cache(self):
+        """测试未找到的成员缓存为None，negative_ttl后过期"""
+        cache = GroupMemberCache(negative_ttl=0.05)
+        self.assertIs(cache.get("g1", "wx1"), MISS)
+        cache.put("g1", "wx1", None)
+        self.assertIsNone(cache.get("g1", "wx1"))
+        time.sleep(0.06)
+        self.assertIs(cache.get("g1", "wx1"), MISS)
+
+    def test_refresh_ahead(self):
+        """测试临近过期时后台刷新，刷新完成前的命中不会重复触发"""
+        loader = SlowLoader({"wx1": "Alice2"})
+        cache = GroupMemberCache(loader, ttl=10, refresh_ahead=True, refresh_ratio=0.5)
+        cache.put("g1", "wx1", "Alice", ttl=1)
+        cache.put("g1", "wx2", "Bob")
+        self.assertEqual(cache.get("g1", "wx2"), "Bob")  # 离过期还早，不刷新
+        self.assertEqual(cache.get("g1", "wx1"), "Alice")
+        self.assertIn("g1", cache._inflight)  # get返回前已标记为加载中
+        for _ in range(5):
+            self.assertEqual(cache.get("g1", "wx1"), "Alice")
+        self.assertTrue(loader.started.wait(1))
+        loader.release.set()
+        for _ in range(100):
+            if cache.get("g1", "wx1") == "Alice2":
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get("g1", "wx1"), "Alice2")
+        self.assertEqual(loader.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
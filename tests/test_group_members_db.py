@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from channel import chat_channel
+from database import group_members_db
+from database.group_members_cache import GroupMemberCache
+
+
+class TestGroupMembersDb(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.saved = (group_members_db.DB_PATH, group_members_db._local, group_members_db._initialized)
+        group_members_db.DB_PATH = os.path.join(self.work_dir, "group_members.db")
+        group_members_db._local = threading.local()
+        group_members_db._initialized = False
+
+    def tearDown(self):
+        conn = getattr(group_members_db._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        group_members_db.DB_PATH, group_members_db._local, group_members_db._initialized = self.saved
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_thread_local_connection(self):
+        """测试同一线程复用一个WAL模式的连接，不同线程使用各自的连接"""
+        conn = group_members_db.get_connection()
+        self.assertIs(group_members_db.get_connection(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        others = []
+
+        def worker():
+            other = group_members_db.get_connection()
+            others.append(other)
+            other.close()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join(5)
+        self.assertEqual(len(others), 1)
+        self.assertIsNot(others[0], conn)
+
+    def test_save_and_get(self):
+        group_members_db.save_group_members_to_db("g1", [
+            {"UserName": "wx1", "DisplayName": "Alice", "NickName": "A"},
+            {"wxid": "wx2", "display_name": "Bob", "nickname": "B"},
+        ])
+        group_members_db.save_group_members_to_db("g1", [{"UserName": "wx1", "DisplayName": "Alice2"}])
+        self.assertEqual(group_members_db.get_group_member_from_db("g1", "wx1"),
+                         {"display_name": "Alice2", "nickname": None})
+        self.assertEqual(group_members_db.get_group_member_from_db("g1", "wx2"),
+                         {"display_name": "Bob", "nickname": "B"})
+        self.assertIsNone(group_members_db.get_group_member_from_db("g2", "wx1"))
+
+    def test_bulk_lookup(self):
+        """测试批量查询超过单条语句参数上限时分批查询，重复和不存在的wxid被忽略"""
+        members = [{"UserName": "wx{}".format(i), "DisplayName": "name{}".format(i)} for i in range(2000)]
+        group_members_db.save_group_members_to_db("g1", members)
+        group_members_db.save_group_members_to_db("g2", [{"UserName": "wx1", "DisplayName": "other"}])
+        wxids = ["wx{}".format(i) for i in range(0, 2000, 2)] + ["wx0", "missing"]
+        result = group_members_db.get_group_members_from_db("g1", wxids)
+        self.assertEqual(len(result), 1000)
+        self.assertEqual(result["wx1998"], {"display_name": "name1998", "nickname": None})
+        self.assertNotIn("missing", result)
+        self.assertEqual(group_members_db.get_group_members_from_db("g1", []), {})
+
+    def test_display_names_batch(self):
+        """测试批量获取@名称：先查缓存，未命中的用一次sqlite查询，仍查不到时只加载一次整个群"""
+        loads = []
+
+        def loader(group_id):
+            loads.append(group_id)
+            return {"wx3": "Carol"}
+
+        saved_cache = chat_channel._group_member_cache
+        chat_channel._group_member_cache = GroupMemberCache(loader)
+        try:
+            chat_channel._group_member_cache.put("g1", "wx1", "Alice")
+            group_members_db.save_group_members_to_db("g1", [{"UserName": "wx2", "NickName": "Bob"}])
+            names = chat_channel.get_group_member_display_names("g1", ["wx1", "wx2", "wx3", "wx4"])
+            self.assertEqual(names, {"wx1": "Alice", "wx2": "Bob", "wx3": "Carol", "wx4": None})
+            self.assertEqual(loads, ["g1"])
+            # 第二次全部命中缓存，包括缓存的未找到结果
+            self.assertEqual(chat_channel.get_group_member_display_names("g1", ["wx2", "wx4"]), {"wx2": "Bob", "wx4": None})
+            self.assertEqual(chat_channel.get_group_member_display_name("g1", "wx3"), "Carol")
+            self.assertEqual(loads, ["g1"])
+        finally:
+            chat_channel._group_member_cache = saved_cache
+
+
+if __name__ == '__main__':
+    unittest.main()
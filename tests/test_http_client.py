@@ -0,0 +1,97 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import http_client
+from config import conf
+
+
+class CookieHandler(BaseHTTPRequestHandler):
+    failures = {}  # path -> 还需要返回503的次数
+
+    def do_GET(self):
+        if self.fail():
+            return
+        body = (self.headers.get("Cookie") or "").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Set-Cookie", "sid=user-a; Path=/")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self.fail():
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def fail(self):
+        if self.failures.get(self.path, 0) <= 0:
+            return False
+        self.failures[self.path] -= 1
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        return True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), CookieHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:{}/".format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_cookies_not_shared(self):
+        """测试共享Session不保存服务端cookie，调用方显式传入的cookie仍会发送"""
+        first = http_client.get(self.url)
+        self.assertEqual(first.cookies.get("sid"), "user-a")
+        self.assertEqual(http_client.get(self.url).text, "")
+        self.assertEqual(len(http_client.get_session(self.url).cookies), 0)
+        self.assertEqual(http_client.get(self.url, cookies={"sid": "user-b"}).text, "sid=user-b")
+
+    def test_connection_reused(self):
+        for _ in range(3):
+            http_client.get(self.url).close()
+        stats = http_client.get_stats()[self.url.rstrip("/")]
+        self.assertEqual(stats["connections"], 1)
+
+    def test_endpoint_policy_retry(self):
+        """测试按最长前缀匹配策略，GET遇到配置的状态码时重试，POST默认不重试"""
+        http_client.set_endpoint_policy(self.url, retries=0)
+        http_client.set_endpoint_policy(self.url + "flaky", retries=2, backoff=0, retry_on_status=http_client.GATEWAY_ERRORS)
+        CookieHandler.failures["/flaky"] = 2
+        self.assertEqual(http_client.get(self.url + "flaky").status_code, 200)
+        self.assertEqual(CookieHandler.failures["/flaky"], 0)
+        CookieHandler.failures["/flaky"] = 1
+        self.assertEqual(http_client.post(self.url + "flaky", json={}).status_code, 503)
+        CookieHandler.failures["/other"] = 1
+        self.assertEqual(http_client.get(self.url + "other").status_code, 503)
+
+    def test_config_policy(self):
+        """测试从配置文件加载策略，配置文件中的策略不会被代码中注册的默认策略覆盖"""
+        saved = (conf().get("http_endpoint_policies"), http_client._policies, http_client._config_prefixes)
+        prefix = self.url + "config"
+        conf()["http_endpoint_policies"] = {prefix: {"timeout": [1, 5], "retries": 1}}
+        http_client._policies, http_client._config_prefixes = {}, None
+        try:
+            http_client.set_endpoint_policy(prefix, timeout=60)
+            http_client.set_endpoint_policy(self.url, timeout=30)
+            self.assertEqual(http_client._get_policy(prefix + "/x")["timeout"], (1, 5))
+            self.assertEqual(http_client._get_policy(prefix + "/x")["retries"], 1)
+            self.assertEqual(http_client._get_policy(self.url + "y")["timeout"], 30)
+        finally:
+            conf()["http_endpoint_policies"], http_client._policies, http_client._config_prefixes = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
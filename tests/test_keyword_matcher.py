@@ -0,0 +1,39 @@
+import importlib.util
+import unittest
+
+# plugins.keyword依赖插件管理器，这里直接按文件路径加载
+_spec = importlib.util.spec_from_file_location("keyword_matcher", "plugins/keyword/matcher.py")
+_module = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_module)
+KeywordMatcher = _module.KeywordMatcher
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = KeywordMatcher(
+            exact={"你好": "exact"},
+            prefix={"天气": "weather", "天气预报": "forecast"},
+            contains={"客服": "service", "人工客服": "human", "退款": "refund"},
+            regex={r"^订单\d{6}$": "order", r"(\w)\1{3}": "repeat"},
+        )
+
+    def test_match_order(self):
+        self.assertEqual(self.matcher.match("你好"), ("exact", "你好", "exact"))
+        self.assertEqual(self.matcher.match("天气预报北京"), ("prefix", "天气预报", "forecast"))
+        self.assertEqual(self.matcher.match("天气怎么样"), ("prefix", "天气", "weather"))
+        self.assertIsNone(self.matcher.match("今天天"))
+
+    def test_contains(self):
+        """测试取最先出现的关键词，同一位置结束时取最长的"""
+        self.assertEqual(self.matcher.match("我要找人工客服退款")[1], "人工客服")
+        self.assertEqual(self.matcher.match("退款找客服")[1], "退款")
+
+    def test_regex(self):
+        self.assertEqual(self.matcher.match("订单123456"), ("regex", r"^订单\d{6}$", "order"))
+        self.assertIsNone(self.matcher.match("订单1234567"))
+        # 使用反向引用的正则无法合并，逐个匹配
+        self.assertEqual(self.matcher.match("哈哈哈哈")[2], "repeat")
+
+
+if __name__ == '__main__':
+    unittest.main()
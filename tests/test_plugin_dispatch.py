@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import unittest
+
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from common.sorted_dict import SortedDict
+from plugins import Event, EventAction, EventContext, EventFilter, Plugin, PluginManager
+
+
+class TestPluginDispatch(unittest.TestCase):
+    def setUp(self):
+        self.manager = PluginManager()
+        self.saved = (self.manager.plugins, self.manager.listening_plugins, self.manager.instances)
+        self.manager.plugins = SortedDict(lambda k, v: v.priority, reverse=True)
+        self.manager.listening_plugins = {}
+        self.manager.instances = {}
+        self.manager.handler_stats = {}
+        self.calls = []
+
+    def tearDown(self):
+        self.manager.plugins, self.manager.listening_plugins, self.manager.instances = self.saved
+        self.manager.rebuild_dispatch_table()
+
+    def add_plugin(self, name, priority, event_filter=None, action=EventAction.CONTINUE, handler=None, timeout=None,
+                   on_timeout="skip"):
+        calls = self.calls
+
+        class TestPlugin(Plugin):
+            def __init__(self):
+                super().__init__()
+                self.handlers[Event.ON_HANDLE_CONTEXT] = handler or self.on_handle_context
+                if event_filter:
+                    self.filters[Event.ON_HANDLE_CONTEXT] = event_filter
+
+            def on_handle_context(self, e_context):
+                calls.append(name)
+                e_context.action = action
+
+        TestPlugin.name, TestPlugin.priority, TestPlugin.enabled = name, priority, True
+        TestPlugin.timeout, TestPlugin.on_timeout = timeout, on_timeout
+        self.manager.plugins[name] = TestPlugin
+        self.manager.instances[name] = TestPlugin()
+        self.manager.listening_plugins.setdefault(Event.ON_HANDLE_CONTEXT, []).append(name)
+
+    def emit(self, ctype=ContextType.TEXT, content="hello", channel=None):
+        e_context = EventContext(Event.ON_HANDLE_CONTEXT, {"channel": channel, "context": Context(ctype, content)})
+        return self.manager.emit_event(e_context)
+
+    def test_order_filter_and_break(self):
+        """测试按优先级调用、跳过不满足过滤条件的插件，以及中断后不再调用"""
+        self.add_plugin("LOW", 1)
+        self.add_plugin("HIGH", 10, EventFilter(prefixes=["$"]))
+        self.add_plugin("IMAGE", 5, EventFilter(ctypes=[ContextType.IMAGE]))
+        self.add_plugin("BREAK", 3, EventFilter(ctypes=[ContextType.TEXT]), EventAction.BREAK_PASS)
+        self.manager.refresh_order()
+
+        e_context = self.emit(content="$cmd")
+        self.assertEqual(self.calls, ["HIGH", "BREAK"])
+        self.assertEqual(e_context["breaked_by"], "BREAK")
+        self.calls.clear()
+        self.emit(ctype=ContextType.IMAGE)
+        self.assertEqual(self.calls, ["IMAGE", "LOW"])
+        stats = {item[0]: item[1] for item in self.manager.get_handler_stats()}
+        self.assertEqual(stats, {"HIGH": 1, "BREAK": 1, "IMAGE": 1, "LOW": 1})
+
+    def test_disabled_plugin_removed_from_table(self):
+        self.add_plugin("A", 1)
+        self.add_plugin("B", 2)
+        self.manager.refresh_order()
+        self.manager.plugins["B"].enabled = False
+        self.manager.rebuild_dispatch_table()
+        self.emit()
+        self.assertEqual(self.calls, ["A"])
+
+    def test_async_handler(self):
+        async def handler(e_context):
+            await asyncio.sleep(0.01)
+            e_context["reply"] = Reply(ReplyType.TEXT, "async")
+            e_context.action = EventAction.BREAK_PASS
+
+        self.add_plugin("ASYNC", 1, handler=handler)
+        self.manager.refresh_order()
+        e_context = self.emit()
+        self.assertEqual(e_context["reply"].content, "async")
+        self.assertTrue(e_context.is_pass())
+
+    def test_timeout_skip(self):
+        """测试超时的插件被跳过，之后对e_context的修改不生效"""
+        release = threading.Event()
+
+        def handler(e_context):
+            release.wait(1)
+            e_context.action = EventAction.BREAK_PASS
+
+        self.add_plugin("SLOW", 10, handler=handler, timeout=0.05)
+        self.add_plugin("NEXT", 1)
+        self.manager.refresh_order()
+        e_context = self.emit()
+        release.set()
+        self.assertEqual(self.calls, ["NEXT"])
+        self.assertEqual(e_context.action, EventAction.CONTINUE)
+
+    def test_timeout_context_isolated(self):
+        """测试超时的插件修改context不影响原来的context，按时完成的修改写回原对象"""
+        release = threading.Event()
+        done = threading.Event()
+
+        def slow(e_context):
+            release.wait(1)
+            e_context["context"].content = "slow"
+            e_context["context"]["receiver"] = "slow"
+            done.set()
+
+        def fast(e_context):
+            e_context["context"].content = "fast"
+            e_context["context"]["session_id"] = "fast"
+
+        self.add_plugin("SLOW", 10, handler=slow, timeout=0.05)
+        self.add_plugin("FAST", 1, handler=fast, timeout=1)
+        self.manager.refresh_order()
+        context = Context(ContextType.TEXT, "hello", {"receiver": "user"})
+        e_context = self.manager.emit_event(EventContext(Event.ON_HANDLE_CONTEXT, {"channel": None, "context": context}))
+        release.set()
+        self.assertTrue(done.wait(1))
+        self.assertIs(e_context["context"], context)
+        self.assertEqual(context.content, "fast")
+        self.assertEqual(context.kwargs, {"receiver": "user", "session_id": "fast"})
+
+    def test_timeout_defer(self):
+        """测试超时的插件转为稍后回复，完成后通过channel发送回复"""
+        release = threading.Event()
+        sent = threading.Event()
+
+        class Channel:
+            def send(self, reply, context):
+                self.reply = reply
+                sent.set()
+
+        def handler(e_context):
+            release.wait(1)
+            e_context["reply"] = Reply(ReplyType.TEXT, "done")
+            e_context.action = EventAction.BREAK_PASS
+
+        self.add_plugin("SLOW", 10, handler=handler, timeout=0.05, on_timeout="defer")
+        self.add_plugin("NEXT", 1)
+        self.manager.refresh_order()
+        channel = Channel()
+        e_context = self.emit(channel=channel)
+        self.assertTrue(e_context.is_pass())
+        self.assertEqual(e_context["deferred_by"], "SLOW")
+        self.assertEqual(self.calls, [])
+        release.set()
+        self.assertTrue(sent.wait(1))
+        self.assertEqual(channel.reply.content, "done")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import time
+import unittest
+
+from bot.session_store import FileSessionStore, SqliteSessionStore
+
+
+class FakeClock:
+    """在真实时间上加偏移，sqlite和文件的修改时间都按此时钟记录"""
+
+    def __init__(self):
+        self.offset = 0
+
+    def __call__(self):
+        return time.time() + self.offset
+
+
+def msg(role, content):
+    return {"role": role, "content": content}
+
+
+class StoreCases:
+    """sqlite和file存储共用的用例"""
+
+    def create_store(self, expires_in=None):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.store = self.create_store()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_append_remove_replace(self):
+        self.assertIsNone(self.store.load("s1"))
+        self.store.append("s1", [msg("system", "prompt"), msg("user", "q1")])
+        self.store.append("s1", [msg("assistant", "a1"), msg("user", "q2")])
+        self.store.remove("s1", [1, 2])
+        messages, _ = self.store.load("s1")
+        self.assertEqual(messages, [msg("system", "prompt"), msg("user", "q2")])
+        self.store.replace("s1", [msg("system", "new"), {"role": "user", "content": "q", "name": "bob"}])
+        messages, _ = self.store.load("s1")
+        self.assertEqual(messages, [msg("system", "new"), {"role": "user", "content": "q", "name": "bob"}])
+        self.store.delete("s1")
+        self.assertIsNone(self.store.load("s1"))
+
+    def test_expiry(self):
+        """测试超过过期时间未写入的会话加载时视为不存在，并能被清理"""
+        store = self.create_store(expires_in=60)
+        store.append("old", [msg("user", "q")])
+        self.clock.offset += 30
+        store.append("new", [msg("user", "q")])
+        self.clock.offset += 40
+        self.assertIsNone(store.load("old"))
+        self.assertIsNotNone(store.load("new"))
+        store.append("old2", [msg("user", "q")])
+        self.clock.offset += 61
+        self.assertEqual(store.purge(), 2)
+        self.assertIsNone(store.load("new"))
+
+
+class TestSqliteSessionStore(StoreCases, unittest.TestCase):
+    def create_store(self, expires_in=None):
+        return SqliteSessionStore(os.path.join(self.tmp_dir.name, "sessions.db"), expires_in=expires_in, clock=self.clock)
+
+    def test_version(self):
+        self.assertIsNone(self.store.version("s1"))
+        v1 = self.store.append("s1", [msg("user", "q1")])
+        v2 = self.store.append("s1", [msg("assistant", "a1")])
+        self.assertNotEqual(v1, v2)
+        self.assertEqual(self.store.version("s1"), v2)
+        # 其他进程打开同一个数据库时能看到最新的版本
+        other = self.create_store()
+        self.assertEqual(other.load("s1")[1], v2)
+        v3 = other.remove("s1", [0])
+        self.assertEqual(self.store.version("s1"), v3)
+
+
+class TestFileSessionStore(StoreCases, unittest.TestCase):
+    def create_store(self, expires_in=None):
+        return FileSessionStore(os.path.join(self.tmp_dir.name, "journal"), compact_threshold=5,
+                                expires_in=expires_in, clock=self.clock)
+
+    def test_replay_and_compact(self):
+        for i in range(5):
+            self.store.append("s1", [msg("user", "q{}".format(i))])
+        self.store.remove("s1", [0])
+        path = self.store._path("s1")
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 1)  # 超过5行后压缩为一个快照
+        # 写入中断留下的不完整记录在重放时被忽略
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('+ ["u","broken')
+        messages, _ = self.create_store().load("s1")
+        self.assertEqual([m["content"] for m in messages], ["q1", "q2", "q3", "q4"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import unittest
+
+from common.token_bucket import TokenBucket, TokenBuckets
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_lazy_refill(self):
+        """测试不启动线程，按经过的时间补充令牌且不超过容量"""
+        threads = threading.active_count()
+        bucket = TokenBucket(60, clock=self.clock)  # 每秒1个
+        self.assertEqual(threading.active_count(), threads)
+        self.assertTrue(bucket.try_acquire(cost=60))
+        self.assertFalse(bucket.try_acquire())
+        self.clock.now += 2.5
+        self.assertTrue(bucket.try_acquire(cost=2))
+        self.assertFalse(bucket.try_acquire())
+        self.clock.now += 1000
+        self.assertEqual(bucket.available(), 60)
+
+    def test_timeout(self):
+        bucket = TokenBucket(60, timeout=0.5, clock=self.clock)
+        bucket.try_acquire(cost=60)
+        # 需要等待1秒，超过timeout，立即返回且不扣除令牌
+        self.assertFalse(bucket.get_token())
+        self.clock.now += 0.6
+        self.assertTrue(bucket.get_token(timeout=0.5))
+        self.assertAlmostEqual(bucket.available(), -0.4)
+
+    def test_async_acquire(self):
+        bucket = TokenBucket(6000)  # 每秒100个
+        bucket.try_acquire(cost=6000)
+        self.assertTrue(asyncio.run(bucket.acquire(cost=2)))
+        self.assertFalse(asyncio.run(bucket.acquire(cost=200, timeout=0.1)))
+
+    def test_keyed_buckets(self):
+        """测试按key独立限流，超过max_keys时淘汰最久未使用的"""
+        buckets = TokenBuckets(2, max_keys=2, clock=self.clock)
+        self.assertTrue(buckets.try_acquire("a", cost=2))
+        self.assertFalse(buckets.try_acquire("a"))
+        self.assertTrue(buckets.try_acquire("b"))
+        self.assertTrue(buckets.try_acquire("c"))
+        self.assertEqual(len(buckets), 2)
+        self.assertTrue(buckets.try_acquire("a"))  # a已被淘汰，重新开始
+
+
+if __name__ == '__main__':
+    unittest.main()
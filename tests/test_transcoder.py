@@ -0,0 +1,60 @@
+import threading
+import unittest
+
+from voice.transcoder import Transcoder, ffmpeg_command
+
+
+class TestTranscoder(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def runner(self, source, fmt, **options):
+        self.calls.append((fmt, options))
+        self.release.wait(1)
+        return b"converted-" + fmt.encode()
+
+    def test_concurrent_same_conversion_runs_once(self):
+        """测试相同的并发转码只执行一次，之后命中缓存"""
+        transcoder = Transcoder(max_workers=2, runner=self.runner)
+        futures = [transcoder.submit(b"voice", "wav") for _ in range(3)]
+        self.release.set()
+        self.assertEqual([f.result() for f in futures], [b"converted-wav"] * 3)
+        self.assertEqual(transcoder.transcode(b"voice", "wav"), b"converted-wav")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_options_in_cache_key(self):
+        """测试不同的输出参数分别转码"""
+        self.release.set()
+        transcoder = Transcoder(max_workers=1, runner=self.runner)
+        transcoder.transcode(b"voice", "amr", sample_rate=8000)
+        transcoder.transcode(b"voice", "amr", sample_rate=16000)
+        transcoder.transcode(b"other", "amr", sample_rate=8000)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_cache_eviction(self):
+        """测试缓存超过大小时淘汰最久未使用的结果"""
+        self.release.set()
+        transcoder = Transcoder(max_workers=1, cache_bytes=52, runner=self.runner)  # 每个结果13字节
+        for source in [b"a", b"b", b"c", b"d", b"e"]:
+            transcoder.transcode(source, "mp3")
+        self.assertEqual(transcoder.stats()["cache_bytes"], 52)
+        transcoder.transcode(b"e", "mp3")
+        self.assertEqual(len(self.calls), 5)
+        transcoder.transcode(b"a", "mp3")
+        self.assertEqual(len(self.calls), 6)
+
+    def test_fragmented_mp4_to_pipe(self):
+        """测试mp4/m4a输出到管道时使用分片MP4，m4a使用ipod封装"""
+        cmd = ffmpeg_command("voice.amr", "m4a")
+        self.assertEqual(cmd[-5:], ["-movflags", "frag_keyframe+empty_moov", "-f", "ipod", "pipe:1"])
+        self.assertNotIn("-movflags", ffmpeg_command("voice.amr", "mp3"))
+
+    def test_duration_probe(self):
+        transcoder = Transcoder(max_workers=1, runner=self.runner, prober=lambda source: 61500)
+        self.assertEqual(transcoder.duration_ms("voice.mp3"), 61500)
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
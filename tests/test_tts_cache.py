@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from bridge.reply import Reply, ReplyType
+from voice.tts_cache import TTSCache, normalize_text, warm_up
+
+
+class FakeVoice:
+    def __init__(self):
+        self.calls = 0
+        self.voice = "alloy"
+
+    def cache_params(self):
+        return {"voice": self.voice}
+
+    def textToVoice(self, text):
+        self.calls += 1
+        if text == "error":
+            return Reply(ReplyType.ERROR, "合成失败")
+        path = "tmp/reply-{}.mp3".format(self.calls)
+        with open(path, "wb") as f:
+            f.write(text.encode("utf-8") * 10)
+        return Reply(ReplyType.VOICE, path)
+
+
+class TestTTSCache(unittest.TestCase):
+    def setUp(self):
+        # TmpDir使用相对路径./tmp/，切换到临时目录避免在仓库中留下文件
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir.name)
+        os.makedirs("tmp")
+        self.cache = TTSCache(os.path.join(self.tmp_dir.name, "tts_cache"), 1024 * 1024)
+        self.voice = FakeVoice()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def test_hit_returns_disposable_copy(self):
+        """测试命中时不调用引擎，返回的文件被通道删除后缓存仍可用"""
+        first = self.cache.text_to_voice("openai", self.voice, "你好")
+        os.remove(first.content)
+        second = self.cache.text_to_voice("openai", self.voice, " 你好 ")
+        self.assertEqual(self.voice.calls, 1)
+        self.assertEqual(second.type, ReplyType.VOICE)
+        os.remove(second.content)
+        with open(self.cache.get(TTSCache.key("openai", {"voice": "alloy"}, "你好")), "rb") as f:
+            self.assertEqual(f.read(), "你好".encode("utf-8") * 10)
+
+    def test_key(self):
+        self.assertEqual(normalize_text("  你好，\n世界 "), "你好, 世界")
+        self.cache.text_to_voice("openai", self.voice, "你好")
+        self.voice.voice = "nova"
+        self.cache.text_to_voice("openai", self.voice, "你好")
+        self.cache.text_to_voice("edge", self.voice, "你好")
+        self.assertEqual(self.voice.calls, 3)
+
+    def test_error_not_cached(self):
+        self.cache.text_to_voice("openai", self.voice, "error")
+        self.cache.text_to_voice("openai", self.voice, "error")
+        self.assertEqual(self.voice.calls, 2)
+
+    def test_prune_and_reload(self):
+        cache = TTSCache(os.path.join(self.tmp_dir.name, "small"), 50)
+        cache.text_to_voice("openai", self.voice, "a")
+        cache.text_to_voice("openai", self.voice, "bbbbb")  # 50字节，超出后淘汰a
+        cache = TTSCache(os.path.join(self.tmp_dir.name, "small"), 50)
+        self.assertIsNone(cache.get(TTSCache.key("openai", {"voice": "alloy"}, "a")))
+        self.assertIsNotNone(cache.get(TTSCache.key("openai", {"voice": "alloy"}, "bbbbb")))
+
+    def test_warm_up(self):
+        warm_up(lambda text: self.cache.text_to_voice("openai", self.voice, text), ["欢迎", "稍等"])
+        self.assertEqual(os.listdir("tmp"), [])
+        self.cache.text_to_voice("openai", self.voice, "欢迎")
+        self.assertEqual(self.voice.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
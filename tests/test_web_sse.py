@@ -0,0 +1,38 @@
+import json
+import unittest
+
+from channel.web.web_channel import SSEStreams, format_sse_batch
+
+
+class TestSSEStreams(unittest.TestCase):
+    def test_stream_cap(self):
+        """测试连接数超过上限时拒绝，关闭后可以重新打开"""
+        streams = SSEStreams(max_streams=2)
+        self.assertIsNotNone(streams.open("a"))
+        self.assertIsNotNone(streams.open("a"))
+        self.assertIsNone(streams.open("b"))
+        streams.close("a")
+        self.assertIsNotNone(streams.open("b"))
+
+    def test_queue_kept_until_delivered(self):
+        """测试还有连接或有未发送的消息时不删除队列"""
+        streams = SSEStreams(max_streams=10)
+        queue = streams.open("a")
+        streams.open("a")
+        streams.close("a")
+        self.assertIs(streams.get_queue("a"), queue)
+        queue.put({"content": "hi"})
+        streams.close("a")
+        self.assertIs(streams.get_queue("a"), queue)
+        queue.get_nowait()
+        streams.open("a")
+        streams.close("a")
+        self.assertNotIn("a", streams.queues)
+
+    def test_format_batch(self):
+        events = format_sse_batch([{"content": "a"}, {"content": "b"}]).split("\n\n")
+        self.assertEqual([json.loads(e[len("data: "):]) for e in events if e], [{"content": "a"}, {"content": "b"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+# plugins.banwords依赖插件管理器，这里直接按文件路径加载
+_spec = importlib.util.spec_from_file_location("words_search", "plugins/banwords/lib/WordsSearch.py")
+_module = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_module)
+WordsSearch = _module.WordsSearch
+
+
+class TestWordsSearch(unittest.TestCase):
+    def setUp(self):
+        self.search = WordsSearch()
+        self.search.SetKeywords(["中国", "国人", "中国人", "he", "she", "his", "hers", "中国"])
+
+    def test_find_all(self):
+        """测试重叠与重复的关键词都能找到"""
+        results = self.search.FindAll("我是中国人ushers")
+        found = sorted((r["Keyword"], r["Start"], r["End"], r["Index"]) for r in results)
+        self.assertEqual(found, [("he", 7, 8, 3), ("hers", 7, 10, 6), ("she", 6, 8, 4), ("中国", 2, 3, 0),
+                                 ("中国", 2, 3, 7), ("中国人", 2, 4, 2), ("国人", 3, 4, 1)])
+        self.assertEqual(self.search.FindFirst("ushers")["Keyword"], "she")
+        self.assertIsNone(self.search.FindFirst("你好"))
+
+    def test_replace_and_batch(self):
+        self.assertEqual(self.search.Replace("我是中国人ushers"), "我是***u*****")
+        self.assertEqual(self.search.ContainsAnyBatch(["你好", "他的his", ""]), [False, True, False])
+
+    def test_save_and_load(self):
+        """测试保存的索引文件加载后结果一致"""
+        text = "我是中国人ushers"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "banwords.idx")
+            self.search.Save(path)
+            for use_mmap in (True, False):
+                loaded = WordsSearch.Load(path, use_mmap=use_mmap)
+                self.assertEqual(loaded._goto, {})  # 加载时不构建转移字典
+                self.assertEqual(loaded.FindAll(text), self.search.FindAll(text))
+                self.assertLess(sum(loaded._loaded), len(loaded._loaded))
+                self.assertEqual(loaded.Replace(text), self.search.Replace(text))
+                del loaded
+
+
+if __name__ == '__main__':
+    unittest.main()
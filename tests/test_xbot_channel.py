@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import web
+
+from channel.xbot.gewechat_channel import XBotChannel
+from config import conf
+from database import group_members_db
+
+
+def setUpModule():
+    """ChatChannel初始化时会创建群成员数据库，测试时放到临时目录"""
+    global work_dir, saved_db
+    work_dir = tempfile.mkdtemp()
+    saved_db = (group_members_db.DB_PATH, group_members_db._local, group_members_db._initialized)
+    group_members_db.DB_PATH = os.path.join(work_dir, "group_members.db")
+    group_members_db._local = threading.local()
+    group_members_db._initialized = False
+
+
+def tearDownModule():
+    group_members_db.DB_PATH, group_members_db._local, group_members_db._initialized = saved_db
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def make_msg(msg_id, content="hi"):
+    return {
+        "MsgId": msg_id,
+        "NewMsgId": msg_id * 10,
+        "FromUserName": {"string": "wxid_friend"},
+        "ToUserName": {"string": "wxid_bot"},
+        "MsgType": 1,
+        "Content": {"string": content},
+        "MsgSource": "",
+    }
+
+
+class FakeClient:
+    """按顺序返回预设的同步结果，记录每次请求使用的synckey"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.synckeys = []
+
+    def sync_message(self, wxid, device_id, device_name, synckey=""):
+        self.synckeys.append(synckey)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TestXBotChannel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.saved_base_url = conf().get("xbot_base_url")
+        conf()["xbot_base_url"] = cls.saved_base_url or "http://127.0.0.1:9011/api"
+
+    @classmethod
+    def tearDownClass(cls):
+        conf()["xbot_base_url"] = cls.saved_base_url
+
+    def setUp(self):
+        self.channel = XBotChannel()
+        self.produced = []
+        self.channel.produce = self.produced.append
+        self.channel._compose_context = lambda ctype, content, **kwargs: content
+        self.channel.received_msgs.clear()
+        self.channel.synckey = ""
+        self.channel.callback_token = None
+
+    def tearDown(self):
+        for name in ["produce", "_compose_context", "client"]:
+            self.channel.__dict__.pop(name, None)
+
+    def test_extract_messages(self):
+        """测试从同步结果、回调推送和嵌套的Data中取出消息列表"""
+        extract = XBotChannel()._extract_messages
+        msg = make_msg(1)
+        self.assertEqual(extract({"AddMsgs": [msg], "KeyBuf": {"buffer": "k"}}), [msg])
+        self.assertEqual(extract({"Data": {"Data": {"MsgList": [msg]}}}), [msg])
+        callback = {"TypeName": "AddMsg", "Data": msg, "Wxid": "wxid_bot"}
+        self.assertEqual(extract(callback), [callback])
+        self.assertEqual(extract([msg]), [msg])
+        self.assertEqual(extract(msg), [msg])
+        self.assertEqual(extract({"AddMsgs": None}), [])
+        self.assertEqual(extract("bad"), [])
+
+    def test_extract_synckey(self):
+        extract = XBotChannel()._extract_synckey
+        self.assertEqual(extract({"KeyBuf": {"buffer": "k1"}}), "k1")
+        self.assertEqual(extract({"SyncKey": {"Buffer": "k2"}}), "k2")
+        self.assertEqual(extract({"Synckey": "k3"}), "k3")
+        self.assertIsNone(extract({"KeyBuf": {"iLen": 0}}))
+
+    def test_duplicate_message(self):
+        """测试回调重试等原因收到的重复消息只处理一次"""
+        self.channel._handle_messages([make_msg(1), make_msg(2, "again")])
+        self.channel._handle_messages([{"Data": make_msg(1)}, make_msg(3, "new")])
+        self.assertEqual(self.produced, ["hi", "again", "new"])
+
+    def test_next_sync_interval(self):
+        """测试空闲时间隔从最小值翻倍增长到最大值，收到消息后立即再次同步"""
+        interval, intervals = 0, []
+        for received in [False, False, False, False, False, True, False]:
+            interval = XBotChannel()._next_sync_interval(interval, received, 0.1, 0.5)
+            intervals.append(interval)
+        self.assertEqual(intervals, [0.1, 0.2, 0.4, 0.5, 0.5, 0, 0.1])
+
+    def test_sync_once(self):
+        """测试同步结果中的synckey用于下一次同步，收到消息时返回True"""
+        self.channel.client = FakeClient([
+            {"Data": {"AddMsgs": [make_msg(1)], "KeyBuf": {"buffer": "k1"}}},
+            {"Data": {"AddMsgs": [], "KeyBuf": {"buffer": "k2"}}},
+            {"Success": False},
+            RuntimeError("network"),
+        ])
+        self.assertEqual([self.channel._sync_once() for _ in range(4)], [True, False, False, False])
+        self.assertEqual(self.channel.client.synckeys, ["", "k1", "k2", "k2"])
+        self.channel.receive_pool.submit(lambda: None).result(1)
+        self.assertEqual(self.produced, ["hi"])
+
+    def test_callback_token(self):
+        """测试回调地址带上token，token不正确或未启用回调时拒绝请求"""
+        self.channel.callback_token = "secret"
+        self.assertEqual(self.channel._signed_callback_url("http://10.0.0.2:9919/xbot/callback?a=1"),
+                         "http://10.0.0.2:9919/xbot/callback?a=1&token=secret")
+        app = web.application(("/xbot/callback/?", "channel.xbot.gewechat_channel.Query"), autoreload=False)
+        body = json.dumps({"TypeName": "AddMsg", "Data": make_msg(5), "Wxid": "wxid_bot"})
+        self.assertEqual(app.request("/xbot/callback", method="POST", data=body).status, "403 Forbidden")
+        self.assertEqual(app.request("/xbot/callback?token=wrong", method="POST", data=body).status, "403 Forbidden")
+        self.assertEqual(app.request("/xbot/callback", method="POST", data=body,
+                                     headers={"X-Callback-Token": "secret"}).data, b"success")
+        self.assertEqual(app.request("/xbot/callback?token=secret", method="POST", data=body).data, b"success")
+        self.channel.receive_pool.submit(lambda: None).result(1)
+        self.assertEqual(self.produced, ["hi"])
+        self.channel.callback_token = None
+        self.assertFalse(self.channel._check_callback_token(""))
+        self.assertFalse(self.channel._check_callback_token("secret"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from bot.xunfei.spark_client import SparkClient, SparkError
+
+
+async def spark_handler(request):
+    """模拟星火接口: 把提问按字拆成多帧返回，提问为error时返回错误码"""
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    params = json.loads((await ws.receive()).data)
+    question = params["payload"]["message"]["text"][-1]["content"]
+    if question == "error":
+        await ws.send_str(json.dumps({"header": {"code": 10013, "message": "input content audit failed"}}))
+        await ws.close()
+        return ws
+    for i, ch in enumerate(question):
+        status = 2 if i == len(question) - 1 else 1
+        frame = {"header": {"code": 0}, "payload": {"choices": {"status": status, "text": [{"content": ch}]}}}
+        if status == 2:
+            frame["payload"]["usage"] = {"text": {"total_tokens": len(question)}}
+        await asyncio.sleep(0.01)
+        await ws.send_str(json.dumps(frame))
+    await ws.close()
+    return ws
+
+
+class TestSparkClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get("/v3.5/chat", spark_handler)
+        cls.runner = web.AppRunner(app)
+        cls.loop.run_until_complete(cls.runner.setup())
+        site = web.TCPSite(cls.runner, "127.0.0.1", 0)
+        cls.loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        threading.Thread(target=cls.loop.run_forever, daemon=True).start()
+        cls.client = SparkClient("app", "key", "secret", "ws://127.0.0.1:{}/v3.5/chat".format(port), "generalv3.5", timeout=5)
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(cls.runner.cleanup(), cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+
+    def messages(self, question):
+        return [{"role": "user", "content": question}]
+
+    def test_chat(self):
+        self.assertEqual(self.client.chat(self.messages("你好呀")), ("你好呀", {"total_tokens": 3}))
+
+    def test_stream(self):
+        items = list(self.client.stream(self.messages("abc")))
+        self.assertEqual([item.reply for item in items], ["a", "b", "c"])
+        self.assertEqual([item.is_end for item in items], [False, False, True])
+
+    def test_error(self):
+        with self.assertRaises(SparkError) as cm:
+            self.client.chat(self.messages("error"))
+        self.assertEqual(cm.exception.code, 10013)
+
+    def test_concurrent(self):
+        """测试多个请求在同一个事件循环中并发，不额外创建线程"""
+        questions = ["q{:02d}".format(i) for i in range(20)]
+        self.client.chat(self.messages("warm"))
+        threads = threading.active_count()
+        with ThreadPoolExecutor(len(questions)) as pool:
+            results = list(pool.map(lambda q: self.client.chat(self.messages(q))[0], questions))
+            self.assertLessEqual(threading.active_count(), threads + len(questions))
+        self.assertEqual(results, questions)
+
+
+if __name__ == '__main__':
+    unittest.main()
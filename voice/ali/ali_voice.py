@@ -42,6 +42,12 @@ class AliVoice(Voice):
         except Exception as e:
             logger.warn("AliVoice init failed: %s, ignore " % e)
 
+    def cache_params(self):
+        """
+        发音人、语速等在阿里云控制台按项目(app_key)配置，不同项目的合成结果不同
+        """
+        return {"url": getattr(self, "api_url_text_to_voice", None), "app_key": getattr(self, "app_key", None)}
+
     def textToVoice(self, text):
         """
         将文本转换为语音文件。
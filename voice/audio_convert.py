@@ -1,25 +1,35 @@
+import io
 import os
 import shutil
+import struct
+import tempfile
+import warnings
 import wave
 
 from common.log import logger
+from voice.transcoder import get_transcoder
 
 try:
     import pysilk
 except ImportError:
-    logger.debug("import pysilk failed, wechaty voice message will not be supported.")
-
-try:
-    from pydub import AudioSegment
-except ImportError:
-    logger.warning("import pydub failed, wechat voice conversion will not be supported. Try: pip install pydub")
-
+    pysilk = None
 try:
     import pilk
 except ImportError:
-    logger.warning("import pilk failed, silk voice conversion will not be supported. Try: pip install pilk")
+    pilk = None
+if pysilk is None and pilk is None:
+    logger.warning("import pysilk failed, silk voice conversion will not be supported. Try: pip install silk-python")
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:  # python3.13移除了audioop，改用ffmpeg重采样
+        audioop = None
 
 sil_supports = [8000, 12000, 16000, 24000, 32000, 44100, 48000]  # slk转wav时，支持的采样率
+# AMR-NB 各帧类型的语音数据字节数(不含1字节帧头)，每帧20ms
+AMR_NB_FRAME_SIZES = [12, 13, 15, 17, 19, 20, 26, 31, 5, 6, 5, 5, 0, 0, 0, 0]
 
 
 def find_closest_sil_supports(sample_rate):
@@ -49,6 +59,168 @@ def get_pcm_from_wav(wav_path):
     return wav.readframes(wav.getnframes())
 
 
+def fix_wav_header(data):
+    """
+    ffmpeg输出wav到管道时无法回写长度字段，这里按实际长度修正RIFF和data块的长度
+    """
+    data = bytearray(data)
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = bytes(data[pos:pos + 4])
+        if chunk_id == b"data":
+            struct.pack_into("<I", data, pos + 4, len(data) - pos - 8)
+            break
+        chunk_size = struct.unpack_from("<I", data, pos + 4)[0]
+        pos += 8 + chunk_size + (chunk_size & 1)
+    struct.pack_into("<I", data, 4, len(data) - 8)
+    return bytes(data)
+
+
+def wav_duration_ms(wav_data):
+    with wave.open(io.BytesIO(wav_data), "rb") as wav:
+        return wav.getnframes() * 1000 // wav.getframerate()
+
+
+def amr_duration_ms(amr_data):
+    """按帧数计算AMR-NB音频的时长"""
+    pos = 6 if amr_data[:6] == b"#!AMR\n" else 0
+    frames = 0
+    while pos < len(amr_data):
+        frame_type = (amr_data[pos] >> 3) & 0x0F
+        pos += 1 + AMR_NB_FRAME_SIZES[frame_type]
+        frames += 1
+    return frames * 20
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+# 以下为内存中的转换接口，输入输出均为bytes/memoryview，PCM均为16bit小端
+
+
+def pcm_to_wav(pcm, rate, channels=1, sample_width=2):
+    """PCM数据加上wav头"""
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(pcm), b"WAVE",
+        b"fmt ", 16, 1, channels, rate, rate * channels * sample_width, channels * sample_width, sample_width * 8,
+        b"data", len(pcm),
+    )
+    return b"".join((header, pcm))
+
+
+def wav_to_pcm(wav_data):
+    """
+    解析wav数据，不复制PCM数据
+    :return: (pcm的memoryview, 采样率, 声道数, 采样字节数)
+    """
+    view = memoryview(wav_data)
+    if bytes(view[:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        raise ValueError("not a wav data")
+    rate = channels = sample_width = None
+    pos = 12
+    while pos + 8 <= len(view):
+        chunk_id = bytes(view[pos:pos + 4])
+        chunk_size = struct.unpack_from("<I", view, pos + 4)[0]
+        if chunk_id == b"fmt ":
+            channels, rate = struct.unpack_from("<HI", view, pos + 10)
+            sample_width = struct.unpack_from("<H", view, pos + 22)[0] // 8
+        elif chunk_id == b"data":
+            # 管道输出的wav长度字段可能未回写，以实际数据为准
+            end = len(view) if chunk_size in (0, 0xFFFFFFFF) else min(len(view), pos + 8 + chunk_size)
+            return view[pos + 8:end], rate, channels, sample_width
+        pos += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError("wav data chunk not found")
+
+
+def resample_pcm(pcm, from_rate, to_rate, channels=1):
+    """16bit PCM重采样"""
+    if from_rate == to_rate:
+        return pcm
+    if audioop is not None:
+        return audioop.ratecv(pcm, 2, channels, from_rate, to_rate, None)[0]
+    return get_transcoder().transcode(
+        bytes(pcm), "s16le", input_format="s16le", input_sample_rate=from_rate, input_channels=channels, sample_rate=to_rate
+    )
+
+
+def audio_to_pcm(source, rate=None, channels=1):
+    """
+    任意格式(文件路径或bytes)解码为PCM，rate为None时保持原采样率
+    :return: (pcm的memoryview, 采样率)
+    """
+    wav_data = get_transcoder().transcode(source, "wav", codec="pcm_s16le", sample_rate=rate, channels=channels)
+    pcm, pcm_rate, _, _ = wav_to_pcm(wav_data)
+    return pcm, pcm_rate
+
+
+def silk_to_pcm(silk_data, rate=24000):
+    """silk(包括微信格式)解码为单声道PCM"""
+    if pysilk is None:
+        return _silk_to_pcm_by_file(silk_data, rate)
+    output = io.BytesIO()
+    pysilk.decode(io.BytesIO(silk_data), output, rate)
+    return output.getvalue()
+
+
+def pcm_to_silk(pcm, rate, tencent=False):
+    """
+    单声道PCM编码为silk
+    :param tencent: 是否使用微信的格式(文件头前多一个字节0x02)
+    """
+    if pysilk is None:
+        return _pcm_to_silk_by_file(pcm, rate, tencent)
+    output = io.BytesIO()
+    pysilk.encode(io.BytesIO(pcm), output, rate, rate, tencent=tencent)
+    return output.getvalue()
+
+
+# 未安装silk-python时退回pilk，pilk只支持文件路径，需要通过临时目录中转
+def _silk_to_pcm_by_file(silk_data, rate):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        silk_path = os.path.join(tmp_dir, "voice.silk")
+        pcm_path = os.path.join(tmp_dir, "voice.pcm")
+        _write_file(silk_path, silk_data)
+        pilk.decode(silk_path, pcm_path, pcm_rate=rate)
+        return _read_file(pcm_path)
+
+
+def _pcm_to_silk_by_file(pcm, rate, tencent):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pcm_path = os.path.join(tmp_dir, "voice.pcm")
+        silk_path = os.path.join(tmp_dir, "voice.silk")
+        _write_file(pcm_path, pcm)
+        pilk.encode(pcm_path, silk_path, pcm_rate=rate, tencent=tencent)
+        return _read_file(silk_path)
+
+
+def silk_bytes_to_wav(silk_data, rate=24000):
+    return pcm_to_wav(silk_to_pcm(silk_data, rate), rate)
+
+
+def silk_bytes_to_mp3(silk_data, rate=24000):
+    pcm = silk_to_pcm(silk_data, rate)
+    return get_transcoder().transcode(pcm, "mp3", input_format="s16le", input_sample_rate=rate, input_channels=1)
+
+
+def audio_bytes_to_silk(source, rate=None, tencent=False):
+    """
+    任意格式(文件路径或bytes)转为silk，rate为None时使用最接近原采样率的silk支持的采样率
+    :return: (silk数据, 时长毫秒)
+    """
+    pcm, pcm_rate = audio_to_pcm(source, rate=rate)
+    target_rate = find_closest_sil_supports(pcm_rate)
+    pcm = resample_pcm(pcm, pcm_rate, target_rate)
+    return pcm_to_silk(pcm, target_rate, tencent=tencent), len(pcm) // 2 * 1000 / target_rate
+
+
 def any_to_mp3(any_path, mp3_path):
     """
     把任意格式转成mp3文件
@@ -63,28 +235,13 @@ def any_to_mp3(any_path, mp3_path):
             shutil.copy2(any_path, mp3_path)
             return
         
-        # 如果是silk格式，使用pilk转换
+        # 如果是silk格式，解码为PCM后通过管道交给ffmpeg编码为MP3
         if any_path.endswith((".sil", ".silk", ".slk")):
-            # 先转成PCM
-            pcm_path = any_path + '.pcm'
-            pilk.decode(any_path, pcm_path)
-            
-            # 再用pydub把PCM转成MP3
-            # TODO: 下面的参数可能需要调整
-            audio = AudioSegment.from_raw(pcm_path, format="raw", 
-                                        frame_rate=24000,
-                                        channels=1,
-                                        sample_width=2)  # 16-bit PCM = 2 bytes
-            audio.export(mp3_path, format="mp3")
-            
-            # 清理临时PCM文件
-            import os
-            os.remove(pcm_path)
+            _write_file(mp3_path, silk_bytes_to_mp3(_read_file(any_path)))
             return
         
-        # 其他格式使用pydub转换
-        audio = AudioSegment.from_file(any_path)
-        audio.export(mp3_path, format="mp3")
+        # 其他格式使用ffmpeg转换
+        _write_file(mp3_path, get_transcoder().transcode(any_path, "mp3"))
 
     except Exception as e:
         logger.error(f"转换文件到mp3失败: {str(e)}")
@@ -100,10 +257,8 @@ def any_to_wav(any_path, wav_path):
         return
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         return sil_to_wav(any_path, wav_path)
-    audio = AudioSegment.from_file(any_path)
-    audio.set_frame_rate(8000)    # 百度语音转写支持8000采样率, pcm_s16le, 单通道语音识别
-    audio.set_channels(1)
-    audio.export(wav_path, format="wav", codec='pcm_s16le')
+    wav_data = get_transcoder().transcode(any_path, "wav", codec="pcm_s16le")
+    _write_file(wav_path, fix_wav_header(wav_data))
 
 
 def any_to_sil(any_path, sil_path):
@@ -113,16 +268,9 @@ def any_to_sil(any_path, sil_path):
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         shutil.copy2(any_path, sil_path)
         return 10000
-    audio = AudioSegment.from_file(any_path)
-    rate = find_closest_sil_supports(audio.frame_rate)
-    # Convert to PCM_s16
-    pcm_s16 = audio.set_sample_width(2)
-    pcm_s16 = pcm_s16.set_frame_rate(rate)
-    wav_data = pcm_s16.raw_data
-    silk_data = pysilk.encode(wav_data, data_rate=rate, sample_rate=rate)
-    with open(sil_path, "wb") as f:
-        f.write(silk_data)
-    return audio.duration_seconds * 1000
+    silk_data, duration = audio_bytes_to_silk(any_path)
+    _write_file(sil_path, silk_data)
+    return duration
 
 def mp3_to_silk(mp3_path: str, silk_path: str) -> int:
     """Convert MP3 file to SILK format
@@ -132,27 +280,11 @@ def mp3_to_silk(mp3_path: str, silk_path: str) -> int:
     Returns:
         Duration of the SILK file in milliseconds
     """
-    # First load the MP3 file
-    audio = AudioSegment.from_file(mp3_path)
-    
-    # Convert to mono and set sample rate to 24000Hz
+    # Decode to 24000Hz mono PCM and encode to SILK in memory
     # TODO: 下面的参数可能需要调整
-    audio = audio.set_channels(1)
-    audio = audio.set_frame_rate(24000)
-    
-    # Export to PCM
-    pcm_path = os.path.splitext(mp3_path)[0] + '.pcm'
-    audio.export(pcm_path, format='s16le')
-    
-    # Convert PCM to SILK
-    pilk.encode(pcm_path, silk_path, pcm_rate=24000, tencent=True)
-    
-    # Clean up temporary PCM file
-    os.remove(pcm_path)
-    
-    # Get duration of the SILK file
-    duration = pilk.get_duration(silk_path)
-    return duration
+    silk_data, duration = audio_bytes_to_silk(mp3_path, rate=24000, tencent=True)
+    _write_file(silk_path, silk_data)
+    return int(duration)
 
 def any_to_amr(any_path, amr_path):
     """
@@ -163,39 +295,38 @@ def any_to_amr(any_path, amr_path):
         return
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         raise NotImplementedError("Not support file type: {}".format(any_path))
-    audio = AudioSegment.from_file(any_path)
-    audio = audio.set_frame_rate(8000)  # only support 8000
-    audio.export(amr_path, format="amr")
-    return audio.duration_seconds * 1000
+    amr_data = get_transcoder().transcode(any_path, "amr", sample_rate=8000, channels=1)  # only support 8000
+    _write_file(amr_path, amr_data)
+    return amr_duration_ms(amr_data)
 
-# TODO: 删除pysilk，改用pilk
 def sil_to_wav(silk_path, wav_path, rate: int = 24000):
     """
     silk 文件转 wav
     """
-    wav_data = pysilk.decode_file(silk_path, to_wav=True, sample_rate=rate)
-    with open(wav_path, "wb") as f:
-        f.write(wav_data)
+    _write_file(wav_path, silk_bytes_to_wav(_read_file(silk_path), rate))
 
 
 def split_audio(file_path, max_segment_length_ms=60000):
     """
     分割音频文件
     """
-    audio = AudioSegment.from_file(file_path)
-    audio_length_ms = len(audio)
+    transcoder = get_transcoder()
+    audio_length_ms = transcoder.duration_ms(file_path)
+    if audio_length_ms is None:  # 读取不到时长时解码后计算
+        audio_length_ms = wav_duration_ms(fix_wav_header(transcoder.transcode(file_path, "wav", codec="pcm_s16le")))
     if audio_length_ms <= max_segment_length_ms:
         return audio_length_ms, [file_path]
-    segments = []
-    for start_ms in range(0, audio_length_ms, max_segment_length_ms):
-        end_ms = min(audio_length_ms, start_ms + max_segment_length_ms)
-        segment = audio[start_ms:end_ms]
-        segments.append(segment)
     file_prefix = file_path[: file_path.rindex(".")]
     format = file_path[file_path.rindex(".") + 1 :]
+    # 各段同时提交到转码线程池
+    futures = []
+    for start_ms in range(0, audio_length_ms, max_segment_length_ms):
+        duration_ms = min(audio_length_ms, start_ms + max_segment_length_ms) - start_ms
+        futures.append(transcoder.submit(file_path, format, start_ms=start_ms, duration_ms=duration_ms))
     files = []
-    for i, segment in enumerate(segments):
+    for i, future in enumerate(futures):
         path = f"{file_prefix}_{i+1}" + f".{format}"
-        segment.export(path, format=format)
+        data = future.result()
+        _write_file(path, fix_wav_header(data) if format == "wav" else data)
         files.append(path)
     return audio_length_ms, files
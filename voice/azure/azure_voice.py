@@ -56,6 +56,9 @@ class AzureVoice(Voice):
         except Exception as e:
             logger.warn("AzureVoice init failed: %s, ignore " % e)
 
+    def cache_params(self):
+        return {k: v for k, v in self.config.items() if k.startswith("speech_synthesis") or k == "auto_detect"}
+
     def voiceToText(self, voice_file):
         audio_config = speechsdk.AudioConfig(filename=voice_file)
         speech_recognizer = speechsdk.SpeechRecognizer(speech_config=self.speech_config, audio_config=audio_config)
@@ -8,6 +8,7 @@ import time
 from aip import AipSpeech
 
 from bridge.reply import Reply, ReplyType
+from common.credential_cache import credential_key, get_credential_cache
 from common.log import logger
 from common.tmp_dir import TmpDir
 from config import conf
@@ -29,6 +30,26 @@ from voice.voice import Voice
     """
 
 
+class CachedAipSpeech(AipSpeech):
+    """access token保存在共享的凭证缓存中，多个实例和重启后都不用重新获取"""
+
+    def _auth(self, refresh=False):
+        key = credential_key("baidu_aip", self._appId, self._apiKey, self._secretKey)
+        cache = get_credential_cache()
+        if refresh:  # 接口返回token失效
+            cache.invalidate(key, self._authObj.get("access_token"))
+        obj = cache.get(key, self._fetch_auth)
+        self._isCloudUser = not self._isPermission(obj)
+        self._authObj = obj
+        return obj
+
+    def _fetch_auth(self):
+        obj = super()._auth(refresh=True)
+        if not obj.get("access_token"):  # 获取失败时不缓存，由sdk按原逻辑处理
+            return obj, 0
+        return obj, int(obj.get("expires_in", 2592000))
+
+
 class BaiduVoice(Voice):
     def __init__(self):
         try:
@@ -54,10 +75,13 @@ class BaiduVoice(Voice):
             self.vol = bconf["vol"]
             self.per = bconf["per"]
 
-            self.client = AipSpeech(self.app_id, self.api_key, self.secret_key)
+            self.client = CachedAipSpeech(self.app_id, self.api_key, self.secret_key)
         except Exception as e:
             logger.warn("BaiduVoice init failed: %s, ignore " % e)
 
+    def cache_params(self):
+        return {"lang": self.lang, "ctp": self.ctp, "spd": self.spd, "pit": self.pit, "vol": self.vol, "per": self.per}
+
     def voiceToText(self, voice_file):
         # 识别本地文件
         logger.debug("[Baidu] voice file name={}".format(voice_file))
@@ -1,12 +1,11 @@
 import time
 
 import edge_tts
-import asyncio
 
 from bridge.reply import Reply, ReplyType
 from common.log import logger
 from common.tmp_dir import TmpDir
-from voice.voice import Voice
+from voice.voice import Voice, submit
 
 
 class EdgeVoice(Voice):
@@ -37,6 +36,9 @@ class EdgeVoice(Voice):
     def voiceToText(self, voice_file):
         pass
 
+    def cache_params(self):
+        return {"voice": self.voice}
+
     async def gen_voice(self, text, fileName):
         communicate = edge_tts.Communicate(text, self.voice)
         await communicate.save(fileName)
@@ -44,7 +46,11 @@ class EdgeVoice(Voice):
     def textToVoice(self, text):
         fileName = TmpDir().path() + "reply-" + str(int(time.time())) + "-" + str(hash(text) & 0x7FFFFFFF) + ".mp3"
 
-        asyncio.run(self.gen_voice(text, fileName))
+        try:
+            submit(self.gen_voice(text, fileName), timeout=60)
+        except Exception as e:
+            logger.error("[EdgeTTS] textToVoice error={!r}".format(e))
+            return Reply(ReplyType.ERROR, "抱歉，语音合成失败")
 
         logger.info("[EdgeTTS] textToVoice text={} voice file name={}".format(text, fileName))
         return Reply(ReplyType.VOICE, fileName)
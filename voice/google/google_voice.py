@@ -15,6 +15,7 @@ from voice.voice import Voice
 
 class GoogleVoice(Voice):
     recognizer = speech_recognition.Recognizer()
+    lang = "zh"
 
     def __init__(self):
         pass
@@ -33,11 +34,14 @@ class GoogleVoice(Voice):
         finally:
             return reply
 
+    def cache_params(self):
+        return {"lang": self.lang}
+
     def textToVoice(self, text):
         try:
             # Avoid the same filename under multithreading
             mp3File = TmpDir().path() + "reply-" + str(int(time.time())) + "-" + str(hash(text) & 0x7FFFFFFF) + ".mp3"
-            tts = gTTS(text=text, lang="zh")
+            tts = gTTS(text=text, lang=self.lang)
             tts.save(mp3File)
             logger.info("[Google] textToVoice text={} voice file name={}".format(text, mp3File))
             reply = Reply(ReplyType.VOICE, mp3File)
@@ -32,6 +32,9 @@ class PyttsVoice(Voice):
             # TODO: check if this is work on win32
             self.engine.startLoop(useDriverLoop=False)
 
+    def cache_params(self):
+        return {k: self.engine.getProperty(k) for k in ("rate", "volume", "voice")}
+
     def textToVoice(self, text):
         try:
             # Avoid the same filename under multithreading
@@ -40,6 +40,9 @@ class TencentVoice(Voice):
         """
         pass
         
+    def cache_params(self):
+        return {"voice": self.voice_type}
+
     def voiceToText(self, voice_file):
         """
         将语音文件转换为文本
@@ -0,0 +1,217 @@
+"""
+音频转码服务
+
+所有转码都通过ffmpeg的标准输入输出管道完成，不写临时文件；同时运行的ffmpeg进程数由线程池大小限制。
+转码结果按(输入内容sha1, 输出参数)缓存在内存中，超过transcode_cache_mb时淘汰最久未使用的结果，
+相同参数的并发转码只会执行一次。
+
+    from voice.transcoder import get_transcoder
+    amr_data = get_transcoder().transcode("reply.mp3", "amr", sample_rate=8000, channels=1)
+    future = get_transcoder().submit(voice_bytes, "wav")           # 异步提交，future.result()获取
+    wav_data = await get_transcoder().atranscode(voice_bytes, "wav")  # asyncio中等待
+"""
+import asyncio
+import hashlib
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from common.handler_pool import HandlerPool
+from common.log import logger
+from config import conf
+
+READ_CHUNK_SIZE = 64 * 1024
+# mp4类封装默认在写完后回到文件头写入moov，标准输出不能seek，改为输出moov在前的分片MP4
+FRAGMENTED_FORMATS = {"mp4": "mp4", "mov": "mov", "m4a": "ipod", "ipod": "ipod"}
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def ffmpeg_command(source, fmt, sample_rate=None, channels=None, codec=None, bitrate=None, input_format=None,
+                   input_sample_rate=None, input_channels=None, start_ms=None, duration_ms=None):
+    """
+    构造ffmpeg命令，source为文件路径时直接读取文件，为bytes时从标准输入读取，结果输出到标准输出
+    输入为裸PCM(input_format="s16le")时需指定input_sample_rate和input_channels
+    """
+    cmd = ["ffmpeg", "-v", "error"]
+    if isinstance(source, str):
+        cmd.append("-nostdin")
+    if input_format:
+        cmd += ["-f", input_format]
+    if input_sample_rate:
+        cmd += ["-ar", str(input_sample_rate)]
+    if input_channels:
+        cmd += ["-ac", str(input_channels)]
+    if start_ms is not None:
+        cmd += ["-ss", "{:.3f}".format(start_ms / 1000)]
+    if duration_ms is not None:
+        cmd += ["-t", "{:.3f}".format(duration_ms / 1000)]
+    cmd += ["-i", source if isinstance(source, str) else "pipe:0", "-vn"]
+    if sample_rate:
+        cmd += ["-ar", str(sample_rate)]
+    if channels:
+        cmd += ["-ac", str(channels)]
+    if codec:
+        cmd += ["-acodec", codec]
+    if bitrate:
+        cmd += ["-b:a", str(bitrate)]
+    if fmt in FRAGMENTED_FORMATS:
+        fmt = FRAGMENTED_FORMATS[fmt]
+        cmd += ["-movflags", "frag_keyframe+empty_moov"]
+    cmd += ["-f", fmt, "pipe:1"]
+    return cmd
+
+
+def run_ffmpeg(source, fmt, **options):
+    """执行一次ffmpeg转码并返回输出的bytes"""
+    cmd = ffmpeg_command(source, fmt, **options)
+    proc = subprocess.run(
+        cmd,
+        input=None if isinstance(source, str) else bytes(source),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    if proc.returncode != 0 or not proc.stdout:
+        raise TranscodeError("ffmpeg failed({}): {}".format(proc.returncode, proc.stderr.decode("utf-8", "ignore")[-500:]))
+    return proc.stdout
+
+
+def probe_duration_ms(source):
+    """用ffprobe读取时长(毫秒)，不需要解码整个文件；读取不到(如没有时长信息的裸流)时返回None"""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1",
+           source if isinstance(source, str) else "pipe:0"]
+    try:
+        proc = subprocess.run(
+            cmd,
+            input=None if isinstance(source, str) else bytes(source),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+        return int(float(proc.stdout.strip()) * 1000)
+    except (OSError, ValueError):
+        return None
+
+
+def content_digest(source):
+    """文件路径或bytes的sha1"""
+    sha1 = hashlib.sha1()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                sha1.update(chunk)
+    else:
+        sha1.update(source)
+    return sha1.hexdigest()
+
+
+class Transcoder(object):
+    def __init__(self, max_workers=2, cache_bytes=64 * 1024 * 1024, runner=run_ffmpeg, prober=probe_duration_ms):
+        self.pool = HandlerPool("transcode", max_workers=max_workers)
+        self.cache_bytes = cache_bytes
+        self.runner = runner
+        self.prober = prober
+        self._cache = OrderedDict()  # key -> bytes
+        self._cache_size = 0
+        self._pending = {}  # key -> Future，正在转码的任务
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(digest, fmt, options):
+        return (digest, fmt) + tuple(sorted((k, v) for k, v in options.items() if v is not None))
+
+    def _cache_get(self, key):
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return data
+
+    def _cache_put(self, key, data):
+        if len(data) > self.cache_bytes // 4:  # 太大的结果不缓存，避免挤掉其他结果
+            return
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = data
+            self._cache_size += len(data)
+            while self._cache_size > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_size -= len(evicted)
+
+    def submit(self, source, fmt, **options) -> Future:
+        """
+        提交转码任务
+        :param source: 输入文件路径或bytes
+        :param fmt: 输出格式，即ffmpeg的-f参数，如wav、mp3、amr、s16le
+        :param options: sample_rate、channels、codec、bitrate、input_format、input_sample_rate、input_channels、start_ms、duration_ms
+        :return: Future，结果为转码后的bytes
+        """
+        key = self._key(content_digest(source), fmt, options)
+        data = self._cache_get(key)
+        if data is not None:
+            future = Future()
+            future.set_result(data)
+            return future
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:  # 相同的转码正在进行，共用结果
+                return future
+            self.misses += 1
+            future = self.pool.submit(self._run, key, source, fmt, options)
+            self._pending[key] = future
+        return future
+
+    def _run(self, key, source, fmt, options):
+        try:
+            data = self.runner(source, fmt, **options)
+            self._cache_put(key, data)
+            return data
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def transcode(self, source, fmt, timeout=None, **options) -> bytes:
+        """同步转码，在转码线程池中执行并等待结果"""
+        return self.submit(source, fmt, **options).result(timeout)
+
+    async def atranscode(self, source, fmt, **options) -> bytes:
+        return await asyncio.wrap_future(self.submit(source, fmt, **options))
+
+    def duration_ms(self, source, timeout=None):
+        """读取时长(毫秒)，读取不到时返回None；在转码线程池中执行，同样受进程数限制"""
+        return self.pool.submit(self.prober, source).result(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "cache_bytes": self._cache_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "pool": self.pool.stats(),
+            }
+
+
+_transcoder = None
+_transcoder_lock = threading.Lock()
+
+
+def get_transcoder() -> Transcoder:
+    global _transcoder
+    if _transcoder is None:
+        with _transcoder_lock:
+            if _transcoder is None:
+                _transcoder = Transcoder(
+                    max_workers=conf().get("transcode_workers", 2),
+                    cache_bytes=conf().get("transcode_cache_mb", 64) * 1024 * 1024,
+                )
+                logger.debug("[transcoder] init, workers={}".format(_transcoder.pool._max_workers))
+    return _transcoder
@@ -0,0 +1,139 @@
+"""
+语音合成结果的磁盘缓存
+
+按(语音引擎, 引擎的音色/模型等参数, 规范化后的文本)计算sha256作为key，相同的回复(问候语、出错提示等)只合成一次。
+缓存文件保存在<appdata_dir>/tts_cache/，总大小超过tts_cache_mb时删除最久未使用的文件。
+通道发送后会删除回复中的语音文件，所以命中时返回缓存文件在tmp目录下的硬链接(不支持时复制)，不会删除缓存本身。
+
+    cache = get_tts_cache()  # tts_cache_mb为0时返回None
+    reply = cache.text_to_voice("openai", voice_bot, text)
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import unicodedata
+import uuid
+
+from bridge.reply import Reply, ReplyType
+from common.log import logger
+from common.tmp_dir import TmpDir
+from config import conf, get_appdata_dir
+
+
+def normalize_text(text):
+    """全角半角统一(NFKC)，去掉首尾空白，连续空白合并为一个空格"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class TTSCache(object):
+    def __init__(self, dir_path, max_bytes):
+        self.dir_path = dir_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(dir_path, exist_ok=True)
+        self._files = {}  # key -> 缓存文件名
+        for name in os.listdir(dir_path):
+            if not name.endswith(".tmp"):
+                self._files[os.path.splitext(name)[0]] = name
+
+    @staticmethod
+    def key(engine, params, text):
+        raw = json.dumps([engine, params, normalize_text(text)], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """命中时返回tmp目录下可以随意删除的文件路径，否则返回None"""
+        with self._lock:
+            name = self._files.get(key)
+        if name is None:
+            return None
+        cached_path = os.path.join(self.dir_path, name)
+        path = TmpDir().path() + "tts-{}-{}{}".format(key[:12], uuid.uuid4().hex[:8], os.path.splitext(name)[1])
+        try:
+            try:
+                os.link(cached_path, path)
+            except OSError:  # 不在同一个文件系统或不支持硬链接
+                shutil.copyfile(cached_path, path)
+            os.utime(cached_path)  # 更新访问时间，淘汰时按最久未使用
+        except OSError as e:
+            logger.warning("[tts_cache] read {} failed: {}".format(cached_path, e))
+            with self._lock:
+                self._files.pop(key, None)
+            return None
+        return path
+
+    def put(self, key, file_path):
+        """复制合成好的语音文件到缓存，原文件仍由调用者发送和删除"""
+        name = key + os.path.splitext(file_path)[1]
+        cached_path = os.path.join(self.dir_path, name)
+        tmp_path = "{}.{}.tmp".format(cached_path, threading.get_ident())
+        try:
+            shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, cached_path)
+        except OSError as e:
+            logger.warning("[tts_cache] save {} failed: {}".format(file_path, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self._files[key] = name
+        self._prune()
+
+    def text_to_voice(self, engine, voice_bot, text) -> Reply:
+        key = self.key(engine, voice_bot.cache_params(), text)
+        path = self.get(key)
+        if path:
+            logger.debug("[tts_cache] hit, engine={}, text={}".format(engine, text))
+            return Reply(ReplyType.VOICE, path)
+        reply = voice_bot.textToVoice(text)
+        if reply and reply.type == ReplyType.VOICE and os.path.isfile(reply.content):
+            self.put(key, reply.content)
+        return reply
+
+    def _prune(self):
+        """缓存总大小超过max_bytes时删除最久未使用的文件"""
+        with self._lock:
+            try:
+                entries = []
+                for key, name in list(self._files.items()):
+                    try:
+                        stat = os.stat(os.path.join(self.dir_path, name))
+                    except FileNotFoundError:  # 被手动删除
+                        del self._files[key]
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, key))
+                total = sum(e[1] for e in entries)
+                for _, size, key in sorted(entries):
+                    if total <= self.max_bytes:
+                        break
+                    os.remove(os.path.join(self.dir_path, self._files.pop(key)))
+                    total -= size
+            except OSError as e:
+                logger.warning("[tts_cache] prune failed: {}".format(e))
+
+
+def warm_up(fetch_text_to_voice, phrases):
+    """预先合成常用的回复放入缓存，返回的临时文件不需要发送，直接删除"""
+    for text in phrases:
+        try:
+            reply = fetch_text_to_voice(text)
+            if reply and reply.type == ReplyType.VOICE and os.path.isfile(reply.content):
+                os.remove(reply.content)
+        except Exception as e:
+            logger.warning("[tts_cache] warm up '{}' failed: {}".format(text, e))
+    logger.info("[tts_cache] warmed up {} phrases".format(len(phrases)))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    global _cache
+    if _cache is None and conf().get("tts_cache_mb", 100) > 0:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTSCache(os.path.join(get_appdata_dir(), "tts_cache"), conf().get("tts_cache_mb", 100) * 1024 * 1024)
+    return _cache
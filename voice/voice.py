@@ -1,6 +1,12 @@
 """
 Voice service abstract class
 """
+import asyncio
+
+from common import async_loop
+from config import conf
+
+_semaphore = None
 
 
 class Voice(object):
@@ -15,3 +21,25 @@ class Voice(object):
         Send text to voice service and get voice
         """
         raise NotImplementedError
+
+    def cache_params(self):
+        """
+        影响合成结果的音色、模型等参数，和引擎、文本一起作为语音缓存的key
+        """
+        return {"voice": conf().get("tts_voice_id"), "model": conf().get("text_to_voice_model")}
+
+
+async def _bounded(coro):
+    global _semaphore
+    if _semaphore is None:  # 只在后台事件循环线程中创建
+        _semaphore = asyncio.Semaphore(conf().get("voice_async_concurrency", 4))
+    async with _semaphore:
+        return await coro
+
+
+def submit(coro, timeout=None):
+    """
+    异步语音引擎(如edge-tts)在共享的后台事件循环中执行协程，阻塞等待结果，超时时取消并抛出TimeoutError。
+    同时执行的语音合成/识别协程不超过voice_async_concurrency个，超出的在事件循环中排队
+    """
+    return async_loop.submit(_bounded(coro), timeout)
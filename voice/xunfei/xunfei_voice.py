@@ -73,6 +73,10 @@ class XunfeiVoice(Voice):
             reply = Reply(ReplyType.ERROR, "讯飞语音识别出错了；{0}")
         return reply
 
+    def cache_params(self):
+        # 发音人(vcn)、语速、音频格式等都在BusinessArgsTTS中
+        return {"tts": getattr(self, "BusinessArgsTTS", None)}
+
     def textToVoice(self, text):
         try:
             # Avoid the same filename under multithreading
@@ -2,7 +2,7 @@ import os
 from multiprocessing import Process
 import signal
 import time
-import requests
+from common import http_client
 from logging import getLogger
 
 import gradio as gr
@@ -68,7 +68,7 @@ def get_xbot_profile():
             try:
                 avatar_path = 'tmp/avatar.png'
                 os.makedirs('tmp', exist_ok=True)
-                response = requests.get(avatar_url)
+                response = http_client.get(avatar_url)
                 if response.status_code == 200:
                     with open(avatar_path, 'wb') as f:
                         f.write(response.content)